@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Benchmark for crawling a ZNC directory into the log database.
+
+Makes up a ZNC directory of empty log files spread over a few users and
+many channels, then crawls it into a new SQLite database the same way
+``manage.py crawl`` does. It prints how fast the log files were scanned and
+their ``irclogs`` rows written, how long it took to read the logs into the
+search index and stats tables, and how long a crawl takes when nothing has
+changed. Run it from the top of the repository::
+
+    python benchmarks/crawl_znc_tree.py --files 500000
+
+The ZNC directory and the database are made in a temporary directory unless
+``--directory`` is given, in which case a ZNC directory that is already
+there is reused.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+from irclogviewer import create_app, crawler, db  # noqa: E402
+from irclogviewer.models import (  # noqa: E402
+    create_missing_indexes,
+    create_search_index,
+)
+from irclogviewer.znc import ZncDirectory  # noqa: E402
+
+
+CONFIG = """
+SECRET_KEY = 'benchmark'
+SQLALCHEMY_DATABASE_URI = {database_uri!r}
+ZNC_DIRECTORY = {znc_directory!r}
+ZNC_ACL = [('allow', '*', '*', '*')]
+"""
+
+
+def make_znc_directory(znc_directory, file_count, user_count,
+                       channel_count):
+    """Make up a ZNC directory of empty log files. Each user has logs for
+    the same channels on consecutive days.
+
+    :param str znc_directory: where to make the ZNC directory
+    :param int file_count: how many log files to make in all
+    :param int user_count: how many ZNC users to spread them over
+    :param int channel_count: how many channels each user has logs for
+    """
+    first_date = datetime.date(2000, 1, 1)
+    for user_number in range(user_count):
+        log_directory = os.path.join(znc_directory, 'users',
+                                     'user{0}'.format(user_number),
+                                     'moddata', 'log')
+        os.makedirs(log_directory)
+        for file_number in range(user_number, file_count, user_count):
+            log_number = file_number // user_count
+            date = first_date + datetime.timedelta(
+                days=log_number // channel_count)
+            log_name = '#channel{0}_{1:%Y%m%d}.log'.format(
+                log_number % channel_count, date)
+            open(os.path.join(log_directory, log_name), 'w').close()
+
+
+def crawl_and_time(znc_directory):
+    """Crawl every user of a ZNC directory, timing the scans of their log
+    directories, the writes of their ``irclogs`` rows, and the refreshes of
+    the tables derived from their logs separately.
+
+    :param znc_directory: the ZNC directory to crawl
+    :type znc_directory: :class:`~irclogviewer.znc.ZncDirectory`
+    :return: how many log files there were, and the seconds spent scanning,
+        writing, and refreshing
+    :rtype: tuple of (int, float, float, float)
+    """
+    refresh_seconds = [0.0]
+    refresh_derived_tables = crawler.refresh_derived_tables
+
+    def timed_refresh_derived_tables(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return refresh_derived_tables(*args, **kwargs)
+        finally:
+            refresh_seconds[0] += time.perf_counter() - start
+
+    file_count = 0
+    scan_seconds = 0.0
+    sync_seconds = 0.0
+    crawler.refresh_derived_tables = timed_refresh_derived_tables
+    try:
+        for user_directory in znc_directory.users.values():
+            user, log_files, seconds = crawler.scan_user_logs(
+                user_directory.user_path)
+            scan_seconds += seconds
+            file_count += len(log_files)
+            start = time.perf_counter()
+            crawler.sync_user_logs(user, log_files)
+            sync_seconds += time.perf_counter() - start
+    finally:
+        crawler.refresh_derived_tables = refresh_derived_tables
+    return (file_count, scan_seconds, sync_seconds - refresh_seconds[0],
+            refresh_seconds[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark crawling a synthetic ZNC directory.')
+    parser.add_argument('--files', type=int, default=500000,
+                        help='how many log files to make')
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--channels', type=int, default=200,
+                        help='how many channels each user has logs for')
+    parser.add_argument('--directory',
+                        help='where to keep the ZNC directory and the '
+                             'database, instead of a temporary directory')
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp()
+    try:
+        znc_directory = os.path.join(directory, 'znc')
+        if not os.path.isdir(znc_directory):
+            start = time.perf_counter()
+            make_znc_directory(znc_directory, args.files, args.users,
+                               args.channels)
+            print('made {0} log files in {1:.1f}s'.format(
+                args.files, time.perf_counter() - start))
+
+        database_path = os.path.join(directory, 'irc_logs.db')
+        if os.path.exists(database_path):
+            os.remove(database_path)
+        config_path = os.path.join(directory, 'config.py')
+        with open(config_path, 'w') as f:
+            f.write(CONFIG.format(database_uri='sqlite:///' + database_path,
+                                  znc_directory=znc_directory))
+        os.environ['FLASK_SETTINGS'] = config_path
+        app = create_app()
+
+        with app.app_context():
+            event.listen(db.engine, 'connect', crawler.set_bulk_load_pragmas)
+            db.create_all()
+            create_missing_indexes(db.engine)
+            create_search_index(db.engine)
+
+            file_count, scan_seconds, write_seconds, refresh_seconds = \
+                crawl_and_time(ZncDirectory(znc_directory))
+            print('first crawl: scanned {0} files in {1:.2f}s '
+                  '({2:,.0f} files/s), wrote their irclogs rows in {3:.2f}s '
+                  '({4:,.0f} rows/s), read them into the derived tables in '
+                  '{5:.2f}s'.format(
+                      file_count, scan_seconds, file_count / scan_seconds,
+                      write_seconds, file_count / write_seconds,
+                      refresh_seconds))
+
+            _, scan_seconds, write_seconds, _ = crawl_and_time(
+                ZncDirectory(znc_directory))
+            print('crawl with no changes: scanned in {0:.2f}s, compared '
+                  'with the database in {1:.2f}s'.format(
+                      scan_seconds, write_seconds))
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
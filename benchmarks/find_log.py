@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Benchmark for looking up a log and the dates of its neighbors with
+:func:`~irclogviewer.logs.find_log`, which ``get_log`` serves every log page
+with.
+
+Fills ``irclogs`` in a new SQLite database with millions of rows, then times
+looking up random logs with the single query of ``find_log``, against the
+three queries ``get_log`` used to make: the log, the latest earlier log, and
+the earliest later log. Besides the time per lookup, it prints how many
+statements each lookup executes and how much of its time they spend in the
+database. Run it from the top of the repository::
+
+    python benchmarks/find_log.py --users 10 --channels 200 --days 1000
+
+The database is made in a temporary directory unless ``--directory`` is
+given, in which case a database that is already there is reused.
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+from irclogviewer import create_app, db  # noqa: E402
+from irclogviewer.logs import find_log  # noqa: E402
+from irclogviewer.models import IrcLog  # noqa: E402
+
+
+CONFIG = """
+SECRET_KEY = 'benchmark'
+SQLALCHEMY_DATABASE_URI = {database_uri!r}
+ZNC_ACL = [('allow', '*', '*', '*')]
+"""
+
+FIRST_DATE = datetime.date(2000, 1, 1)
+
+# How many rows are inserted with each executemany
+BATCH_SIZE = 10000
+
+
+def fill_irclogs(user_count, channel_count, day_count):
+    """Add a log for every day to every channel of every user.
+
+    :param int user_count: how many ZNC users there are
+    :param int channel_count: how many channels each user has logs for
+    :param int day_count: how many days each channel has logs for
+    """
+    table = IrcLog.__table__
+    last_modified = datetime.datetime(2000, 1, 1)
+    rows = []
+    for user_number in range(user_count):
+        user = 'user{0}'.format(user_number)
+        for channel_number in range(channel_count):
+            channel = '#channel{0}'.format(channel_number)
+            for day in range(day_count):
+                date = FIRST_DATE + datetime.timedelta(days=day)
+                rows.append({
+                    'user': user,
+                    'channel': channel,
+                    'date': date,
+                    'path': '/znc/users/{0}/moddata/log/{1}_{2:%Y%m%d}.log'
+                            .format(user, channel, date),
+                    'last_modified': last_modified,
+                })
+                if len(rows) == BATCH_SIZE:
+                    db.session.execute(table.insert(), rows)
+                    rows = []
+    if rows:
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+def find_log_with_three_queries(user, channel, date):
+    """Look up a log and its neighbors the way ``get_log`` used to.
+
+    :return: the log and the earlier and later logs
+    :rtype: tuple
+    """
+    log = db.session.query(IrcLog)\
+                    .filter(IrcLog.user == user,
+                            IrcLog.channel == channel,
+                            IrcLog.date == date)\
+                    .first()
+    earlier_log = db.session.query(IrcLog)\
+                            .filter(IrcLog.user == user,
+                                    IrcLog.channel == channel,
+                                    IrcLog.date < date)\
+                            .order_by(IrcLog.date.desc())\
+                            .first()
+    later_log = db.session.query(IrcLog)\
+                          .filter(IrcLog.user == user,
+                                  IrcLog.channel == channel,
+                                  IrcLog.date > date)\
+                          .order_by(IrcLog.date.asc())\
+                          .first()
+    return log, earlier_log, later_log
+
+
+class StatementTimer(object):
+    """Counts the statements an engine executes and the time they take."""
+
+    def __init__(self, engine):
+        self.count = 0
+        self.seconds = 0.0
+        self._start = None
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, *args):
+        self._start = time.perf_counter()
+
+    def _after_execute(self, *args):
+        self.count += 1
+        self.seconds += time.perf_counter() - self._start
+
+    def reset(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark looking up a log and its neighbors.')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--channels', type=int, default=200,
+                        help='how many channels each user has logs for')
+    parser.add_argument('--days', type=int, default=1000,
+                        help='how many days each channel has logs for')
+    parser.add_argument('--lookups', type=int, default=5000)
+    parser.add_argument('--directory',
+                        help='where to keep the database, instead of a '
+                             'temporary directory')
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp()
+    try:
+        database_path = os.path.join(directory, 'irc_logs.db')
+        is_new = not os.path.exists(database_path)
+        config_path = os.path.join(directory, 'config.py')
+        with open(config_path, 'w') as f:
+            f.write(CONFIG.format(database_uri='sqlite:///' + database_path))
+        os.environ['FLASK_SETTINGS'] = config_path
+        app = create_app()
+
+        with app.app_context():
+            if is_new:
+                db.create_all()
+                start = time.perf_counter()
+                fill_irclogs(args.users, args.channels, args.days)
+                print('inserted {0:,} rows in {1:.1f}s'.format(
+                    args.users * args.channels * args.days,
+                    time.perf_counter() - start))
+            row_count = db.session.query(IrcLog).count()
+
+            rng = random.Random(0)
+            lookups = [('user{0}'.format(rng.randrange(args.users)),
+                        '#channel{0}'.format(rng.randrange(args.channels)),
+                        FIRST_DATE + datetime.timedelta(
+                            days=rng.randrange(args.days)))
+                       for _ in range(args.lookups)]
+
+            print('looking up {0} logs in a table of {1:,} rows'.format(
+                len(lookups), row_count))
+            timer = StatementTimer(db.engine)
+            for name, function in [('three queries',
+                                    find_log_with_three_queries),
+                                   ('find_log', find_log)]:
+                # Warm up the page cache and SQLAlchemy's caches first. The
+                # lookups then share a connection, so that opening one
+                # doesn't count.
+                for lookup in lookups[:100]:
+                    function(*lookup)
+                timer.reset()
+                start = time.perf_counter()
+                for lookup in lookups:
+                    function(*lookup)
+                seconds = time.perf_counter() - start
+                db.session.rollback()
+                print('{0}: {1:.3f} ms per lookup, {3:.3f} ms of it in the '
+                      'database, round-trips: {2}'.format(
+                          name, seconds * 1000 / len(lookups),
+                          timer.count // len(lookups),
+                          timer.seconds * 1000 / len(lookups)))
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
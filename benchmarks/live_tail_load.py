@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Load test for following today's log with server-sent events.
+
+Opens hundreds of idle ``/live`` connections to a running web app, measures
+how much memory and CPU time its gunicorn workers use while they sit idle,
+then appends a line to the log and times how long it takes to reach every
+subscriber.
+
+The web app has to run with ``LIVE_TAIL_SSE = True`` and the gevent worker
+class, and this script needs gevent too. With ``$APP`` set to the web app's
+address and ``$ZNC`` to the ZNC directory::
+
+    python benchmarks/live_tail_load.py \\
+        --url "$APP/logs/users/alice/channels/%23python/$(date +%F)/live" \\
+        --log "$ZNC/users/alice/moddata/log/#python_$(date +%Y%m%d).log" \\
+        --pid "$(cat /path/to/irclogviewer.pid)" \\
+        --subscribers 500
+"""
+import gevent.monkey
+gevent.monkey.patch_all()
+
+import argparse
+import socket
+import time
+from urllib.parse import urlsplit
+
+import gevent
+import psutil
+
+
+def follow(url, connected, received):
+    """Subscribe to a log and wait for the first event with lines.
+
+    :param str url: URL of the ``/live`` endpoint
+    :param list connected: gets a timestamp when the connection is open
+    :param list received: gets a timestamp when the first lines arrive
+    """
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    sock = socket.create_connection((parts.hostname, parts.port or 80))
+    try:
+        sock.sendall('GET {0} HTTP/1.1\r\nHost: {1}\r\n\r\n'.format(
+            path, parts.netloc).encode('ascii'))
+        response = b''
+        while b'\r\n\r\n' not in response:
+            response += sock.recv(65536)
+        connected.append(time.time())
+        while b'\ndata:' not in response:
+            data = sock.recv(65536)
+            if not data:
+                return
+            response += data
+        received.append(time.time())
+    finally:
+        sock.close()
+
+
+def worker_usage(master_pid):
+    """Get the memory and CPU time that gunicorn's workers use.
+
+    :param int master_pid: pid of the gunicorn master process
+    :return: the total resident memory in bytes and CPU time in seconds
+    :rtype: tuple of (int, float)
+    """
+    rss = 0
+    cpu_seconds = 0.0
+    for worker in psutil.Process(master_pid).children():
+        rss += worker.memory_info().rss
+        cpu_times = worker.cpu_times()
+        cpu_seconds += cpu_times.user + cpu_times.system
+    return rss, cpu_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test following a log with server-sent events.')
+    parser.add_argument('--url', required=True,
+                        help='URL of the /live endpoint of today\'s log')
+    parser.add_argument('--log', required=True,
+                        help='path to the log file, which a line is '
+                             'appended to')
+    parser.add_argument('--pid', type=int,
+                        help='pid of the gunicorn master process, to measure '
+                             'its workers')
+    parser.add_argument('--subscribers', type=int, default=500)
+    parser.add_argument('--idle-seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    connected = []
+    received = []
+    jobs = [gevent.spawn(follow, args.url, connected, received)
+            for _ in range(args.subscribers)]
+    deadline = time.time() + 30
+    while len(connected) < args.subscribers and time.time() < deadline:
+        gevent.sleep(0.1)
+    print('{0}/{1} subscribers connected'.format(len(connected),
+                                                 args.subscribers))
+
+    if args.pid:
+        rss, cpu_before = worker_usage(args.pid)
+        gevent.sleep(args.idle_seconds)
+        rss, cpu_after = worker_usage(args.pid)
+        print('idle for {0:.0f}s: workers use {1:.1f} MB, '
+              '{2:.2f}s of CPU'.format(args.idle_seconds, rss / 1e6,
+                                       cpu_after - cpu_before))
+
+    appended = time.time()
+    with open(args.log, 'a') as f:
+        f.write('[{0}] <load-test> hello, subscribers\n'.format(
+            time.strftime('%H:%M:%S')))
+    gevent.joinall(jobs, timeout=30)
+    if received:
+        print('the new line reached {0}/{1} subscribers, the last after '
+              '{2:.2f}s'.format(len(received), args.subscribers,
+                                max(received) - appended))
+    else:
+        print('the new line reached no subscribers')
+
+
+if __name__ == '__main__':
+    main()
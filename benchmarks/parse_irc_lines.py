@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Benchmark for parsing log lines, one at a time with
+:func:`~irclogviewer.logs.irc_parser.parse_irc_line` and as a whole log
+with :func:`~irclogviewer.logs.irc_parser.parse_irc_log`.
+
+Parses a synthetic log, or a real one given with ``--log``, several times
+and prints the best rate of each in lines per second. Run it from the top
+of the repository::
+
+    python benchmarks/parse_irc_lines.py
+    python benchmarks/parse_irc_lines.py --log path/to/#channel_20141104.log
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from irclogviewer.logs.irc_parser import (  # noqa: E402
+    parse_irc_line,
+    parse_irc_log,
+)
+
+
+def make_log(line_count, seed=0):
+    """Make up a log with a mix of lines like a busy channel's.
+
+    Most lines are plain messages. The rest are joins, quits, actions, and
+    messages with bold and colored text.
+
+    :param int line_count: how many lines the log has
+    :param int seed: (optional) seed for the random mix of lines
+    :return: the contents of the log
+    :rtype: str
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(line_count):
+        timestamp = '[{0:02d}:{1:02d}:{2:02d}]'.format(
+            i // 3600 % 24, i // 60 % 60, i % 60)
+        kind = rng.randrange(10)
+        if kind == 0:
+            line = '*** Joins: guest{0} (~guest@example.com)'.format(i % 50)
+        elif kind == 1:
+            line = '*** Quits: guest{0} (Quit: bye)'.format(i % 50)
+        elif kind == 2:
+            line = '* nick{0} waves at everyone'.format(i % 8)
+        elif kind == 3:
+            line = ('<nick{0}> \x02bold\x02 and \x0304,2red\x0f text'
+                    .format(i % 8))
+        else:
+            line = '<nick{0}> hello world, see http://example.com/{1}'.format(
+                i % 8, i)
+        lines.append('{0} {1}\n'.format(timestamp, line))
+    return ''.join(lines)
+
+
+def best_seconds(function, repeat):
+    """Time a function several times.
+
+    :param function: the function to call with no arguments
+    :param int repeat: how many times to call it
+    :return: the fastest call's time in seconds
+    :rtype: float
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark parsing IRC log lines and whole logs.')
+    parser.add_argument('--log',
+                        help='path to a log to parse instead of a synthetic '
+                             'one')
+    parser.add_argument('--lines', type=int, default=100000,
+                        help='how many lines the synthetic log has')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.log:
+        with open(args.log, encoding='utf-8', errors='ignore') as f:
+            text = f.read()
+    else:
+        text = make_log(args.lines)
+    raw_lines = text.split('\n')
+    if raw_lines and not raw_lines[-1]:
+        raw_lines.pop()
+
+    def parse_each_line():
+        for raw_line in raw_lines:
+            parse_irc_line(raw_line)
+
+    buffer = text.encode('utf-8')
+
+    def parse_whole_log():
+        for _ in parse_irc_log(buffer):
+            pass
+
+    for name, function in [('parse_irc_line', parse_each_line),
+                           ('parse_irc_log', parse_whole_log)]:
+        seconds = best_seconds(function, args.repeat)
+        print('{0}: {1:,.0f} lines/s ({2} lines in {3:.3f}s)'.format(
+            name, len(raw_lines) / seconds, len(raw_lines), seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for scanning a ZNC user's log directory with
+:meth:`~irclogviewer.znc.ZncLogManager.all`.
+
+Makes up a log directory of empty log files and times finding them all,
+against the way ``ZncLogManager.all`` did it before it used ``os.scandir``.
+Run it from the top of the repository::
+
+    python benchmarks/scan_log_directory.py --files 100000
+
+The directory is made in a temporary directory unless ``--directory`` is
+given, in which case a log directory that is already there is reused.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from irclogviewer.znc import (  # noqa: E402
+    LOG_FILENAME_PATTERN,
+    ZncLogManager,
+)
+
+
+class ListdirLogFile(object):
+    """A log file the way :class:`~irclogviewer.znc.ZncLogFile` used to
+    make it: an ``os.path.exists`` and an ``os.stat`` per file, and the date
+    parsed with ``strptime``.
+    """
+
+    def __init__(self, log_path):
+        match = LOG_FILENAME_PATTERN.match(os.path.basename(log_path))
+        if not match:
+            raise ValueError('Unsupported log filename')
+        self.log_path = log_path
+        self.channel = match.group('channel')
+        self.date = datetime.datetime.strptime(match.group('date'),
+                                               '%Y%m%d').date()
+        if not os.path.exists(log_path):
+            raise ValueError('Log {0} does not exist'.format(log_path))
+        stat = os.stat(log_path)
+        self.modified_time = datetime.datetime.fromtimestamp(stat.st_mtime)
+
+
+def scan_with_listdir(logs_path):
+    """Find the log files in a directory with ``os.listdir``.
+
+    :param str logs_path: the log directory
+    :rtype: list of :class:`ListdirLogFile`
+    """
+    log_files = []
+    for filename in os.listdir(logs_path):
+        try:
+            log_files.append(ListdirLogFile(os.path.join(logs_path,
+                                                         filename)))
+        except ValueError:
+            pass
+    return log_files
+
+
+def make_log_directory(logs_path, file_count, channel_count):
+    """Make up a log directory of empty log files for the same channels on
+    consecutive days.
+
+    :param str logs_path: where to make the log directory
+    :param int file_count: how many log files to make
+    :param int channel_count: how many channels to spread them over
+    """
+    os.makedirs(logs_path)
+    first_date = datetime.date(2000, 1, 1)
+    for number in range(file_count):
+        date = first_date + datetime.timedelta(days=number // channel_count)
+        log_name = '#channel{0}_{1:%Y%m%d}.log'.format(
+            number % channel_count, date)
+        open(os.path.join(logs_path, log_name), 'w').close()
+
+
+def best_seconds(function, repeat):
+    """Time a function several times.
+
+    :param function: the function to call with no arguments
+    :param int repeat: how many times to call it
+    :return: the fastest call's time in seconds, and what it returned
+    :rtype: tuple of (float, object)
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark scanning a ZNC log directory.')
+    parser.add_argument('--files', type=int, default=100000,
+                        help='how many log files to make')
+    parser.add_argument('--channels', type=int, default=200,
+                        help='how many channels to spread them over')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--directory',
+                        help='where to keep the log directory, instead of a '
+                             'temporary directory')
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp()
+    try:
+        user_path = os.path.join(directory, 'user')
+        logs_path = os.path.join(user_path, 'moddata', 'log')
+        if not os.path.isdir(logs_path):
+            make_log_directory(logs_path, args.files, args.channels)
+
+        def scan_before():
+            return scan_with_listdir(logs_path)
+
+        def scan_now():
+            return list(ZncLogManager(user_path).all())
+
+        for name, function in [('os.listdir', scan_before),
+                               ('ZncLogManager.all', scan_now)]:
+            seconds, log_files = best_seconds(function, args.repeat)
+            print('{0}: {1} files in {2:.3f}s ({3:,.0f} files/s)'.format(
+                name, len(log_files), seconds, len(log_files) / seconds))
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,9 @@ import os
 # gunicorn config
 bind = "127.0.0.1:25252"
 workers = 4
+# With LIVE_TAIL_SSE, browsers following today's logs each hold a connection
+# open, so use an async worker class (requires ``pip install gevent``)
+# worker_class = "gevent"
 
 # flask config
 GOOGLE_CONSUMER_KEY = "REPLACE ME"
@@ -17,6 +20,32 @@ GOOGLE_CONSUMER_SECRET = "REPLACE ME"
 SECRET_KEY = "Change this to an actually secret value"
 
 CRAWLER_PID_FILE = os.path.join(sys.prefix, "crawler.pid")
+# How long the crawler's watch mode collects file events before writing them
+CRAWLER_WATCH_BATCH_SECONDS = 5
+# Where the byte offsets of log lines are saved for paginated log views
+LINE_INDEX_DIRECTORY = os.path.join(sys.prefix, "line_indexes")
+# Roughly how much memory the parsed lines of logs may take up in each worker.
+# Logs too big for it aren't cached.
+PARSED_LOG_CACHE_SIZE = 32 * 1024 * 1024
+# Where parsed logs are pickled so that all workers can share them, and the
+# total size of those pickles
+PARSED_LOG_CACHE_DIRECTORY = os.path.join(sys.prefix, "parsed_logs")
+PARSED_LOG_CACHE_DIRECTORY_SIZE = 256 * 1024 * 1024
+# The total length of the rendered log HTML that each worker keeps in memory
+RENDERED_LOG_CACHE_SIZE = 64 * 1024 * 1024
+# Browsers viewing today's log poll for new lines this often
+LIVE_TAIL_BROWSER_POLL_SECONDS = 5
+# Push new lines to browsers as server-sent events instead. Each browser then
+# holds a connection open, so this needs the gevent worker class above.
+LIVE_TAIL_SSE = False
+# How often logs that are followed with server-sent events are checked for
+# new lines
+LIVE_TAIL_POLL_SECONDS = 1.0
+# How many processes each regular expression search scans logs with, and
+# how much wall-clock time and CPU time it may take
+SEARCH_REGEX_PROCESSES = 2
+SEARCH_REGEX_SECONDS = 10
+SEARCH_REGEX_CPU_SECONDS = 20
 SQLALCHEMY_DATABASE_URI = "sqlite:///{0}".format(os.path.join(sys.prefix,
                                                               "irc_logs.db"))
 
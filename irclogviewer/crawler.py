@@ -1,17 +1,71 @@
+import argparse
 import atexit
 import logging
+import multiprocessing
+import signal
 import sys
 import os
+import time
 
 import psutil
+from sqlalchemy import and_, bindparam, event, exists, func, select
 
 from irclogviewer import create_app, db
-from irclogviewer.models import IrcLog
-from irclogviewer.znc import ZncDirectory
+from irclogviewer import inotify
+from irclogviewer.dates import month_bounds
+from irclogviewer.logs.search_index import read_search_lines
+from irclogviewer.logs.stats import LINE_TYPE_COLUMNS, LogStats, read_log_stats
+from irclogviewer.models import (
+    create_missing_indexes,
+    create_search_index,
+    INDEX_NEW_SEARCH_LINES,
+    IrcChannelSummary,
+    IrcLog,
+    IrcLogMonth,
+    IrcSearchFile,
+    IrcSearchLine,
+    IrcStatsChangedLog,
+    IrcStatsChangedMonth,
+    IrcStatsFile,
+    IrcStatsHour,
+    IrcStatsMonth,
+    IrcStatsMonthHour,
+    IrcStatsMonthNick,
+    IrcStatsNick,
+)
+from irclogviewer.znc import (
+    parse_log_filename,
+    ZncDirectory,
+    ZncLogFile,
+    ZncUserDirectory,
+)
 
 
 logger = logging.getLogger(__name__)
 
+# How many rows are sent to the database per executemany call
+WRITE_BATCH_SIZE = 1000
+# How many channels go into one IN (...) clause, which stays well under
+# SQLite's limit on bind parameters
+MAX_CHANNELS_PER_STATEMENT = 500
+# How many lines are read into memory for the search index before they are
+# written
+MAX_PENDING_SEARCH_LINES = 100000
+
+# Events on a user's log directory that mean a log file appeared, grew, or
+# went away.
+WATCHED_LOG_EVENTS = (
+    inotify.IN_CREATE |
+    inotify.IN_MODIFY |
+    inotify.IN_CLOSE_WRITE |
+    inotify.IN_MOVED_TO |
+    inotify.IN_MOVED_FROM |
+    inotify.IN_DELETE
+)
+# Events on the ``users`` directory, or on a directory on the way to a user's
+# log directory, that mean a directory was added
+WATCHED_PARENT_EVENTS = inotify.IN_CREATE | inotify.IN_MOVED_TO
+
 
 def atexit_remove_pid_file(pid_file):
     def handler():
@@ -23,7 +77,1030 @@ def atexit_remove_pid_file(pid_file):
     return handler
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Crawl the ZNC log directory into the log database")
+    # manage.py passes "--config" so that it shows up in `ps`; the real
+    # config is read from the FLASK_SETTINGS environment variable.
+    parser.add_argument(
+        "--config",
+        dest="config",
+        help="Path to the config file (informational only)")
+    parser.add_argument(
+        "--full",
+        dest="full",
+        action="store_true",
+        help="Delete and re-add every log row instead of only syncing the "
+             "rows that changed")
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="After crawling, keep running and index log files as ZNC "
+             "writes them (Linux only)")
+    parser.add_argument(
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes that scan user directories")
+    parser.add_argument(
+        "--verbose",
+        dest="verbose",
+        action="store_true",
+        help="Log what was crawled and how long each user took")
+    return parser.parse_args()
+
+
+def scan_user_logs(user_path):
+    """Find all the log files of a single ZNC user. This is what the crawler's
+    worker processes run, so it must not touch the database.
+
+    :param str user_path: path to a user under the ``users`` directory
+    :return: the user's name, the user's log files, and how many seconds the
+        scan took
+    :rtype: tuple of (str, list of :class:`~irclogviewer.znc.ZncLogEntry`,
+        float)
+    """
+    start_time = time.monotonic()
+    user_directory = ZncUserDirectory(user_path)
+    log_files = list(user_directory.logs.all())
+    return user_directory.name, log_files, time.monotonic() - start_time
+
+
+def log_file_row(user, log_file):
+    """Make the ``irclogs`` row for a log file, keyed the way
+    :func:`write_log_changes` expects.
+
+    :param str user: the ZNC user that owns the log file
+    :type log_file: :class:`~irclogviewer.znc.ZncLogEntry` or
+        :class:`~irclogviewer.znc.ZncLogFile`
+    :rtype: dict
+    """
+    return {
+        'b_user': user,
+        'b_channel': log_file.channel,
+        'b_date': log_file.date,
+        'b_path': log_file.log_path,
+        'b_last_modified': log_file.modified_time,
+    }
+
+
+def execute_in_batches(statement, rows):
+    """Execute ``statement`` once per row with ``executemany``, sending
+    ``WRITE_BATCH_SIZE`` rows at a time.
+
+    :param statement: a Core insert, update, or delete with bind parameters
+    :param list rows: one dict of bind parameter values per row
+    """
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        db.session.execute(statement, rows[start:start + WRITE_BATCH_SIZE])
+
+
+def write_log_changes(inserts, updates, deletes):
+    """Write changed ``irclogs`` rows with Core-level bulk statements instead
+    of going through the ORM's unit of work. This does not commit.
+
+    :param list inserts: rows from :func:`log_file_row` to insert
+    :param list updates: rows from :func:`log_file_row` to update
+    :param list deletes: dicts of ``b_user``, ``b_channel``, and ``b_date``
+        for the rows to delete
+    """
+    table = IrcLog.__table__
+    matches_key = and_(table.c.user == bindparam('b_user'),
+                       table.c.channel == bindparam('b_channel'),
+                       table.c.date == bindparam('b_date'))
+
+    if deletes:
+        execute_in_batches(table.delete().where(matches_key), deletes)
+    if updates:
+        statement = table.update()\
+                         .where(matches_key)\
+                         .values(path=bindparam('b_path'),
+                                 last_modified=bindparam('b_last_modified'))
+        execute_in_batches(statement, updates)
+    if inserts:
+        statement = table.insert().values(
+            user=bindparam('b_user'),
+            channel=bindparam('b_channel'),
+            date=bindparam('b_date'),
+            path=bindparam('b_path'),
+            last_modified=bindparam('b_last_modified'))
+        execute_in_batches(statement, inserts)
+
+
+def chunk_channels(channels):
+    """Split ``channels`` into lists small enough for one ``IN`` clause.
+
+    :param channels: channel names, or None to mean every channel
+    :type channels: iterable of str or None
+    :return: lists of channel names, or a single None
+    """
+    if channels is None:
+        yield None
+        return
+    channels = sorted(channels)
+    for start in range(0, len(channels), MAX_CHANNELS_PER_STATEMENT):
+        yield channels[start:start + MAX_CHANNELS_PER_STATEMENT]
+
+
+def refresh_channel_summaries(user, channels=None):
+    """Recompute the :class:`IrcChannelSummary` rows of ``user`` from the
+    ``irclogs`` table. This does not commit.
+
+    :param str user: the ZNC user whose logs changed
+    :param channels: the channels whose logs changed, or None to refresh all
+        of the user's channels
+    :type channels: iterable of str or None
+    """
+    summaries = IrcChannelSummary.__table__
+    logs = IrcLog.__table__
+    for chunk in chunk_channels(channels):
+        delete = summaries.delete().where(summaries.c.user == user)
+        summarize = select([logs.c.user,
+                            logs.c.channel,
+                            func.min(logs.c.date),
+                            func.max(logs.c.date),
+                            func.max(logs.c.last_modified),
+                            func.count()])\
+            .where(logs.c.user == user)\
+            .group_by(logs.c.user, logs.c.channel)
+        if chunk is not None:
+            delete = delete.where(summaries.c.channel.in_(chunk))
+            summarize = summarize.where(logs.c.channel.in_(chunk))
+
+        db.session.execute(delete)
+        db.session.execute(summaries.insert().from_select(
+            ['user', 'channel', 'first_date', 'latest_date', 'last_modified',
+             'log_count'],
+            summarize))
+
+
+def refresh_log_months(user, channels=None):
+    """Recompute the :class:`IrcLogMonth` day bitmaps of ``user`` from the
+    ``irclogs`` table. This does not commit.
+
+    :param str user: the ZNC user whose logs changed
+    :param channels: the channels whose logs changed, or None to refresh all
+        of the user's channels
+    :type channels: iterable of str or None
+    """
+    months = IrcLogMonth.__table__
+    for chunk in chunk_channels(channels):
+        delete = months.delete().where(months.c.user == user)
+        query = db.session.query(IrcLog.channel, IrcLog.date)\
+                          .filter(IrcLog.user == user)
+        if chunk is not None:
+            delete = delete.where(months.c.channel.in_(chunk))
+            query = query.filter(IrcLog.channel.in_(chunk))
+
+        # maps from (channel, year, month) -> bitmap of days
+        days = {}
+        for channel, date in query:
+            key = (channel, date.year, date.month)
+            days[key] = days.get(key, 0) | (1 << date.day)
+
+        db.session.execute(delete)
+        execute_in_batches(months.insert(), [
+            {
+                'user': user,
+                'channel': channel,
+                'year': year,
+                'month': month,
+                'days': month_days,
+            }
+            for (channel, year, month), month_days in days.items()
+        ])
+
+
+def refresh_search_index(user, channels=None):
+    """Add the lines of ``user``'s new and changed logs to the search index,
+    and remove the lines of logs that are gone. This does not commit.
+
+    ZNC only ever appends to a log, so when a log has grown, only the lines
+    after the ones that are already indexed are read. A log that shrank or
+    moved is indexed again from the start.
+
+    :param str user: the ZNC user whose logs changed
+    :param channels: the channels whose logs changed, or None to refresh all
+        of the user's channels
+    :type channels: iterable of str or None
+    """
+    if db.engine.dialect.name != 'sqlite':
+        # Searching needs SQLite's full-text index
+        return
+
+    for chunk in chunk_channels(channels):
+        log_query = db.session.query(IrcLog.channel, IrcLog.date, IrcLog.path)\
+                              .filter(IrcLog.user == user)\
+                              .order_by(IrcLog.date, IrcLog.channel)
+        file_query = db.session.query(IrcSearchFile.channel,
+                                      IrcSearchFile.date,
+                                      IrcSearchFile.path,
+                                      IrcSearchFile.mtime_ns,
+                                      IrcSearchFile.size,
+                                      IrcSearchFile.line_count,
+                                      IrcSearchFile.first_id,
+                                      IrcSearchFile.last_id)\
+                               .filter(IrcSearchFile.user == user)
+        if chunk is not None:
+            log_query = log_query.filter(IrcLog.channel.in_(chunk))
+            file_query = file_query.filter(IrcSearchFile.channel.in_(chunk))
+
+        # maps from (channel, date) -> the row of what is indexed of the log
+        indexed_files = dict(((row.channel, row.date), row)
+                             for row in file_query)
+        # Lines with IDs above this one are added to the full-text index
+        # once the whole chunk has been read
+        last_indexed_id = \
+            db.session.query(func.max(IrcSearchLine.id)).scalar() or 0
+        # The keys of the logs whose indexed lines or rows of search_files
+        # are replaced, and the new rows, which are written a batch of logs
+        # at a time
+        replaced_lines, replaced_files, line_rows, file_rows = [], [], [], []
+        # Logs are indexed in date order, so newer lines get higher IDs
+        for channel, date, path in log_query.all():
+            indexed_file = indexed_files.pop((channel, date), None)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (indexed_file is not None and indexed_file.path == path and
+                    indexed_file.mtime_ns == st.st_mtime_ns):
+                continue
+
+            key = {'b_user': user, 'b_channel': channel, 'b_date': date}
+            if (indexed_file is None or indexed_file.path != path or
+                    st.st_size < indexed_file.size):
+                start, line_count = 0, 0
+                first_id, last_id = None, None
+            else:
+                start, line_count = indexed_file.size, indexed_file.line_count
+                first_id, last_id = indexed_file.first_id, indexed_file.last_id
+            try:
+                search_lines, end, new_line_count = read_search_lines(
+                    path, start, line_count + 1)
+            except ValueError as e:
+                logger.warning(
+                    "Could not index {0} for searching: {1}".format(path, e))
+                continue
+
+            if indexed_file is not None:
+                if start == 0:
+                    replaced_lines.append(key)
+                replaced_files.append(key)
+            file_rows.append(({
+                'user': user,
+                'channel': channel,
+                'date': date,
+                'path': path,
+                'mtime_ns': st.st_mtime_ns,
+                'size': end,
+                'line_count': line_count + new_line_count,
+                'first_id': first_id,
+                'last_id': last_id,
+            }, len(line_rows), len(search_lines)))
+            line_rows.extend({
+                'user': user,
+                'channel': channel,
+                'date': date,
+                'line_number': line_number,
+                'timestamp': timestamp,
+                'nick': nick,
+                'message': message,
+            } for line_number, timestamp, nick, message in search_lines)
+
+            if (len(file_rows) >= WRITE_BATCH_SIZE or
+                    len(line_rows) >= MAX_PENDING_SEARCH_LINES):
+                write_search_lines(replaced_lines, replaced_files,
+                                   line_rows, file_rows)
+                replaced_lines, replaced_files, line_rows, file_rows = \
+                    [], [], [], []
+        write_search_lines(replaced_lines, replaced_files, line_rows,
+                           file_rows)
+
+        db.session.execute(INDEX_NEW_SEARCH_LINES,
+                           {'last_id': last_indexed_id})
+
+        # Whatever is left over no longer has a log
+        removed = [{'b_user': user, 'b_channel': channel, 'b_date': date}
+                   for channel, date in indexed_files]
+        if removed:
+            delete_search_lines(removed)
+            delete_search_files(removed)
+
+
+def write_search_lines(replaced_lines, replaced_files, line_rows,
+                       file_rows):
+    """Add the lines of some logs to ``search_lines`` and record how much of
+    each log is indexed in ``search_files``. This does not commit.
+
+    IDs are never reused, so the lines, which are inserted together, get
+    consecutive IDs that end at the highest ID afterwards. That is all that
+    has to be read back to know the IDs of each log's lines.
+
+    :param list replaced_lines: dicts of ``b_user``, ``b_channel``, and
+        ``b_date`` for the logs whose indexed lines are deleted first
+    :param list replaced_files: the same, for the logs whose rows of
+        ``search_files`` are deleted first
+    :param list line_rows: rows of ``search_lines`` to insert
+    :param list file_rows: a row of ``search_files`` to insert for each log,
+        along with the index in ``line_rows`` of the log's first new line
+        and how many new lines it has
+    :type file_rows: list of tuple of (dict, int, int)
+    """
+    if replaced_lines:
+        delete_search_lines(replaced_lines)
+    if replaced_files:
+        delete_search_files(replaced_files)
+    if line_rows:
+        execute_in_batches(IrcSearchLine.__table__.insert(), line_rows)
+        first_new_id = db.session.query(func.max(IrcSearchLine.id))\
+                                 .scalar() - len(line_rows) + 1
+
+    rows = []
+    for file_row, first_line, new_line_count in file_rows:
+        if new_line_count:
+            if file_row['first_id'] is None:
+                file_row['first_id'] = first_new_id + first_line
+            file_row['last_id'] = \
+                first_new_id + first_line + new_line_count - 1
+        rows.append(file_row)
+    if rows:
+        execute_in_batches(IrcSearchFile.__table__.insert(), rows)
+
+
+def delete_search_lines(keys):
+    """Remove the indexed lines of logs from the search index.
+
+    :param list keys: dicts of ``b_user``, ``b_channel``, and ``b_date``
+    """
+    lines = IrcSearchLine.__table__
+    execute_in_batches(
+        lines.delete().where(and_(lines.c.user == bindparam('b_user'),
+                                  lines.c.channel == bindparam('b_channel'),
+                                  lines.c.date == bindparam('b_date'))),
+        keys)
+
+
+def delete_search_files(keys):
+    """Forget how much of some logs has been indexed.
+
+    :param list keys: dicts of ``b_user``, ``b_channel``, and ``b_date``
+    """
+    files = IrcSearchFile.__table__
+    execute_in_batches(
+        files.delete().where(and_(files.c.user == bindparam('b_user'),
+                                  files.c.channel == bindparam('b_channel'),
+                                  files.c.date == bindparam('b_date'))),
+        keys)
+
+
+def refresh_stats(user, channels=None):
+    """Count the lines of ``user``'s new and changed logs for the stats
+    pages, and remove the counts of logs that are gone. The counts of every
+    month that had a log change are then added up again. This does not
+    commit.
+
+    As with the search index, only the lines that were appended to a log
+    since it was last counted are read.
+
+    :param str user: the ZNC user whose logs changed
+    :param channels: the channels whose logs changed, or None to refresh all
+        of the user's channels
+    :type channels: iterable of str or None
+    """
+    for chunk in chunk_channels(channels):
+        log_query = db.session.query(IrcLog.channel, IrcLog.date, IrcLog.path)\
+                              .filter(IrcLog.user == user)
+        file_query = db.session.query(IrcStatsFile.channel,
+                                      IrcStatsFile.date,
+                                      IrcStatsFile.path,
+                                      IrcStatsFile.mtime_ns,
+                                      IrcStatsFile.size,
+                                      IrcStatsFile.line_count,
+                                      IrcStatsFile.messages,
+                                      IrcStatsFile.actions,
+                                      IrcStatsFile.joins,
+                                      IrcStatsFile.parts,
+                                      IrcStatsFile.quits)\
+                               .filter(IrcStatsFile.user == user)
+        if chunk is not None:
+            log_query = log_query.filter(IrcLog.channel.in_(chunk))
+            file_query = file_query.filter(IrcStatsFile.channel.in_(chunk))
+
+        # maps from (channel, date) -> the counts of the log
+        counted_files = dict(((row.channel, row.date), row)
+                             for row in file_query)
+        # The (channel, year, month) of each log whose counts changed
+        changed_months = set()
+        # The keys of the logs whose old counts are replaced, and the rows of
+        # the new counts, which are written a batch of logs at a time
+        replaced, file_rows, nick_rows, hour_rows = [], [], [], []
+        for channel, date, path in log_query.all():
+            counted_file = counted_files.pop((channel, date), None)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (counted_file is not None and counted_file.path == path and
+                    counted_file.mtime_ns == st.st_mtime_ns):
+                continue
+
+            if (counted_file is None or counted_file.path != path or
+                    st.st_size < counted_file.size):
+                start, line_count, stats = 0, 0, LogStats()
+            else:
+                start, line_count = counted_file.size, counted_file.line_count
+                stats = load_log_stats(user, counted_file)
+            try:
+                stats, end, new_line_count = read_log_stats(path, start,
+                                                            stats)
+            except ValueError as e:
+                logger.warning(
+                    "Could not count {0} for stats: {1}".format(path, e))
+                continue
+
+            if counted_file is not None:
+                replaced.append(
+                    {'b_user': user, 'b_channel': channel, 'b_date': date})
+            file_row = {
+                'user': user,
+                'channel': channel,
+                'date': date,
+                'path': path,
+                'mtime_ns': st.st_mtime_ns,
+                'size': end,
+                'line_count': line_count + new_line_count,
+            }
+            for line_type, column in LINE_TYPE_COLUMNS.items():
+                file_row[column] = stats.type_counts[line_type]
+            file_rows.append(file_row)
+            nick_rows.extend({
+                'user': user,
+                'channel': channel,
+                'date': date,
+                'nick': nick,
+                'messages': messages,
+                'actions': actions,
+            } for nick, messages, actions in stats.nick_counts())
+            hour_rows.extend({
+                'user': user,
+                'channel': channel,
+                'date': date,
+                'hour': hour,
+                'messages': messages,
+                'actions': actions,
+            } for hour, messages, actions in stats.hour_counts())
+            changed_months.add((channel, date.year, date.month))
+
+            # Writing many logs' rows per statement saves compiling the
+            # statements again for every log
+            if len(file_rows) >= WRITE_BATCH_SIZE:
+                write_log_stats(replaced, file_rows, nick_rows, hour_rows)
+                replaced, file_rows, nick_rows, hour_rows = [], [], [], []
+        write_log_stats(replaced, file_rows, nick_rows, hour_rows)
+
+        # Whatever is left over no longer has a log
+        removed = [{'b_user': user, 'b_channel': channel, 'b_date': date}
+                   for channel, date in counted_files]
+        if removed:
+            delete_log_stats(removed)
+            changed_months.update((channel, date.year, date.month)
+                                  for channel, date in counted_files)
+
+        refresh_stats_months(user, changed_months)
+
+
+def load_log_stats(user, counted_file):
+    """Load the counts of the lines of a log that have been counted so far.
+
+    :param str user: the ZNC user that owns the log
+    :param counted_file: the log's row of ``stats_files``
+    :rtype: :class:`~irclogviewer.logs.stats.LogStats`
+    """
+    channel = counted_file.channel
+    date = counted_file.date
+
+    stats = LogStats()
+    for line_type, column in LINE_TYPE_COLUMNS.items():
+        stats.type_counts[line_type] = getattr(counted_file, column)
+
+    nick_query = db.session.query(IrcStatsNick.nick,
+                                  IrcStatsNick.messages,
+                                  IrcStatsNick.actions)\
+                           .filter(IrcStatsNick.user == user,
+                                   IrcStatsNick.channel == channel,
+                                   IrcStatsNick.date == date)
+    for nick, messages, actions in nick_query:
+        stats.nick_messages[nick] = messages
+        stats.nick_actions[nick] = actions
+
+    hour_query = db.session.query(IrcStatsHour.hour,
+                                  IrcStatsHour.messages,
+                                  IrcStatsHour.actions)\
+                           .filter(IrcStatsHour.user == user,
+                                   IrcStatsHour.channel == channel,
+                                   IrcStatsHour.date == date)
+    for hour, messages, actions in hour_query:
+        stats.hour_messages[hour] = messages
+        stats.hour_actions[hour] = actions
+    return stats
+
+
+def write_log_stats(replaced, file_rows, nick_rows, hour_rows):
+    """Replace the counts of the lines of some logs.
+
+    :param list replaced: dicts of ``b_user``, ``b_channel``, and ``b_date``
+        for the logs whose old counts are deleted first
+    :param list file_rows: rows of ``stats_files`` to insert
+    :param list nick_rows: rows of ``stats_nicks`` to insert
+    :param list hour_rows: rows of ``stats_hours`` to insert
+    """
+    if replaced:
+        delete_log_stats(replaced)
+    for model, rows in ((IrcStatsFile, file_rows),
+                        (IrcStatsNick, nick_rows),
+                        (IrcStatsHour, hour_rows)):
+        if rows:
+            execute_in_batches(model.__table__.insert(), rows)
+
+
+def delete_log_stats(keys):
+    """Remove the counts of the lines of some logs.
+
+    :param list keys: dicts of ``b_user``, ``b_channel``, and ``b_date``
+    """
+    changed = IrcStatsChangedLog.__table__
+    execute_in_batches(changed.insert().values(user=bindparam('b_user'),
+                                               channel=bindparam('b_channel'),
+                                               date=bindparam('b_date')),
+                       keys)
+    for model in (IrcStatsFile, IrcStatsNick, IrcStatsHour):
+        table = model.__table__
+        db.session.execute(table.delete().where(exists().where(and_(
+            changed.c.user == table.c.user,
+            changed.c.channel == table.c.channel,
+            changed.c.date == table.c.date))))
+    db.session.execute(changed.delete())
+
+
+def refresh_stats_months(user, changed_months):
+    """Add up the counts of the lines of a user's logs again for some months
+    of some channels. This does not commit.
+
+    :param str user: the ZNC user
+    :param changed_months: the ``(channel, year, month)`` of each month to
+        add up
+    :type changed_months: iterable of tuple of (str, int, int)
+    """
+    changed = IrcStatsChangedMonth.__table__
+    rows = []
+    for channel, year, month in changed_months:
+        first_day, next_first_day = month_bounds(year, month)
+        rows.append({
+            'user': user,
+            'channel': channel,
+            'year': year,
+            'month': month,
+            'first_day': first_day,
+            'next_first_day': next_first_day,
+        })
+    if not rows:
+        return
+    execute_in_batches(changed.insert(), rows)
+
+    for model in (IrcStatsMonth, IrcStatsMonthNick, IrcStatsMonthHour):
+        table = model.__table__
+        db.session.execute(table.delete().where(exists().where(and_(
+            changed.c.user == table.c.user,
+            changed.c.channel == table.c.channel,
+            changed.c.year == table.c.year,
+            changed.c.month == table.c.month))))
+
+    def in_changed_month(table):
+        return and_(table.c.user == changed.c.user,
+                    table.c.channel == changed.c.channel,
+                    table.c.date >= changed.c.first_day,
+                    table.c.date < changed.c.next_first_day)
+
+    files = IrcStatsFile.__table__
+    columns = sorted(LINE_TYPE_COLUMNS.values())
+    db.session.execute(IrcStatsMonth.__table__.insert().from_select(
+        ['user', 'channel', 'year', 'month', 'log_count'] + columns,
+        select([changed.c.user,
+                changed.c.channel,
+                changed.c.year,
+                changed.c.month,
+                func.count()] +
+               [func.sum(files.c[column]) for column in columns])
+        .select_from(changed.join(files, in_changed_month(files)))
+        .group_by(changed.c.user, changed.c.channel, changed.c.year,
+                  changed.c.month)))
+
+    for model, month_model, key in (
+            (IrcStatsNick, IrcStatsMonthNick, 'nick'),
+            (IrcStatsHour, IrcStatsMonthHour, 'hour')):
+        table = model.__table__
+        db.session.execute(month_model.__table__.insert().from_select(
+            ['user', 'channel', 'year', 'month', key, 'messages', 'actions'],
+            select([changed.c.user,
+                    changed.c.channel,
+                    changed.c.year,
+                    changed.c.month,
+                    table.c[key],
+                    func.sum(table.c.messages),
+                    func.sum(table.c.actions)])
+            .select_from(changed.join(table, in_changed_month(table)))
+            .group_by(changed.c.user, changed.c.channel, changed.c.year,
+                      changed.c.month, table.c[key])))
+
+    db.session.execute(changed.delete())
+
+
+# Tables derived from irclogs, and the function that recomputes a user's rows
+DERIVED_TABLES = [
+    (IrcChannelSummary, refresh_channel_summaries),
+    (IrcLogMonth, refresh_log_months),
+    (IrcSearchFile, refresh_search_index),
+    (IrcStatsFile, refresh_stats),
+]
+
+
+def refresh_derived_tables(user, channels=None):
+    """Recompute every table in ``DERIVED_TABLES`` for ``user``'s
+    ``channels``. This does not commit.
+
+    :param str user: the ZNC user whose logs changed
+    :param channels: the channels whose logs changed, or None for all of them
+    :type channels: iterable of str or None
+    """
+    for model, refresh in DERIVED_TABLES:
+        refresh(user, channels)
+
+
+def backfill_derived_tables():
+    """Fill in any derived table that is empty while ``irclogs`` is not,
+    e.g. the first time a database crawled by an older version is used.
+    """
+    users = [user for user, in db.session.query(IrcLog.user).distinct()]
+    if not users:
+        return
+
+    for model, refresh in DERIVED_TABLES:
+        if db.session.query(model).first() is None:
+            for user in users:
+                refresh(user)
+    db.session.commit()
+
+
+def replace_user_logs(user, log_files):
+    """Delete every :class:`IrcLog` row for ``user`` and re-add one row per
+    log file.
+
+    :param str user: the ZNC user that was crawled
+    :param log_files: all of the user's log files
+    :type log_files: list of :class:`~irclogviewer.znc.ZncLogEntry`
+    :return: the number of inserted, updated, and deleted rows
+    :rtype: tuple of (int, int, int)
+    """
+    num_deleted = db.session.query(IrcLog)\
+                            .filter(IrcLog.user == user)\
+                            .delete()
+
+    # Two files can map to the same (channel, date) row; the last one wins
+    rows = dict(((log_file.channel, log_file.date),
+                 log_file_row(user, log_file))
+                for log_file in log_files)
+    write_log_changes(list(rows.values()), [], [])
+    refresh_derived_tables(user)
+    db.session.commit()
+    return len(rows), 0, num_deleted
+
+
+def sync_user_logs(user, log_files):
+    """Bring the :class:`IrcLog` rows for ``user`` in line with the log files
+    on disk, in a single transaction.
+
+    Only new files are inserted, only rows whose path or modified time
+    changed are updated, and only rows whose files are gone are deleted.
+
+    :param str user: the ZNC user that was crawled
+    :param log_files: all of the user's log files
+    :type log_files: list of :class:`~irclogviewer.znc.ZncLogEntry`
+    :return: the number of inserted, updated, and deleted rows
+    :rtype: tuple of (int, int, int)
+    """
+    log_files = dict(((log_file.channel, log_file.date), log_file)
+                     for log_file in log_files)
+
+    stored_logs = db.session.query(IrcLog.channel,
+                                   IrcLog.date,
+                                   IrcLog.path,
+                                   IrcLog.last_modified)\
+                            .filter(IrcLog.user == user)
+
+    updates = []
+    deletes = []
+    for channel, date, path, last_modified in stored_logs:
+        log_file = log_files.pop((channel, date), None)
+        if log_file is None:
+            deletes.append({
+                'b_user': user,
+                'b_channel': channel,
+                'b_date': date,
+            })
+        elif (path != log_file.log_path or
+                last_modified != log_file.modified_time):
+            updates.append(log_file_row(user, log_file))
+
+    # Whatever is left over has no row yet
+    inserts = [log_file_row(user, log_file)
+               for log_file in log_files.values()]
+
+    write_log_changes(inserts, updates, deletes)
+    changed_channels = set(row['b_channel']
+                           for row in inserts + updates + deletes)
+    if changed_channels:
+        refresh_derived_tables(user, changed_channels)
+    db.session.commit()
+    return len(inserts), len(updates), len(deletes)
+
+
+def upsert_log_files(user, log_paths):
+    """Insert, update, or delete the :class:`IrcLog` rows for ``user``'s
+    ``log_paths`` so that they match what is on disk, in a single transaction.
+
+    :param str user: the ZNC user that owns the log files
+    :param log_paths: paths to log files that were created, changed, or removed
+    :type log_paths: iterable of str
+    """
+    inserts = []
+    updates = []
+    deletes = []
+    for log_path in log_paths:
+        try:
+            channel, date = parse_log_filename(os.path.basename(log_path))
+        except ValueError:
+            continue
+
+        stored_path = db.session.query(IrcLog.path)\
+                                .filter(IrcLog.user == user,
+                                        IrcLog.channel == channel,
+                                        IrcLog.date == date)\
+                                .scalar()
+        try:
+            log_file = ZncLogFile(log_path, channel, date)
+        except ValueError:
+            # The file was deleted or moved away
+            if stored_path == log_path:
+                deletes.append({
+                    'b_user': user,
+                    'b_channel': channel,
+                    'b_date': date,
+                })
+            continue
+
+        if stored_path is None:
+            inserts.append(log_file_row(user, log_file))
+        else:
+            updates.append(log_file_row(user, log_file))
+
+    write_log_changes(inserts, updates, deletes)
+    changed_channels = set(row['b_channel']
+                           for row in inserts + updates + deletes)
+    if changed_channels:
+        refresh_derived_tables(user, changed_channels)
+    db.session.commit()
+
+
+def set_bulk_load_pragmas(dbapi_connection, connection_record):
+    """Configure a new SQLite connection for the crawler's bulk writes.
+
+    WAL mode lets the web app keep reading while the crawler writes, and
+    with WAL, ``synchronous=NORMAL`` only gives up durability of the last
+    transactions on power loss, never consistency. :func:`watch` only uses
+    ``synchronous=NORMAL`` for its first crawl.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+def end_bulk_load():
+    """Stop configuring new connections with :func:`set_bulk_load_pragmas`,
+    and close the connections that were, so that later writes are durable
+    again. WAL mode stays on, since it is stored in the database file.
+    """
+    if event.contains(db.engine, 'connect', set_bulk_load_pragmas):
+        event.remove(db.engine, 'connect', set_bulk_load_pragmas)
+        db.engine.dispose()
+
+
+def crawl(znc_directory, full=False, jobs=1):
+    """Crawl the log directory of every ZNC user in ``znc_directory``.
+
+    With more than one job, user directories are scanned in parallel by
+    worker processes, and this process writes their results to the database
+    as they arrive.
+
+    :param znc_directory: the ZNC directory to crawl
+    :type znc_directory: :class:`~irclogviewer.znc.ZncDirectory`
+    :param bool full: whether to rebuild every row instead of syncing
+    :param int jobs: how many worker processes to scan with
+    """
+    user_paths = [user_directory.user_path
+                  for user_directory in znc_directory.users.values()]
+    write_user_logs = replace_user_logs if full else sync_user_logs
+
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(min(jobs, len(user_paths)) or 1)
+        scans = pool.imap_unordered(scan_user_logs, user_paths)
+    else:
+        scans = map(scan_user_logs, user_paths)
+
+    try:
+        for user, log_files, scan_seconds in scans:
+            start_time = time.monotonic()
+            num_inserted, num_updated, num_deleted = \
+                write_user_logs(user, log_files)
+            logger.info(
+                "Crawled {user}: {num_files} files scanned in "
+                "{scan_seconds:.2f}s, written in {write_seconds:.2f}s "
+                "({inserted} inserted, {updated} updated, "
+                "{deleted} deleted)".format(
+                    user=user,
+                    num_files=len(log_files),
+                    scan_seconds=scan_seconds,
+                    write_seconds=time.monotonic() - start_time,
+                    inserted=num_inserted,
+                    updated=num_updated,
+                    deleted=num_deleted)
+            )
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def watch(znc_directory, batch_seconds, jobs=1):
+    """Keep the log database up to date by following inotify events on every
+    ZNC user's log directory. This never returns.
+
+    Events are batched for ``batch_seconds`` so that a busy channel results in
+    one commit per batch instead of one commit per line. A full crawl is done
+    once the watches are in place, so nothing written before or during
+    startup is missed.
+
+    A user whose log directory doesn't exist yet, including a user that is
+    added while this is running, is picked up once the log directory is
+    created. Until then, the closest directory on the way to it is watched.
+
+    :param znc_directory: the ZNC directory to watch
+    :type znc_directory: :class:`~irclogviewer.znc.ZncDirectory`
+    :param float batch_seconds: how long to collect events before writing
+    :param int jobs: how many worker processes to do full crawls with
+    """
+    with inotify.Inotify() as notifier:
+        users_path = znc_directory.users.users_path
+        users_wd = notifier.add_watch(
+            users_path, WATCHED_PARENT_EVENTS | inotify.IN_ONLYDIR)
+
+        # maps from watch descriptor -> (user name, log directory)
+        log_watches = {}
+        # maps from watch descriptor -> the user whose log directory doesn't
+        # exist yet, for a directory on the way to it
+        parent_watches = {}
+
+        def watch_user(user_directory):
+            """Watch a user's log directory, or if it doesn't exist, the
+            closest directory on the way to it.
+
+            :return: whether the log directory is watched
+            :rtype: bool
+            """
+            logs_path = user_directory.logs.logs_path
+            moddata_path = os.path.dirname(logs_path)
+            while True:
+                try:
+                    wd = notifier.add_watch(
+                        logs_path, WATCHED_LOG_EVENTS | inotify.IN_ONLYDIR)
+                    break
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(
+                        "Could not watch log directory {0}: {1}".format(
+                            logs_path, e)
+                    )
+                    return False
+
+                for parent_path, path in ((moddata_path, logs_path),
+                                          (user_directory.user_path,
+                                           moddata_path)):
+                    try:
+                        wd = notifier.add_watch(
+                            parent_path,
+                            WATCHED_PARENT_EVENTS | inotify.IN_ONLYDIR)
+                    except FileNotFoundError:
+                        continue
+                    except OSError as e:
+                        logger.warning(
+                            "Could not watch directory {0}: {1}".format(
+                                parent_path, e)
+                        )
+                        return False
+                    parent_watches[wd] = user_directory
+                    break
+                else:
+                    # The user directory is gone
+                    return False
+                if not os.path.isdir(path):
+                    return False
+                # The directory was created before its parent was watched
+
+            log_watches[wd] = (user_directory.name, logs_path)
+            for parent_wd, parent_user_directory in \
+                    list(parent_watches.items()):
+                if parent_user_directory is user_directory:
+                    del parent_watches[parent_wd]
+                    try:
+                        notifier.rm_watch(parent_wd)
+                    except OSError:
+                        # The kernel already dropped the watch
+                        pass
+            return True
+
+        def sync_user(user_directory):
+            user, log_files, _ = scan_user_logs(user_directory.user_path)
+            sync_user_logs(user, log_files)
+
+        for user_directory in znc_directory.users.values():
+            watch_user(user_directory)
+        crawl(znc_directory, jobs=jobs)
+        # The batches that follow are small, so they can afford SQLite's
+        # default durability
+        end_bulk_load()
+
+        # maps from user name -> set of log paths that need to be synced
+        pending = {}
+        flush_at = None
+        while True:
+            timeout = None
+            if flush_at is not None:
+                timeout = max(0, flush_at - time.monotonic())
+
+            for watch_event in notifier.read_events(timeout):
+                if watch_event.mask & inotify.IN_Q_OVERFLOW:
+                    logger.warning(
+                        "inotify event queue overflowed, re-crawling")
+                    pending.clear()
+                    for user_directory in znc_directory.users.values():
+                        watch_user(user_directory)
+                    crawl(znc_directory, jobs=jobs)
+                elif watch_event.wd == users_wd:
+                    if watch_event.mask & inotify.IN_ISDIR:
+                        user_directory = znc_directory.users.get(
+                            watch_event.name)
+                        if user_directory and watch_user(user_directory):
+                            sync_user(user_directory)
+                elif watch_event.wd in parent_watches:
+                    user_directory = parent_watches[watch_event.wd]
+                    if watch_event.mask & inotify.IN_IGNORED:
+                        del parent_watches[watch_event.wd]
+                    elif (watch_event.mask & inotify.IN_ISDIR and
+                            watch_user(user_directory)):
+                        sync_user(user_directory)
+                elif watch_event.wd in log_watches:
+                    user, logs_path = log_watches[watch_event.wd]
+                    if watch_event.mask & inotify.IN_IGNORED:
+                        # The log directory is gone, so wait for it to be
+                        # created again
+                        del log_watches[watch_event.wd]
+                        user_directory = znc_directory.users.get(user)
+                        if user_directory:
+                            watch_user(user_directory)
+                    elif watch_event.name:
+                        log_path = os.path.join(logs_path, watch_event.name)
+                        pending.setdefault(user, set()).add(log_path)
+
+            if pending and flush_at is None:
+                flush_at = time.monotonic() + batch_seconds
+            if flush_at is not None and time.monotonic() >= flush_at:
+                for user, log_paths in pending.items():
+                    upsert_log_files(user, log_paths)
+                pending.clear()
+                flush_at = None
+
+
 def main():
+    args = parse_args()
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+    )
     app = create_app()
     ctx = app.test_request_context()
     ctx.push()
@@ -46,24 +1123,21 @@ def main():
             f.write(str(os.getpid()))
     atexit.register(atexit_remove_pid_file(pid_file))
 
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', set_bulk_load_pragmas)
     db.create_all()
+    create_missing_indexes(db.engine)
+    create_search_index(db.engine)
+    backfill_derived_tables()
     znc_directory = ZncDirectory(app.config['ZNC_DIRECTORY'])
 
-    for user_directory in znc_directory.users.values():
-        # Delete all the existing logs (because adding new IrcLog rows is
-        # faster than merging existing entries).
-        db.session.query(IrcLog)\
-                  .filter(IrcLog.user == user_directory.name)\
-                  .delete()
-
-        db.session.commit()
-        for log_file in user_directory.logs.all():
-            irc_log = IrcLog(user=user_directory.name,
-                             channel=log_file.channel,
-                             date=log_file.date,
-                             path=log_file.log_path,
-                             last_modified=log_file.modified_time)
-            db.session.add(irc_log)
-        db.session.commit()
+    if args.watch:
+        # Make SIGTERM run the atexit handlers so the PID file is removed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        watch(znc_directory,
+              app.config.get('CRAWLER_WATCH_BATCH_SECONDS', 5),
+              jobs=args.jobs)
+    else:
+        crawl(znc_directory, full=args.full, jobs=args.jobs)
 
     os.remove(pid_file)
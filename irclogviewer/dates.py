@@ -63,9 +63,17 @@ def parse_undashed_date(raw_date):
     """Parse the YYYYMMDD date format that ZNC uses.
 
     :param str raw_date: a string of the form YYYYMMDD
+    :raises ValueError: if ``raw_date`` isn't a valid YYYYMMDD date
     :returns: a :class:`~datetime.date` object
     """
-    return datetime.datetime.strptime(raw_date, "%Y%m%d").date()
+    # This is called for every log file during a crawl, so it slices out the
+    # integers instead of going through the much slower strptime.
+    if len(raw_date) != 8 or not raw_date.isdigit():
+        raise ValueError(
+            'Date "{0}" does not match the YYYYMMDD format'.format(raw_date))
+    return datetime.date(int(raw_date[:4]),
+                         int(raw_date[4:6]),
+                         int(raw_date[6:]))
 
 
 def parse_dashed_date(raw_date):
@@ -76,3 +84,27 @@ def parse_dashed_date(raw_date):
     :returnss: a :class:`datetime.date` object
     """
     return datetime.datetime.strptime(raw_date, "%Y-%m-%d").date()
+
+
+def parse_year_month(raw_year_month):
+    """Parse the YYYY-MM format of a month.
+
+    :param str raw_year_month: a string of the form YYYY-MM
+    :raises ValueError: if ``raw_year_month`` isn't a valid YYYY-MM month
+    :rtype: :class:`YearMonth`
+    """
+    date = datetime.datetime.strptime(raw_year_month, "%Y-%m").date()
+    return YearMonth(date.year, date.month)
+
+
+def month_bounds(year, month):
+    """Get the first day of a month and the first day of the month after it.
+
+    :param int year: the year
+    :param int month: the month, from 1 to 12
+    :rtype: tuple of (:class:`datetime.date`, :class:`datetime.date`)
+    """
+    first_day = datetime.date(year, month, 1)
+    if month == 12:
+        return first_day, datetime.date(year + 1, 1, 1)
+    return first_day, datetime.date(year, month + 1, 1)
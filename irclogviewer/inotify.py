@@ -0,0 +1,120 @@
+"""
+A minimal :mod:`ctypes` binding to the Linux inotify API, just big enough for
+the crawler to watch ZNC's log directories.
+"""
+from collections import namedtuple
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = os.O_CLOEXEC
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+EVENT_HEADER = struct.Struct('iIII')
+READ_BUFFER_SIZE = 64 * 1024
+
+
+InotifyEvent = namedtuple('InotifyEvent', ['wd', 'mask', 'cookie', 'name'])
+
+
+class Inotify(object):
+    """An inotify instance that can watch many paths at once."""
+
+    def __init__(self):
+        """
+        :raises OSError: if inotify isn't available on this platform
+        """
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError('Could not find the C library for inotify')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify is not supported on this platform')
+
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise_errno()
+
+        # maps from watch descriptor -> watched path
+        self.watches = {}
+
+    def _raise_errno(self, path=None):
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+
+    def add_watch(self, path, mask):
+        """Start watching ``path`` for the events in ``mask``.
+
+        :param str path: a file or directory
+        :param int mask: bitwise OR of the ``IN_*`` event flags
+        :return: the watch descriptor
+        :rtype: int
+        """
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise_errno(path)
+        self.watches[wd] = path
+        return wd
+
+    def rm_watch(self, wd):
+        """Stop watching a path. An ``IN_IGNORED`` event for ``wd`` follows.
+
+        :param int wd: the watch descriptor from :meth:`add_watch`
+        """
+        if self._libc.inotify_rm_watch(self.fd, wd) < 0:
+            self._raise_errno(self.watches.get(wd))
+        self.watches.pop(wd, None)
+
+    def read_events(self, timeout=None):
+        """Wait up to ``timeout`` seconds for events.
+
+        :param timeout: seconds to wait, or None to wait forever
+        :type timeout: float or None
+        :return: the events that were read, which is empty on timeout
+        :rtype: list of :class:`InotifyEvent`
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.fd, READ_BUFFER_SIZE)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append(InotifyEvent(wd, mask, cookie, os.fsdecode(name)))
+
+            if mask & IN_IGNORED:
+                # The kernel dropped this watch (e.g. the directory is gone)
+                self.watches.pop(wd, None)
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return '<Inotify fd={fd}>'.format(**self.__dict__)
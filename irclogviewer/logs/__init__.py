@@ -1,31 +1,266 @@
 import calendar
+from collections import namedtuple
+import datetime
 import http.client
+import json
+import os
+import re
 
-from flask import abort, Blueprint, render_template, request, session
+from flask import (
+    abort,
+    Blueprint,
+    current_app,
+    jsonify,
+    Markup,
+    render_template,
+    request,
+    Response,
+    session,
+    stream_with_context,
+)
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
 
-from irclogviewer.models import db, IrcLog
-from irclogviewer.logs.authorization import email_can_read_channel_logs
-from irclogviewer.dates import (
-    parse_date,
-    sorted_unique_year_months,
+from irclogviewer.models import db, IrcChannelSummary, IrcLog, IrcLogMonth
+from irclogviewer.logs.authorization import (
+    ChannelAcl,
+    email_can_read_channel_logs,
+    readable_channels_clause,
 )
+from irclogviewer.dates import parse_date, parse_year_month, YearMonth
 from irclogviewer.logs.filters import filters_mapping
-from irclogviewer.logs.irc_parser import parse_irc_line
+from irclogviewer.logs.irc_parser import parse_irc_line, parse_irc_log
+from irclogviewer.logs.line_index import (
+    decode_log_bytes,
+    get_line_index,
+    map_log_file,
+    read_text,
+)
+from irclogviewer.logs.live_tail import (
+    find_end_of_whole_lines,
+    LogTailer,
+    read_whole_lines,
+)
+from irclogviewer.logs.log_cache import cache_key, ParsedLogCache
+from irclogviewer.logs.regex_search import compile_pattern, RegexSearch
+from irclogviewer.logs.render_cache import (
+    covers_start_of,
+    EMPTY_RENDERED_LOG,
+    RenderedLog,
+    RenderedLogCache,
+    TAIL_SIZE,
+)
+from irclogviewer.logs.search_index import search_logs
+from irclogviewer.logs.stats import (
+    get_day_stats,
+    get_hour_stats,
+    get_month_stats,
+    get_nick_stats,
+)
 
 
 logs = Blueprint('logs', __name__, template_folder='templates')
 
+# How many template events Jinja collects before yielding a chunk of a
+# streamed response
+STREAM_BUFFER_SIZE = 256
+# How many lines of a log are shown when only ?offset= is given
+DEFAULT_PAGE_SIZE = 500
+# How many search hits are shown per page
+SEARCH_PAGE_SIZE = 100
+# How many of a channel's most active nicks its stats page shows
+NUM_STATS_NICKS = 50
+
+# A window of lines from a log. ``earlier_offset`` and ``later_offset`` are
+# where the neighboring windows start, or None at either end of the log.
+LogPage = namedtuple('LogPage', ['offset', 'limit', 'line_count',
+                                 'earlier_offset', 'later_offset'])
+
 
 def get_session_user_email():
     return session.get('user', {}).get('email', None)
 
 
+def stream_template(template_name, **context):
+    """Like ``render_template``, but returns a generator that yields the
+    rendered output in chunks as the template is evaluated.
+
+    :param str template_name: the template to render
+    :return: an iterable of rendered chunks
+    """
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return stream
+
+
+def get_parsed_log_cache():
+    return current_app.extensions['parsed_log_cache']
+
+
+def get_rendered_log_cache():
+    return current_app.extensions['rendered_log_cache']
+
+
+def irc_line_to_json(irc_line):
+    """Convert an :class:`~irclogviewer.logs.irc_parser.IrcLine` into
+    something that :func:`flask.jsonify` can serialize.
+
+    :param IrcLine irc_line: a parsed line
+    :rtype: dict
+    """
+    return {
+        'timestamp': irc_line.timestamp,
+        'nick': irc_line.nick,
+        'type': irc_line.type,
+        'message_fragments': [
+            {'state': fragment.state._asdict(), 'text': fragment.text}
+            for fragment in irc_line.message_fragments
+        ],
+    }
+
+
+def render_irc_lines(irc_lines, first_line_number):
+    """Generator that renders lines of a log as they are parsed.
+
+    :param irc_lines: the lines to render
+    :type irc_lines: iterable of :class:`~irclogviewer.logs.irc_parser.IrcLine`
+    :param int first_line_number: the line number of the first line
+    :rtype: generator of :class:`flask.Markup`
+    """
+    template = current_app.jinja_env.get_template('log_lines.html')
+    for chunk in template.generate(irc_lines=irc_lines,
+                                   first_line_number=first_line_number):
+        yield Markup(chunk)
+
+
+def iter_rendered_log(path, st, size=None):
+    """Generator of the rendered HTML of a whole log.
+
+    The HTML that is cached from an earlier request is sent first, and then
+    only the lines that were appended to the log since then are parsed and
+    rendered.
+
+    :param str path: path to an IRC log
+    :param os.stat_result st: the result of ``os.stat(path)``
+    :param size: (optional) how many bytes of the log to render, which is
+        ``st.st_size`` by default
+    :type size: int or None
+    :rtype: generator of :class:`flask.Markup`
+    """
+    if size is None:
+        size = st.st_size
+    rendered_log_cache = get_rendered_log_cache()
+    rendered_log = rendered_log_cache.get(path)
+    if (rendered_log.size == size == st.st_size and
+            covers_start_of(rendered_log, st, b'')):
+        yield Markup(rendered_log.html)
+        return
+
+    with open(path, 'rb') as f, map_log_file(f, size) as data:
+        if not covers_start_of(rendered_log, st, data):
+            # The log was replaced or rewritten, so it has to be rendered
+            # from the start
+            rendered_log = EMPTY_RENDERED_LOG
+        # Only the bytes appended since the cached HTML are decoded. ZNC may
+        # be partway through writing the last line, so only whole lines are
+        # cached.
+        whole_size = data.rfind(b'\n', rendered_log.size) + 1
+        whole_size = max(whole_size, rendered_log.size)
+        whole_lines = decode_log_bytes(data, rendered_log.size, whole_size)
+        partial_line = decode_log_bytes(data, whole_size, size)
+        tail = data[max(whole_size - TAIL_SIZE, 0):whole_size]
+
+    if rendered_log.html:
+        yield Markup(rendered_log.html)
+
+    whole_line_count = whole_lines.count('\n')
+    if rendered_log.size == 0 and whole_size == st.st_size:
+        # The whole log is being rendered, so its parsed lines can be shared
+        # through the parsed log cache
+        irc_lines = get_parsed_log_cache().iter_lines(cache_key(path, st),
+                                                      whole_lines)
+    else:
+        irc_lines = parse_irc_log(whole_lines)
+
+    first_line_number = rendered_log.line_count + 1
+    # The new HTML is only kept while the whole HTML can still fit in the
+    # cache
+    chunks = []
+    html_length = len(rendered_log.html)
+    for chunk in render_irc_lines(irc_lines, first_line_number):
+        if chunks is not None:
+            chunks.append(chunk)
+            html_length += len(chunk)
+            if html_length > rendered_log_cache.max_size:
+                chunks = None
+        yield chunk
+
+    if chunks is not None and whole_size > rendered_log.size:
+        rendered_log_cache.put(path, RenderedLog(
+            size=whole_size,
+            line_count=rendered_log.line_count + whole_line_count,
+            html=rendered_log.html + ''.join(chunks),
+            ino=st.st_ino,
+            mtime_ns=st.st_mtime_ns,
+            tail=tail,
+        ))
+
+    if partial_line:
+        yield from render_irc_lines(parse_irc_log(partial_line),
+                                    first_line_number + whole_line_count)
+
+
+def encode_appended_lines(lines, offset):
+    """Encode lines that were appended to a log for
+    :class:`~irclogviewer.logs.live_tail.LogTailer` subscribers.
+
+    :param list lines: the appended lines
+    :param int offset: the byte offset after the appended lines
+    :rtype: str
+    """
+    return json.dumps({
+        'lines': [irc_line_to_json(parse_irc_line(line)) for line in lines],
+        'offset': offset,
+    })
+
+
 @logs.record_once
 def inject_filters(setup_state):
     app = setup_state.app
     app.jinja_env.filters.update(**filters_mapping)
 
 
+@logs.record_once
+def init_log_caches(setup_state):
+    app = setup_state.app
+    app.extensions['parsed_log_cache'] = ParsedLogCache(
+        app.config.get('PARSED_LOG_CACHE_SIZE', 32 * 1024 * 1024),
+        app.config.get('PARSED_LOG_CACHE_DIRECTORY'),
+        app.config.get('PARSED_LOG_CACHE_DIRECTORY_SIZE', 256 * 1024 * 1024),
+    )
+    app.extensions['rendered_log_cache'] = RenderedLogCache(
+        app.config.get('RENDERED_LOG_CACHE_SIZE', 64 * 1024 * 1024))
+
+
+@logs.record_once
+def init_channel_acl(setup_state):
+    app = setup_state.app
+    acl_rules = app.config.get('ZNC_ACL')
+    if acl_rules:
+        app.extensions['channel_acl'] = ChannelAcl(acl_rules)
+
+
+@logs.record_once
+def init_log_tailer(setup_state):
+    app = setup_state.app
+    app.extensions['log_tailer'] = LogTailer(
+        encode_appended_lines,
+        app.config.get('LIVE_TAIL_POLL_SECONDS', 1.0),
+    )
+
+
 @logs.route('/')
 def index():
     return render_template('index.html')
@@ -35,22 +270,33 @@ def index():
 def show_calendar():
     """Shows the month calendars for each log
     """
-    query = db.session.query(IrcLog.date.distinct())\
-                      .order_by(IrcLog.date)\
-                      .all()
-    log_dates = [row[0] for row in query]
+    # maps from YearMonth -> bitmap of the days that have logs the web user
+    # can read
+    days_by_month = {}
+    query = db.session.query(IrcLogMonth.year,
+                             IrcLogMonth.month,
+                             IrcLogMonth.days)\
+                      .filter(readable_channels_clause(
+                          get_session_user_email(),
+                          IrcLogMonth.user,
+                          IrcLogMonth.channel))
+    for year, month, days in query:
+        year_month = YearMonth(year, month)
+        days_by_month[year_month] = days_by_month.get(year_month, 0) | days
 
-    year_month_tuples = sorted_unique_year_months(log_dates)
+    year_month_tuples = sorted(days_by_month)
     cal = calendar.Calendar(firstweekday=calendar.SUNDAY)
 
     most_recent_log_date = None
-    if log_dates:
-        most_recent_log_date = sorted(log_dates)[-1]
+    if year_month_tuples:
+        year, month = year_month_tuples[-1]
+        last_day = days_by_month[year_month_tuples[-1]].bit_length() - 1
+        most_recent_log_date = datetime.date(year, month, last_day)
 
     return render_template(
         'calendar.html',
         calendar=cal,
-        log_dates=log_dates,
+        days_by_month=days_by_month,
         most_recent_log_date=most_recent_log_date,
         year_month_tuples=year_month_tuples,
     )
@@ -61,7 +307,8 @@ def list_channels():
     """List all of the channels that each :class:`irclogviewer.logs.znc.ZncUser`
     has logs for.
     """
-    # latest_logs maps from ZncUser -> str channel name -> latest ZncLog
+    # latest_logs maps from ZNC user name -> the most recently active
+    # channels' latest logs, up to NUM_TOP_CHANNELS_PER_USER of them
     latest_logs = {}
 
     session_user_email = get_session_user_email()
@@ -71,24 +318,74 @@ def list_channels():
     else:
         specific_date = None
 
-    query = db.session.query(IrcLog)
+    num_channels_per_user = current_app.config.get(
+        'NUM_TOP_CHANNELS_PER_USER', 10)
+
+    # Each user's channels are limited in SQL: for each user, an indexed
+    # lookup picks their most recently active readable channels, and only
+    # those rows are fetched.
     if specific_date:
-        query = query.filter(IrcLog.date == specific_date)
-    query = query.group_by(IrcLog.user_channel)\
-                 .order_by(IrcLog.user.asc(),
-                           IrcLog.date.desc(),
-                           IrcLog.last_modified.desc(),
-                           IrcLog.channel.asc())
-
-    for log in query.all():
-        if not email_can_read_channel_logs(session_user_email,
-                                           log.user,
-                                           log.channel):
-            continue
-        if log.user not in latest_logs:
-            latest_logs[log.user] = []
-
-        latest_logs[log.user].append(log)
+        users = db.session.query(IrcLog.user)\
+                          .filter(IrcLog.date == specific_date)\
+                          .distinct()\
+                          .subquery()
+        top = aliased(IrcLog)
+        top_channels = db.session.query(top.channel)\
+                                 .filter(top.date == specific_date,
+                                         top.user == users.c.user,
+                                         readable_channels_clause(
+                                             session_user_email,
+                                             top.user,
+                                             top.channel))\
+                                 .order_by(top.last_modified.desc(),
+                                           top.channel.asc())\
+                                 .limit(num_channels_per_user)\
+                                 .correlate(users)
+        query = db.session.query(IrcLog.user,
+                                 IrcLog.channel,
+                                 IrcLog.date,
+                                 IrcLog.last_modified)\
+                          .select_from(users)\
+                          .join(IrcLog, IrcLog.user == users.c.user)\
+                          .filter(IrcLog.date == specific_date,
+                                  IrcLog.channel.in_(top_channels.subquery()))\
+                          .order_by(IrcLog.user.asc(),
+                                    IrcLog.last_modified.desc(),
+                                    IrcLog.channel.asc())
+    else:
+        # The crawler keeps one summary row per channel, so this doesn't
+        # need to group the whole irclogs table.
+        users = db.session.query(IrcChannelSummary.user)\
+                          .distinct()\
+                          .subquery()
+        top = aliased(IrcChannelSummary)
+        top_channels = db.session.query(top.channel)\
+                                 .filter(top.user == users.c.user,
+                                         readable_channels_clause(
+                                             session_user_email,
+                                             top.user,
+                                             top.channel))\
+                                 .order_by(top.latest_date.desc(),
+                                           top.last_modified.desc(),
+                                           top.channel.asc())\
+                                 .limit(num_channels_per_user)\
+                                 .correlate(users)
+        query = db.session.query(
+            IrcChannelSummary.user,
+            IrcChannelSummary.channel,
+            IrcChannelSummary.latest_date.label('date'),
+            IrcChannelSummary.last_modified)\
+            .select_from(users)\
+            .join(IrcChannelSummary,
+                  IrcChannelSummary.user == users.c.user)\
+            .filter(IrcChannelSummary.channel.in_(top_channels.subquery()))\
+            .order_by(IrcChannelSummary.user.asc(),
+                      IrcChannelSummary.latest_date.desc(),
+                      IrcChannelSummary.last_modified.desc(),
+                      IrcChannelSummary.channel.asc())
+
+    for log in query:
+        latest_logs.setdefault(log.user, []).append(log)
 
     return render_template(
         'channels.html',
@@ -97,6 +394,150 @@ def list_channels():
     )
 
 
+@logs.route('/search')
+def search():
+    """Search the logs of every channel the web user can read.
+
+    Words are looked up in the full-text index. With ``?regex=``, the log
+    files themselves are scanned for a regular expression instead, and the
+    lines that match are sent as they are found.
+    """
+    email = get_session_user_email()
+    terms = request.args.get('q', '')
+    regex = request.args.get('regex', '')
+    nick = request.args.get('nick', '')
+    user = request.args.get('user', '')
+    channel = request.args.get('channel', '')
+    start_date = request.args.get('from', type=parse_date)
+    end_date = request.args.get('to', type=parse_date)
+    before = request.args.get('before', type=int)
+
+    regex_error = None
+    regex_search = None
+    next_before = None
+    if regex:
+        try:
+            compile_pattern(regex)
+        except re.error as e:
+            regex_error = str(e)
+            hits = []
+        else:
+            regex_search = RegexSearch(
+                regex,
+                get_log_files(email, user, channel, start_date, end_date),
+                nick=nick,
+                limit=SEARCH_PAGE_SIZE,
+                processes=current_app.config.get('SEARCH_REGEX_PROCESSES', 2),
+                seconds=current_app.config.get('SEARCH_REGEX_SECONDS', 10),
+                cpu_seconds=current_app.config.get(
+                    'SEARCH_REGEX_CPU_SECONDS', 20),
+            )
+            hits = regex_search
+    else:
+        hits = search_logs(email,
+                           terms=terms,
+                           nick=nick,
+                           user=user,
+                           channel=channel,
+                           start_date=start_date,
+                           end_date=end_date,
+                           before=before,
+                           limit=SEARCH_PAGE_SIZE)
+        if len(hits) == SEARCH_PAGE_SIZE:
+            next_before = hits[-1].id
+
+    return Response(stream_with_context(stream_template(
+        'search.html',
+        terms=terms,
+        regex=regex,
+        nick=nick,
+        user=user,
+        channel=channel,
+        start_date=start_date,
+        end_date=end_date,
+        hits=hits,
+        regex_error=regex_error,
+        regex_search=regex_search,
+        next_before=next_before,
+        page_size=DEFAULT_PAGE_SIZE,
+    )))
+
+
+def get_log_files(email, user=None, channel=None, start_date=None,
+                  end_date=None):
+    """Get the logs for :class:`~irclogviewer.logs.regex_search.RegexSearch`
+    to scan, newest first.
+
+    :param email: the e-mail address of the web user, whose ZNC_ACL decides
+        which logs may be scanned
+    :type email: str or None
+    :param user: (optional) only scan this ZNC user's logs
+    :type user: str or None
+    :param channel: (optional) only scan this channel's logs
+    :type channel: str or None
+    :param start_date: (optional) the date of the earliest log
+    :type start_date: :class:`datetime.date` or None
+    :param end_date: (optional) the date of the latest log
+    :type end_date: :class:`datetime.date` or None
+    :return: the user, channel, date, and path of each log
+    :rtype: list of tuple
+    """
+    query = db.session.query(IrcLog.user,
+                             IrcLog.channel,
+                             IrcLog.date,
+                             IrcLog.path)\
+                      .filter(readable_channels_clause(email,
+                                                       IrcLog.user,
+                                                       IrcLog.channel))\
+                      .order_by(IrcLog.date.desc(),
+                                IrcLog.user.asc(),
+                                IrcLog.channel.asc())
+    if user:
+        query = query.filter(IrcLog.user == user)
+    if channel:
+        query = query.filter(IrcLog.channel == channel)
+    if start_date:
+        query = query.filter(IrcLog.date >= start_date)
+    if end_date:
+        query = query.filter(IrcLog.date <= end_date)
+    return query.all()
+
+
+def find_log(user, channel, date):
+    """Get a log and the dates of the channel's logs before and after it, in
+    a single round-trip. Both subqueries are answered by the primary key's
+    index.
+
+    :param str user: ZNC username
+    :param str channel: name of an IRC channel
+    :param datetime.date date: the date of the log
+    :return: the log and the dates of the earlier and later logs, which are
+        None if there isn't one, or None if there is no such log
+    :rtype: tuple of (:class:`~irclogviewer.models.IrcLog`,
+        :class:`datetime.date` or None, :class:`datetime.date` or None) or
+        None
+    """
+    neighbor = aliased(IrcLog)
+    earlier_date = db.session.query(func.max(neighbor.date))\
+                             .filter(neighbor.user == user,
+                                     neighbor.channel == channel,
+                                     neighbor.date < date)\
+                             .as_scalar()\
+                             .label('earlier_date')
+    later_date = db.session.query(func.min(neighbor.date))\
+                           .filter(neighbor.user == user,
+                                   neighbor.channel == channel,
+                                   neighbor.date > date)\
+                           .as_scalar()\
+                           .label('later_date')
+
+    return db.session.query(IrcLog, earlier_date, later_date)\
+                     .filter(IrcLog.user == user,
+                             IrcLog.channel == channel,
+                             IrcLog.date == date)\
+                     .first()
+
+
 @logs.route('/users/<user>/channels/<channel>/<date:date>')
 def get_log(user, channel, date):
     """Get a specific log."""
@@ -104,35 +545,225 @@ def get_log(user, channel, date):
     if not email_can_read_channel_logs(email, user, channel):
         abort(http.client.FORBIDDEN)
 
-    log = db.session.query(IrcLog)\
-                    .filter(IrcLog.user == user,
-                            IrcLog.channel == channel,
-                            IrcLog.date == date)\
-                    .first()
-    if not log:
+    row = find_log(user, channel, date)
+    if not row:
         abort(http.client.NOT_FOUND)
+    log, earlier_date, later_date = row
 
-    earlier_log = db.session.query(IrcLog)\
-                            .filter(IrcLog.user == user,
-                                    IrcLog.channel == channel,
-                                    IrcLog.date < date)\
-                            .order_by(IrcLog.date.desc())\
-                            .first()
-
-    later_log = db.session.query(IrcLog)\
-                          .filter(IrcLog.user == user,
-                                  IrcLog.channel == channel,
-                                  IrcLog.date > date)\
-                          .order_by(IrcLog.date.asc())\
-                          .first()
-
-    with open(log.path, 'r', encoding='utf-8', errors='ignore') as f:
-        irc_lines = [parse_irc_line(line) for line in f]
-    return render_template(
+    offset = request.args.get('offset', type=int)
+    limit = request.args.get('limit', type=int)
+    tail = request.args.get('tail', type=int)
+
+    # The line window to show, or None for the whole log
+    page = None
+    # Where the browser starts following today's log from, or None
+    live_offset = None
+    if offset is None and limit is None and tail is None:
+        st = os.stat(log.path)
+        size = st.st_size
+        if log.date == datetime.date.today():
+            # ZNC may be partway through writing the last line, so it is
+            # left for the browser to pick up once it is whole
+            size = live_offset = find_end_of_whole_lines(log.path, size)
+        # Lines that aren't cached yet are parsed as they are rendered and
+        # sent, so the time to the first byte doesn't depend on the size of
+        # the log.
+        rendered_lines = iter_rendered_log(log.path, st, size)
+    else:
+        index = get_line_index(
+            log.path, current_app.config.get('LINE_INDEX_DIRECTORY'))
+        if tail is not None:
+            limit = max(tail, 1)
+            offset = max(index.line_count - limit, 0)
+        else:
+            limit = max(limit or DEFAULT_PAGE_SIZE, 1)
+            offset = max(offset or 0, 0)
+        stop = min(offset + limit, index.line_count)
+
+        page = LogPage(
+            offset=offset,
+            limit=limit,
+            line_count=index.line_count,
+            earlier_offset=max(offset - limit, 0) if offset > 0 else None,
+            later_offset=stop if stop < index.line_count else None,
+        )
+        # Only the lines in the window are decoded and parsed
+        irc_lines = parse_irc_log(read_text(log.path, index, offset, stop))
+        rendered_lines = render_irc_lines(irc_lines, offset + 1)
+
+    return Response(stream_with_context(stream_template(
         'log.html',
         user=user,
-        earlier_log=earlier_log,
-        later_log=later_log,
+        earlier_date=earlier_date,
+        later_date=later_date,
         log=log,
-        irc_lines=irc_lines,
+        rendered_lines=rendered_lines,
+        page=page,
+        live_offset=live_offset,
+        live_tail_sse=current_app.config.get('LIVE_TAIL_SSE', False),
+        live_tail_browser_poll_seconds=current_app.config.get(
+            'LIVE_TAIL_BROWSER_POLL_SECONDS', 5),
+    )))
+
+
+@logs.route('/users/<user>/channels/<channel>/<date:date>/since/<int:offset>')
+def get_log_lines_since(user, channel, date, offset):
+    """Get the lines that were appended to a log after byte ``offset`` as
+    JSON, along with the offset to ask for next time.
+
+    Only whole lines are returned, so a line that ZNC is partway through
+    writing is returned by a later request. If ``offset`` is in the middle
+    of a line, the rest of that line is skipped.
+    """
+    email = get_session_user_email()
+    if not email_can_read_channel_logs(email, user, channel):
+        abort(http.client.FORBIDDEN)
+
+    log_path = db.session.query(IrcLog.path)\
+                         .filter(IrcLog.user == user,
+                                 IrcLog.channel == channel,
+                                 IrcLog.date == date)\
+                         .scalar()
+    if not log_path:
+        abort(http.client.NOT_FOUND)
+
+    size = os.stat(log_path).st_size
+    truncated = offset > size
+    if truncated:
+        # The log was replaced, so the client has to start over
+        offset = 0
+
+    lines, offset = read_whole_lines(log_path, offset, size)
+
+    return jsonify(
+        lines=[irc_line_to_json(parse_irc_line(line)) for line in lines],
+        offset=offset,
+        truncated=truncated,
+    )
+
+
+@logs.route('/users/<user>/channels/<channel>/<date:date>/live')
+def follow_log(user, channel, date):
+    """Push the lines that are appended to a log as server-sent events.
+
+    Each event's ID is the byte offset after its lines, so a browser that
+    reconnects with ``Last-Event-ID`` picks up where it left off. Without
+    one, the log is followed from ``?offset=``, or from the end of its
+    whole lines.
+
+    Every browser holds a connection open, so this is only served when
+    ``LIVE_TAIL_SSE`` is set, which needs an async gunicorn worker class.
+    """
+    if not current_app.config.get('LIVE_TAIL_SSE', False):
+        abort(http.client.NOT_FOUND)
+
+    email = get_session_user_email()
+    if not email_can_read_channel_logs(email, user, channel):
+        abort(http.client.FORBIDDEN)
+
+    log_path = db.session.query(IrcLog.path)\
+                         .filter(IrcLog.user == user,
+                                 IrcLog.channel == channel,
+                                 IrcLog.date == date)\
+                         .scalar()
+    if not log_path:
+        abort(http.client.NOT_FOUND)
+
+    offset = request.headers.get('Last-Event-ID', type=int)
+    if offset is None:
+        offset = request.args.get('offset', type=int)
+    if offset is None:
+        offset = find_end_of_whole_lines(log_path,
+                                         os.stat(log_path).st_size)
+
+    tailer = current_app.extensions['log_tailer']
+    keepalive_seconds = current_app.config.get(
+        'LIVE_TAIL_KEEPALIVE_SECONDS', 15)
+
+    def generate_events():
+        subscription = tailer.subscribe(log_path, offset)
+        try:
+            while True:
+                payload = subscription.get(keepalive_seconds)
+                if payload is None:
+                    # Comments keep proxies from closing idle connections,
+                    # and let the server notice browsers that went away
+                    yield ': keepalive\n\n'
+                else:
+                    yield 'id: {0}\ndata: {1}\n\n'.format(
+                        subscription.offset, payload)
+        finally:
+            tailer.unsubscribe(subscription)
+
+    return Response(generate_events(),
+                    mimetype='text/event-stream',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no',
+                    })
+
+
+@logs.route('/users/<user>/channels/<channel>/stats')
+def show_channel_stats(user, channel):
+    """Show how active a channel has been in each month, or in each day of
+    ``?month=YYYY-MM``. Everything comes from the counts that the crawler
+    keeps, so no log is read.
+    """
+    email = get_session_user_email()
+    if not email_can_read_channel_logs(email, user, channel):
+        abort(http.client.FORBIDDEN)
+
+    month_stats = get_month_stats(user, channel)
+    if not month_stats:
+        abort(http.client.NOT_FOUND)
+
+    year_month = None
+    earlier_month = None
+    later_month = None
+    day_stats = None
+    if 'month' in request.args:
+        try:
+            year_month = parse_year_month(request.args['month'])
+        except ValueError:
+            abort(http.client.BAD_REQUEST)
+        year_months = [YearMonth(stats.year, stats.month)
+                       for stats in month_stats]
+        if year_month not in year_months:
+            abort(http.client.NOT_FOUND)
+        index = year_months.index(year_month)
+        if index > 0:
+            earlier_month = year_months[index - 1]
+        if index + 1 < len(year_months):
+            later_month = year_months[index + 1]
+        day_stats = get_day_stats(user, channel, year_month)
+
+    nick_stats = get_nick_stats(user, channel, year_month,
+                                limit=NUM_STATS_NICKS)
+    hour_stats = get_hour_stats(user, channel, year_month)
+
+    return render_template(
+        'stats.html',
+        user=user,
+        channel=channel,
+        year_month=year_month,
+        earlier_month=earlier_month,
+        later_month=later_month,
+        month_stats=month_stats,
+        day_stats=day_stats,
+        nick_stats=nick_stats,
+        hour_stats=hour_stats,
+        # The counts that the bars of each table are scaled to
+        most_nick_lines=max([stats.messages + stats.actions
+                             for stats in nick_stats] or [0]),
+        most_hour_lines=max([stats.messages + stats.actions
+                             for stats in hour_stats] or [0]),
     )
+
+
+@logs.route('/cache')
+def show_cache_stats():
+    """Show this worker's parsed log cache counters to the owner."""
+    email = get_session_user_email()
+    if not email or email != current_app.config.get('OWNER_EMAIL'):
+        abort(http.client.FORBIDDEN)
+    return jsonify(**get_parsed_log_cache().stats())
@@ -1,41 +1,173 @@
-from flask import current_app
+"""
+Checks whether web users may read logs, by the rules of the ``ZNC_ACL``
+config variable.
+
+The rules are compiled once per app into a :class:`ChannelAcl`, so a check
+looks its rules up instead of scanning all of them, and the answers are
+remembered until the end of each request. Pages that query many channels at
+once filter them in SQL with :func:`readable_channels_clause` instead.
+"""
+from itertools import product
+
+from flask import current_app, g
+from sqlalchemy import and_, case, false, not_, or_, true
 
 
 WILDCARD = '*'
 
 
+class ChannelAcl(object):
+    """The rules of ``ZNC_ACL``, keyed by their e-mail address, ZNC username,
+    and channel.
+
+    A rule applies to a check when each of those is either the checked value
+    or the wildcard, so the only rules that can apply are the ones under the
+    8 keys that mix the checked values with wildcards. Of those, the rule
+    that comes first in ``ZNC_ACL`` wins, the same as if the rules were
+    scanned in order.
+    """
+
+    def __init__(self, acl_rules):
+        """
+        :param acl_rules: tuples of an action (``'allow'`` or ``'deny'``),
+            an e-mail address, a ZNC username, and a channel, any of which
+            but the action may be the wildcard
+        :type acl_rules: list of tuple
+        """
+        # maps from (email, ZNC username, channel) -> the position of the
+        # first rule with those fields, and whether it allows reading
+        self._rules = {}
+        # the same rules as tuples of (email, ZNC username, channel, whether
+        # it allows reading), in order. Later rules with the same fields as
+        # an earlier one never apply, so they're left out of both.
+        self._ordered_rules = []
+        for position, rule in enumerate(acl_rules):
+            action, rule_email, rule_username, rule_channel = rule
+            key = (rule_email, rule_username, rule_channel)
+            if key not in self._rules:
+                allow = action.strip().lower() == 'allow'
+                self._rules[key] = (position, allow)
+                self._ordered_rules.append(key + (allow,))
+
+    def can_read(self, email, znc_username, channel):
+        """Find whether the first rule that applies allows reading.
+
+        :param str email: e-mail address of the web user, or the wildcard
+        :param str znc_username: ZNC username
+        :param str channel: name of an IRC channel
+        :return: whether the rule allows reading, or None if no rule applies
+        :rtype: bool or None
+        """
+        first_rule = None
+        for key in product((email, WILDCARD),
+                           (znc_username, WILDCARD),
+                           (channel, WILDCARD)):
+            rule = self._rules.get(key)
+            if rule is not None and (first_rule is None or
+                                     rule[0] < first_rule[0]):
+                first_rule = rule
+        return None if first_rule is None else first_rule[1]
+
+    def read_clause(self, email, user_column, channel_column):
+        """Build a SQL condition that is true for the ZNC usernames and
+        channels that :meth:`can_read` allows ``email`` to read.
+
+        Only the rules for ``email`` or the wildcard e-mail address are
+        used, as a ``CASE`` that tries them in order. When the rules that
+        decide anything all allow or all deny, it's an ``OR`` of their
+        fields instead, which the database can use indexes for.
+
+        :param str email: e-mail address of the web user, or the wildcard
+        :param user_column: the column of ZNC usernames
+        :param channel_column: the column of channel names
+        :return: a condition for ``Query.filter``
+        """
+        # the condition of each rule that applies to email, and whether
+        # it allows reading
+        conditions = []
+        # whether reading is allowed when none of those rules apply
+        default = False
+        for rule_email, rule_username, rule_channel, allow \
+                in self._ordered_rules:
+            if rule_email not in (email, WILDCARD):
+                continue
+            fields = []
+            if rule_username != WILDCARD:
+                fields.append(user_column == rule_username)
+            if rule_channel != WILDCARD:
+                fields.append(channel_column == rule_channel)
+            if not fields:
+                # This rule applies to every channel, so no later rule does
+                default = allow
+                break
+            conditions.append((and_(*fields), allow))
+
+        # Rules that come after the last one that disagrees with the default
+        # don't change anything
+        while conditions and conditions[-1][1] == default:
+            conditions.pop()
+        if not conditions:
+            return true() if default else false()
+        if all(allow != default for _, allow in conditions):
+            any_rule = or_(*[condition for condition, _ in conditions])
+            return not_(any_rule) if default else any_rule
+        return case([(condition, allow) for condition, allow in conditions],
+                    else_=default)
+
+    def __repr__(self):
+        return '<ChannelAcl rules={0}>'.format(len(self._rules))
+
+
+def get_channel_acl():
+    """Get the current app's compiled ``ZNC_ACL``.
+
+    :rtype: :class:`ChannelAcl`
+    :raises ValueError: if ``ZNC_ACL`` isn't set
+    """
+    acl = current_app.extensions.get('channel_acl')
+    if acl is None:
+        current_app.logger.error("No ACL rules found")
+        raise ValueError('ZNC_ACL config variable was not defined')
+    return acl
+
+
 def email_can_read_channel_logs(email, znc_username, channel):
     """Returns whether the given ``email`` has permission to access
-    ``znc_username``'s logs for ``channel``.
+    ``znc_username``'s logs for ``channel``. When no rule applies, it
+    doesn't.
 
     :param str email: e-mail address of the web user
     :param str znc_username: ZNC username
     :param str channel: name of an IRC channel
     :return: True if ``email`` has permission to read the log, else False
     """
-    acl_rules = current_app.config.get('ZNC_ACL')
-    if not acl_rules:
-        current_app.logger.error("No ACL rules found")
-        raise ValueError('ZNC_ACL config variable was not defined')
-
+    acl = get_channel_acl()
     if not email:
         email = WILDCARD
 
-    for action, rule_email, rule_username, rule_channel in acl_rules:
-        if rule_email != WILDCARD and rule_email != email:
-            continue
+    # Pages that list channels check each one for the same web user
+    answers = getattr(g, 'channel_acl_answers', None)
+    if answers is None:
+        answers = g.channel_acl_answers = {}
+    key = (email, znc_username, channel)
+    can_read = answers.get(key)
+    if can_read is None:
+        can_read = answers[key] = bool(
+            acl.can_read(email, znc_username, channel))
+    return can_read
 
-        if rule_username != WILDCARD and rule_username != znc_username:
-            continue
 
-        if rule_channel != WILDCARD and rule_channel != channel:
-            continue
+def readable_channels_clause(email, user_column, channel_column):
+    """Build a SQL condition that is true for the rows whose ZNC username
+    and channel ``email`` has permission to read, the same as
+    :func:`email_can_read_channel_logs` would answer for each row.
 
-        return action.strip().lower() == 'allow'
-
-    return ValueError(
-        "Found no applicable rules in ZNC_ACL for "
-        "email={0} on znc_username={1} and channel={2}".format(
-            email, znc_username, channel
-        )
-    )
+    :param str email: e-mail address of the web user
+    :param user_column: the column of ZNC usernames, like ``IrcLog.user``
+    :param channel_column: the column of channel names, like
+        ``IrcLog.channel``
+    :return: a condition for ``Query.filter``
+    """
+    return get_channel_acl().read_clause(email or WILDCARD,
+                                         user_column,
+                                         channel_column)
@@ -33,7 +33,15 @@ def to_month_name(month_number):
 
 
 @register_jinja_filter
+def bitmap_has_day(days, day):
+    return bool(days & (1 << day))
+
+
+@register_jinja_filter
+@lru_cache(maxsize=1024)
 def irc_line_state_to_css_classes(irc_line_state):
+    # States are interned and there are only a few hundred of them, so this
+    # is only worked out once per state
     classes = []
     if irc_line_state.is_bold:
         classes.append("irc-bold")
@@ -43,7 +51,7 @@ def irc_line_state_to_css_classes(irc_line_state):
         classes.append("irc-fg-" + str(irc_line_state.fg_color))
     if irc_line_state.bg_color:
         classes.append("irc-bg-" + str(irc_line_state.bg_color))
-    return classes
+    return tuple(classes)
 
 
 @register_jinja_filter
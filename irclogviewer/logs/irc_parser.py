@@ -1,13 +1,15 @@
 from collections import namedtuple
 from enum import Enum
+from itertools import chain
 import re
+from sys import intern
 
 
 class IrcLineFragment(namedtuple('IrcLineFragment', ['state', 'text'])):
     """This class represents the formatting ``state`` of a substring ``text``
     from an IRC log line.
     """
-    pass
+    __slots__ = ()
 
 
 class IrcLine(namedtuple('IrcLine',
@@ -17,7 +19,7 @@ class IrcLine(namedtuple('IrcLine',
     The ``type`` is a member of :class:`IrcLineType`.
     The ``message_fragments`` is a list of :class:`IrcLineFragment`.
     """
-    pass
+    __slots__ = ()
 
 
 class IrcControlCode(Enum):
@@ -42,20 +44,85 @@ class IrcLineType(Enum):
     action = re.compile(r'^\* \S+ .*$')
 
 
+# Enum member lookups are slow enough to matter when parsing whole logs
+CTRL_COLOR = IrcControlCode.color.value
+CTRL_RESET = IrcControlCode.reset.value
+CTRL_UNDERLINE = IrcControlCode.underline.value
+
+MESSAGE_REGEX = IrcLineType.message.value
+ACTION_REGEX = IrcLineType.action.value
+
+# maps from what follows "*** " in a line -> the line's type
+EVENT_LINE_TYPES = {
+    'Joins: ': "join",
+    'Parts: ': "part",
+    'Quits: ': "quit",
+}
+
+# Matches each line of a whole log. Lines that parse_irc_line would parse
+# without looking at any control codes are split into their parts: joins,
+# parts, quits, actions, and messages with no formatting. Those lines must
+# also have no whitespace for str.strip() to remove. Every other line is
+# captured whole as "other".
+LOG_LINE_REGEX = re.compile(r"""
+    ^(?:
+        \[(?P<timestamp>[^ \n]*)\][ ]
+        (?:
+            (?P<event>\*\*\*[ ](?P<event_type>(?:Joins|Parts|Quits):[ ])
+                [^\n]*)
+            |(?P<action>\*[ ]\S+[ ][^\n]*)
+            |<(?P<nick>\S+)>[ ](?P<message>[^\n{codes}]*)
+            |(?P<plain>[^*<\n{codes}][^\n{codes}]*)
+        )
+        (?<=\S)
+    |(?P<other>[^\n]*)
+    )$
+""".format(codes=''.join('\\x{0:02x}'.format(ord(code.value))
+                         for code in IrcControlCode)),
+    re.MULTILINE | re.VERBOSE)
+
+
 class IrcLineState(
     namedtuple(
         'IrcLineState',
         ['fg_color', 'bg_color', 'is_bold', 'has_underline'])):
     """This class represents the formatting options for a substring of a line
-    from an IRC log."""
+    from an IRC log.
+
+    Only a few hundred states are used in practice, so states are interned:
+    every state that :meth:`interned` and the methods below return is shared
+    by everything with the same formatting.
+    """
+    __slots__ = ()
+
+    # maps from (fg_color, bg_color, is_bold, has_underline) -> the one
+    # IrcLineState with those values
+    _interned_states = {}
+
+    @classmethod
+    def interned(cls, fg_color, bg_color, is_bold, has_underline):
+        """Get the shared :class:`IrcLineState` with the given formatting.
+
+        :rtype: :class:`IrcLineState`
+        """
+        key = (fg_color, bg_color, is_bold, has_underline)
+        state = cls._interned_states.get(key)
+        if state is None:
+            state = cls._interned_states.setdefault(key, cls(*key))
+        return state
+
+    def __reduce__(self):
+        # Unpickled states are interned too, e.g. when they are loaded from
+        # the parsed log cache
+        return IrcLineState.interned, tuple(self)
 
     @classmethod
     def default_state(cls):
-        """Create a new :class:`IrcLineState` with the initial configuration.
+        """Get the :class:`IrcLineState` with the initial configuration.
 
         :rtype: :class:`IrcLineState`
         """
-        return cls(None, None, False, False)
+        return cls.interned(None, None, False, False)
 
     def reset(self):
         """Return a new :class:`IrcLineState` that has the default state
@@ -63,12 +130,7 @@ class IrcLineState(
 
         :rtype: :class:`IrcLineState`
         """
-        return self._replace(
-            fg_color=None,
-            bg_color=None,
-            is_bold=False,
-            has_underline=False,
-        )
+        return self.default_state()
 
     def toggle_bold(self):
         """Return a new :class:`IrcLineState` that has the ``is_bold`` flag
@@ -76,7 +138,8 @@ class IrcLineState(
 
         :rtype: :class:`IrcLineState`
         """
-        return self._replace(is_bold=not self.is_bold)
+        return self.interned(self.fg_color, self.bg_color,
+                             not self.is_bold, self.has_underline)
 
     def toggle_underline(self):
         """Return a new :class:`IrcLineState` that has the ``has_underline``
@@ -84,7 +147,8 @@ class IrcLineState(
 
         :rtype: :class:`IrcLineState`
         """
-        return self._replace(has_underline=not self.has_underline)
+        return self.interned(self.fg_color, self.bg_color,
+                             self.is_bold, not self.has_underline)
 
     def set_color(self, fg_color_id, bg_color_id=None):
         """Return a new :class:`IrcLineState` that has the updated
@@ -94,10 +158,11 @@ class IrcLineState(
         :param int bg_color_id: background text color (from [0, 15])
         :rtype: :class:`IrcLineState`
         """
-        return self._replace(
-            fg_color=fg_color_id,
-            bg_color=bg_color_id,
-        )
+        return self.interned(fg_color_id, bg_color_id,
+                             self.is_bold, self.has_underline)
+
+
+DEFAULT_STATE = IrcLineState.default_state()
 
 
 def ctrl_to_color_ids(control_code_sequence):
@@ -157,7 +222,7 @@ def split_on_nick(line):
     :returns: a tuple of the nick (or None) and the rest of the line
     :rtype: tuple of (str, str)
     """
-    match = IrcLineType.message.value.match(line)
+    match = MESSAGE_REGEX.match(line)
     if match:
         nick, message = match.groups()
     else:
@@ -165,6 +230,65 @@ def split_on_nick(line):
     return nick, message
 
 
+def parse_message_fragments(message):
+    """Split the message of an IRC log line into formatted fragments in a
+    single pass over its control codes.
+
+    :param str message: the message, without the timestamp or nick
+    :rtype: list of :class:`IrcLineFragment`
+    """
+    if not message:
+        return []
+    if message[0] != CTRL_COLOR and not CTRL_REGEX.search(message):
+        # Most messages have no formatting at all
+        return [IrcLineFragment(DEFAULT_STATE, message)]
+
+    message_fragments = []
+    fg_color_id = None
+    bg_color_id = None
+    is_bold = False
+    has_underline = False
+    # The interned state for the current formatting, looked up lazily
+    state = None
+
+    position = 0
+    end = len(message)
+    for match in chain(CTRL_REGEX.finditer(message), (None,)):
+        start = match.start() if match else end
+        if start > position:
+            text = message[position:start]
+            if text[0] == CTRL_COLOR:
+                # A color code without a color is swallowed along with the
+                # text that follows it, the same as a color code with one
+                fg_color_id, bg_color_id = ctrl_to_color_ids(text)
+                state = None
+            else:
+                if state is None:
+                    state = IrcLineState.interned(fg_color_id, bg_color_id,
+                                                  is_bold, has_underline)
+                message_fragments.append(IrcLineFragment(state, text))
+        if not match:
+            break
+
+        control_code = match.group()
+        first_char = control_code[0]
+        state = None
+        if first_char == CTRL_COLOR:
+            fg_color_id, bg_color_id = ctrl_to_color_ids(control_code)
+        elif first_char == CTRL_RESET:
+            fg_color_id = None
+            bg_color_id = None
+            is_bold = False
+            has_underline = False
+        elif first_char == CTRL_UNDERLINE:
+            has_underline = not has_underline
+        else:
+            is_bold = not is_bold
+        position = match.end()
+
+    return message_fragments
+
+
 def parse_irc_line(raw_line):
     """Parse a whole line from an IRC log into an :class:`IrcLine`.
 
@@ -175,65 +299,76 @@ def parse_irc_line(raw_line):
     """
     raw_line = raw_line.strip()
     timestamp, line = split_on_timestamp(raw_line)
-    nick = None
-    message_fragments = list()
-
-    if IrcLineType.join.value.match(line):
-        line_type = "join"
-    elif IrcLineType.part.value.match(line):
-        line_type = "part"
-    elif IrcLineType.quit.value.match(line):
-        line_type = "quit"
-    elif IrcLineType.action.value.match(line):
-        line_type = "action"
-    else:
-        line_type = "message"
-
-    line_state = IrcLineState.default_state()
-
-    if line_type is not "message":
-        fragment = IrcLineFragment(state=line_state,
-                                   text=line)
-        message_fragments.append(fragment)
-    else:
-        nick, line = split_on_nick(line)
-
-        # the CTRL_RESET char at the end makes processing the last fragment
-        # doable in the body of the 'for' loop
-        raw_fragments = tokenize_line(line) + [IrcControlCode.reset.value]
-
-        previous_state = line_state
-        previous_text = None
-        for raw_fragment in raw_fragments:
-            if not raw_fragment:
-                # blank fragments
-                continue
-            first_char = raw_fragment[0]
-
-            was_control_code = True
-            if first_char == IrcControlCode.color.value:
-                (fg_color_id, bg_color_id) = ctrl_to_color_ids(raw_fragment)
-                line_state = line_state.set_color(fg_color_id, bg_color_id)
-            elif first_char == IrcControlCode.reset.value:
-                line_state = line_state.reset()
-            elif first_char == IrcControlCode.underline.value:
-                line_state = line_state.toggle_underline()
-            elif first_char == IrcControlCode.bold.value:
-                line_state = line_state.toggle_bold()
-            else:
-                was_control_code = False
-
-            if was_control_code:
-                if previous_text:
-                    fragment = IrcLineFragment(state=previous_state,
-                                               text=previous_text)
-                    message_fragments.append(fragment)
-                previous_state = line_state
-                previous_text = None
-            else:
-                previous_text = raw_fragment
+    # Timestamps and nicks repeat a lot within a log, so share them
+    timestamp = intern(timestamp)
+
+    # Every type of line but a message starts with "*"
+    line_type = "message"
+    if line.startswith('*'):
+        if line.startswith('*** '):
+            line_type = EVENT_LINE_TYPES.get(line[4:11], "message")
+        elif ACTION_REGEX.match(line):
+            line_type = "action"
+
+    if line_type != "message":
+        fragment = IrcLineFragment(state=DEFAULT_STATE, text=line)
+        return IrcLine(timestamp=timestamp,
+                       nick=None,
+                       type=line_type,
+                       message_fragments=[fragment])
 
+    nick = None
+    if line.startswith('<'):
+        match = MESSAGE_REGEX.match(line)
+        if match:
+            nick, line = match.groups()
+            nick = intern(nick)
     return IrcLine(timestamp=timestamp,
                    nick=nick,
                    type=line_type,
-                   message_fragments=message_fragments)
+                   message_fragments=parse_message_fragments(line))
+
+
+def parse_irc_log(buffer):
+    """Generator that parses a whole IRC log at once.
+
+    Every line is classified by a single pass of :data:`LOG_LINE_REGEX` over
+    the log. Only the lines that it can't fully parse on its own, such as
+    lines with control codes, are handed to :func:`parse_irc_line`.
+
+    :param buffer: the contents of a log, whose lines are separated by
+        ``\\n``. Bytes are decoded as UTF-8, ignoring undecodable bytes.
+    :type buffer: str or bytes-like object
+    :rtype: generator of :class:`IrcLine`
+    """
+    # Building the namedtuples directly skips their Python-level __new__
+    new = tuple.__new__
+    if isinstance(buffer, str):
+        text = buffer
+    else:
+        text = str(buffer, 'utf-8', 'ignore')
+    end = len(text)
+    for match in LOG_LINE_REGEX.finditer(text):
+        timestamp, event, event_type, action, nick, message, plain, other = \
+            match.groups()
+        if other is not None:
+            if match.start() == end:
+                # The empty "line" after the log's last newline
+                break
+            yield parse_irc_line(other)
+        elif nick is not None:
+            yield new(IrcLine, (
+                intern(timestamp), intern(nick), "message",
+                [new(IrcLineFragment, (DEFAULT_STATE, message))]))
+        elif plain is not None:
+            yield new(IrcLine, (
+                intern(timestamp), None, "message",
+                [new(IrcLineFragment, (DEFAULT_STATE, plain))]))
+        elif event is not None:
+            yield new(IrcLine, (
+                intern(timestamp), None, EVENT_LINE_TYPES[event_type],
+                [new(IrcLineFragment, (DEFAULT_STATE, event))]))
+        else:
+            yield new(IrcLine, (
+                intern(timestamp), None, "action",
+                [new(IrcLineFragment, (DEFAULT_STATE, action))]))
@@ -0,0 +1,242 @@
+"""
+Byte offsets of the lines in a log file, so that any window of lines can be
+read with a single ``seek`` instead of scanning the file from the start.
+
+Indexes can be saved as sidecar files in a separate directory. ZNC only ever
+appends to a log, so when a log grows, its saved index is extended from where
+it left off instead of being rebuilt. A log that was replaced or rewritten
+instead of appended to is indexed from the start again. Each index also
+remembers the log file's inode and modification time, and the last bytes
+that it covers, to notice that.
+"""
+from array import array
+from contextlib import contextmanager
+import hashlib
+import mmap
+import os
+import re
+import struct
+
+
+# How many of the last bytes that a LineIndex covers it remembers
+TAIL_SIZE = 256
+# The sidecar header is a version marker, then the size of the log file that
+# the index covers, the file's inode and modification time, and the last
+# bytes that the index covers, padded with zeros
+SIDECAR_MAGIC = b'IRCLIDX2'
+HEADER = struct.Struct('<8sQQQ{0}s'.format(TAIL_SIZE))
+NEWLINE_REGEX = re.compile(b'\n')
+
+
+@contextmanager
+def map_log_file(f, size):
+    """Memory-map the first ``size`` bytes of an open log file, read-only.
+
+    :param f: the log file, opened in binary mode
+    :param int size: how many bytes to map
+    :return: the mapped bytes; empty files, which can't be mapped, are
+        ``b''``
+    :rtype: :class:`mmap.mmap` or bytes
+    """
+    if not size:
+        yield b''
+        return
+    data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    try:
+        yield data
+    finally:
+        data.close()
+
+
+class LineIndex(object):
+    """The starting byte offset of every line in a log file."""
+
+    def __init__(self, offsets=None, size=0, ino=None, mtime_ns=None,
+                 tail=b''):
+        """
+        :param offsets: the offset of the first line (always 0), followed by
+            the offset just past every newline
+        :type offsets: :class:`array.array` of type ``'Q'``
+        :param int size: how many bytes of the file the offsets cover
+        :param ino: the file's inode when it was indexed
+        :type ino: int or None
+        :param mtime_ns: the file's modification time when it was indexed,
+            in nanoseconds
+        :type mtime_ns: int or None
+        :param bytes tail: the last bytes (up to ``TAIL_SIZE``) of the
+            ``size`` bytes that the offsets cover
+        """
+        self.offsets = offsets if offsets is not None else array('Q', [0])
+        self.size = size
+        self.ino = ino
+        self.mtime_ns = mtime_ns
+        self.tail = tail
+
+    @property
+    def line_count(self):
+        """The number of lines, counting a final line without a newline."""
+        if self.offsets[-1] == self.size:
+            return len(self.offsets) - 1
+        return len(self.offsets)
+
+    def byte_range(self, start, stop):
+        """Get the byte offsets that lines ``start`` through ``stop - 1``
+        span.
+
+        :param int start: index of the first line
+        :param int stop: index of the line after the last line
+        :rtype: tuple of (int, int)
+        """
+        begin = self.offsets[start]
+        if stop < len(self.offsets):
+            return begin, self.offsets[stop]
+        return begin, self.size
+
+    def covers_start_of(self, f, st):
+        """Find whether this index still covers the start of a log file, or
+        the file was replaced or rewritten since it was indexed.
+
+        :param f: the log file, opened in binary mode
+        :param os.stat_result st: the result of ``os.stat()`` of the log file
+        :rtype: bool
+        """
+        if self.size == 0:
+            return True
+        if self.ino != st.st_ino or self.size > st.st_size:
+            return False
+        if self.size == st.st_size:
+            return self.mtime_ns == st.st_mtime_ns
+        f.seek(self.size - len(self.tail))
+        return f.read(len(self.tail)) == self.tail
+
+    def extend(self, f, st):
+        """Index the bytes of ``f`` from where this index left off up to its
+        current size.
+
+        :param f: the log file, opened in binary mode
+        :param os.stat_result st: the result of ``os.stat()`` of the log file
+        """
+        with map_log_file(f, st.st_size) as data:
+            self.offsets.extend(match.end() for match
+                                in NEWLINE_REGEX.finditer(data, self.size))
+            self.tail = data[max(st.st_size - TAIL_SIZE, 0):st.st_size]
+        self.size = st.st_size
+        self.ino = st.st_ino
+        self.mtime_ns = st.st_mtime_ns
+
+    @classmethod
+    def load(cls, path):
+        """Read an index from a sidecar file.
+
+        :param str path: path to the sidecar file
+        :raises ValueError: if the sidecar file is corrupt
+        :rtype: LineIndex
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        if (len(data) < HEADER.size + 8 or
+                (len(data) - HEADER.size) % 8 or
+                not data.startswith(SIDECAR_MAGIC)):
+            raise ValueError('Line index {0} is corrupt'.format(path))
+
+        _, size, ino, mtime_ns, tail = HEADER.unpack_from(data)
+        offsets = array('Q')
+        offsets.frombytes(data[HEADER.size:])
+        return cls(offsets, size, ino, mtime_ns, tail[:min(size, TAIL_SIZE)])
+
+    def save(self, path):
+        """Atomically write this index to a sidecar file.
+
+        :param str path: path to the sidecar file
+        """
+        temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(SIDECAR_MAGIC, self.size, self.ino or 0,
+                                self.mtime_ns or 0, self.tail))
+            f.write(self.offsets.tobytes())
+        os.replace(temp_path, path)
+
+    def __repr__(self):
+        return '<LineIndex lines={0} size={1}>'.format(self.line_count,
+                                                        self.size)
+
+
+def sidecar_path(index_directory, log_path):
+    """Get where the sidecar index for ``log_path`` is stored.
+
+    :param str index_directory: the directory that holds sidecar files
+    :param str log_path: path to a log file
+    :rtype: str
+    """
+    digest = hashlib.sha1(os.fsencode(log_path)).hexdigest()
+    return os.path.join(index_directory, digest + '.lines')
+
+
+def get_line_index(log_path, index_directory=None):
+    """Get an up-to-date :class:`LineIndex` for ``log_path``.
+
+    If ``index_directory`` is given, the saved index is loaded from there and
+    extended to cover anything appended since, and the result is saved back.
+    A saved index of a log that was replaced or rewritten is rebuilt.
+
+    :param str log_path: path to a log file
+    :param index_directory: (optional) the directory that holds sidecar files
+    :type index_directory: str or None
+    :rtype: LineIndex
+    """
+    index = None
+    sidecar = None
+    if index_directory:
+        sidecar = sidecar_path(index_directory, log_path)
+        try:
+            index = LineIndex.load(sidecar)
+        except (FileNotFoundError, ValueError):
+            index = None
+
+    with open(log_path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if index is None or not index.covers_start_of(f, st):
+            # No index yet, or the log was replaced or rewritten and has to
+            # be re-indexed
+            index = LineIndex()
+        elif index.size == st.st_size:
+            return index
+        index.extend(f, st)
+
+    if sidecar:
+        os.makedirs(index_directory, exist_ok=True)
+        index.save(sidecar)
+    return index
+
+
+def decode_log_bytes(data, begin, end):
+    """Decode part of a log as UTF-8, ignoring undecodable bytes, without
+    copying the raw bytes first.
+
+    :param data: the log's bytes, e.g. from :func:`map_log_file`
+    :type data: :class:`mmap.mmap` or bytes
+    :param int begin: the offset of the first byte to decode
+    :param int end: the offset after the last byte to decode
+    :rtype: str
+    """
+    with memoryview(data) as view, view[begin:end] as part:
+        return str(part, 'utf-8', 'ignore')
+
+
+def read_text(log_path, index, start, stop):
+    """Read lines ``start`` through ``stop - 1`` of a log file, without
+    reading or decoding any of the other lines.
+
+    :param str log_path: path to a log file
+    :param LineIndex index: the index of ``log_path``
+    :param int start: index of the first line to read
+    :param int stop: index of the line after the last line to read
+    :return: the lines, decoded as UTF-8 with undecodable bytes ignored
+    :rtype: str
+    """
+    if start >= stop:
+        return ''
+
+    begin, end = index.byte_range(start, stop)
+    with open(log_path, 'rb') as f, map_log_file(f, end) as data:
+        return decode_log_bytes(data, begin, end)
@@ -0,0 +1,238 @@
+"""
+Pushes the lines that are appended to logs to everyone who is following them.
+
+Each process has one watcher thread that polls every log with at least one
+subscriber, so following a log costs one ``stat`` per poll no matter how many
+browsers are connected. New lines are read and encoded once, then handed to
+every subscriber's queue.
+
+Under gunicorn, an async worker class (e.g. ``worker_class = "gevent"``)
+has to be used, since every subscriber holds a connection open, so following
+logs this way is off unless ``LIVE_TAIL_SSE`` is set. With gevent's monkey
+patching, the watcher thread and the queues become greenlet-friendly.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+from irclogviewer.logs.line_index import map_log_file
+
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription(object):
+    """A subscriber's queue of ``(start offset, end offset, payload)``
+    messages for one log."""
+
+    def __init__(self, path, offset):
+        """
+        :param str path: path to the log being followed
+        :param int offset: the byte offset the subscriber has read up to
+        """
+        self.path = path
+        self.offset = offset
+        self.messages = queue.Queue()
+
+    def get(self, timeout):
+        """Wait up to ``timeout`` seconds for the next payload that the
+        subscriber hasn't seen yet.
+
+        :param float timeout: seconds to wait
+        :return: the payload, or None on timeout
+        :rtype: str or None
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                start, end, payload = self.messages.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if end > self.offset:
+                self.offset = end
+                return payload
+
+    def __repr__(self):
+        return '<Subscription path={path} offset={offset}>'.format(
+            **self.__dict__)
+
+
+class FollowedLog(object):
+    """A log that has at least one subscriber."""
+
+    def __init__(self, offset):
+        self.offset = offset
+        self.subscriptions = set()
+
+
+class LogTailer(object):
+    """Watches logs for appended lines and fans them out to subscribers."""
+
+    def __init__(self, encode_lines, poll_interval=1.0):
+        """
+        :param encode_lines: called with a list of new lines and the offset
+            after them; returns the payload that is sent to subscribers
+        :type encode_lines: callable
+        :param float poll_interval: seconds between checks for new lines
+        """
+        self.encode_lines = encode_lines
+        self.poll_interval = poll_interval
+        # maps from log path -> FollowedLog
+        self._logs = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, path, offset):
+        """Start following a log from byte ``offset``.
+
+        :param str path: path to a log file
+        :param int offset: the byte offset the subscriber has read up to
+        :rtype: Subscription
+        """
+        subscription = Subscription(path, offset)
+        with self._lock:
+            followed = self._logs.get(path)
+            if followed is None:
+                followed = self._logs[path] = FollowedLog(offset)
+            elif offset > followed.offset:
+                # The subscriber has already seen lines that the watcher
+                # hasn't read yet, so hand those to everyone else first
+                message = self._read_appended(path, followed)
+                if message is not None:
+                    for other_subscription in followed.subscriptions:
+                        other_subscription.messages.put(message)
+            if offset < followed.offset:
+                # Catch the subscriber up to everyone else
+                lines, end = read_whole_lines(path, offset, followed.offset)
+                if lines:
+                    subscription.messages.put(
+                        (offset, end, self.encode_lines(lines, end)))
+            followed.subscriptions.add(subscription)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='log-tailer',
+                                                daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stop following a log.
+
+        :param Subscription subscription: from :meth:`subscribe`
+        """
+        with self._lock:
+            followed = self._logs.get(subscription.path)
+            if followed is None:
+                return
+            followed.subscriptions.discard(subscription)
+            if not followed.subscriptions:
+                del self._logs[subscription.path]
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(followed.subscriptions)
+                       for followed in self._logs.values())
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                followed_logs = list(self._logs.items())
+            for path, followed in followed_logs:
+                try:
+                    self._poll(path, followed)
+                except Exception:
+                    logger.exception('Could not follow %s', path)
+
+    def _poll(self, path, followed):
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            return
+        if size == followed.offset:
+            return
+
+        with self._lock:
+            message = self._read_appended(path, followed)
+            subscriptions = list(followed.subscriptions)
+        if message is None:
+            return
+        for subscription in subscriptions:
+            subscription.messages.put(message)
+
+    def _read_appended(self, path, followed):
+        """Read the lines appended to a followed log since it was last read.
+        The caller must hold ``self._lock``.
+
+        :return: the message for the subscribers, or None if there are no
+            new lines
+        :rtype: tuple of (int, int, str) or None
+        """
+        start = followed.offset
+        lines, end = read_whole_lines(path, start)
+        if end < start:
+            # The log was truncated, so follow it from the start
+            lines, end = read_whole_lines(path, 0)
+            start = 0
+        followed.offset = end
+        if not lines:
+            return None
+        return start, end, self.encode_lines(lines, end)
+
+    def __repr__(self):
+        return '<LogTailer logs={0}>'.format(len(self._logs))
+
+
+def read_whole_lines(path, start, stop=None):
+    """Read the whole lines of a log between two byte offsets.
+
+    If ``start`` is in the middle of a line, the rest of that line is
+    skipped, since the subscriber has already seen its beginning.
+
+    :param str path: path to a log file
+    :param int start: the byte offset to start reading at
+    :param stop: (optional) the byte offset to stop reading at, which is the
+        end of the file by default
+    :type stop: int or None
+    :return: the lines that were read, and the offset just past them. If the
+        file is shorter than ``start``, the offset is its size.
+    :rtype: tuple of (list of str, int)
+    """
+    with open(path, 'rb') as f:
+        if start > 0:
+            f.seek(start - 1)
+            data = f.read() if stop is None else f.read(stop - start + 1)
+            if not data:
+                return [], os.fstat(f.fileno()).st_size
+            skip = 1 if data[0:1] == b'\n' else data.find(b'\n') + 1
+            if skip == 0:
+                return [], start
+            data = data[skip:]
+            start += skip - 1
+        else:
+            data = f.read() if stop is None else f.read(stop)
+
+    whole_size = data.rfind(b'\n') + 1
+    lines = [line.decode('utf-8', 'ignore')
+             for line in data[:whole_size].splitlines()]
+    return lines, start + whole_size
+
+
+def find_end_of_whole_lines(path, size):
+    """Find where the whole lines of a log end, so that following the log
+    doesn't start partway through a line that ZNC hasn't finished writing.
+
+    :param str path: path to a log file
+    :param int size: how many bytes of the log to look at
+    :return: the offset just past the last newline, or 0 if there is none
+    :rtype: int
+    """
+    with open(path, 'rb') as f, map_log_file(f, size) as data:
+        return data.rfind(b'\n') + 1
@@ -0,0 +1,235 @@
+"""
+A cache of parsed logs, so that popular logs aren't re-read and re-parsed by
+:func:`~irclogviewer.logs.irc_parser.parse_irc_log` on every request.
+
+Parsed logs are kept in memory with least-recently-used eviction. They can
+also be pickled into a directory that every worker process shares. Entries
+are keyed by a log's path, modification time and size, so a log that has
+changed is never served from the cache.
+
+Logs whose parsed lines wouldn't fit in the memory budget aren't cached at
+all, not even on disk, since loading them back would take that much memory.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import threading
+
+from irclogviewer.logs.irc_parser import parse_irc_log
+
+
+# Roughly how much memory a parsed line takes up besides its text: the
+# IrcLine, its fragments and their strings
+PARSED_LINE_OVERHEAD = 320
+
+
+def cache_key(path, st):
+    """Get the cache key of a version of a log file.
+
+    :param str path: path to a log file
+    :param os.stat_result st: the result of ``os.stat(path)``
+    :rtype: tuple of (str, int, int)
+    """
+    return path, st.st_mtime_ns, st.st_size
+
+
+def estimate_parsed_size(log_size, line_count):
+    """Estimate how much memory the parsed lines of a log take up.
+
+    :param int log_size: the size of the log file in bytes
+    :param int line_count: how many lines the log has
+    :rtype: int
+    """
+    return log_size + PARSED_LINE_OVERHEAD * line_count
+
+
+class ParsedLogCache(object):
+    """Parsed lines of log files, with a memory budget and an optional
+    on-disk tier that has its own size limit.
+
+    The memory budget is counted in :func:`estimate_parsed_size`, which is
+    several times the size of the log files.
+    """
+
+    def __init__(self, max_size, directory=None,
+                 max_disk_size=256 * 1024 * 1024):
+        """
+        :param int max_size: roughly how many bytes of memory the parsed
+            lines that are kept may take up, or 0 to disable the cache
+        :param directory: (optional) where pickled logs are shared between
+            processes
+        :type directory: str or None
+        :param int max_disk_size: (optional) the total size in bytes of the
+            pickled logs in ``directory``. The least recently used ones are
+            removed to stay within it.
+        """
+        self.max_size = max_size
+        self.directory = directory
+        self.max_disk_size = max_disk_size
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # maps from cache key -> tuple of (list of IrcLine, its estimated
+        # size), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pickle_path(self, path):
+        digest = hashlib.sha1(os.fsencode(path)).hexdigest()
+        return os.path.join(self.directory, digest + '.pickle')
+
+    def _load_pickle(self, key):
+        pickle_path = self._pickle_path(key[0])
+        try:
+            with open(pickle_path, 'rb') as f:
+                pickled_key, lines = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if pickled_key != key:
+            return None
+        try:
+            # Mark the pickle as recently used, for _prune_directory
+            os.utime(pickle_path)
+        except OSError:
+            pass
+        return lines
+
+    def _save_pickle(self, key, lines):
+        os.makedirs(self.directory, exist_ok=True)
+        pickle_path = self._pickle_path(key[0])
+        temp_path = '{0}.{1}.tmp'.format(pickle_path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            pickle.dump((key, lines), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, pickle_path)
+        self._prune_directory()
+
+    def _prune_directory(self):
+        """Remove the least recently used pickles until the ones that are
+        left are within ``max_disk_size``."""
+        pickles = []
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pickle'):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            pickles.append((st.st_mtime, st.st_size, entry.path))
+            total_size += st.st_size
+
+        pickles.sort()
+        for _, size, pickle_path in pickles:
+            if total_size <= self.max_disk_size:
+                break
+            try:
+                os.remove(pickle_path)
+            except FileNotFoundError:
+                # Another process removed it first
+                pass
+            total_size -= size
+
+    def _remember(self, key, lines):
+        """Keep ``lines`` in memory, evicting the least recently used logs
+        to stay within the memory budget."""
+        cost = estimate_parsed_size(key[2], len(lines))
+        if cost > self.max_size:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = lines, cost
+            self.size += cost
+            while self.size > self.max_size:
+                _, (_, evicted_cost) = self._entries.popitem(last=False)
+                self.size -= evicted_cost
+
+    def get(self, key):
+        """Get the parsed lines of a log from memory or from disk.
+
+        :param tuple key: from :func:`cache_key`
+        :return: the parsed lines, or None if they aren't cached
+        :rtype: list of :class:`~irclogviewer.logs.irc_parser.IrcLine` or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self.directory:
+            lines = self._load_pickle(key)
+            if lines is not None:
+                self.disk_hits += 1
+                self._remember(key, lines)
+                return lines
+        return None
+
+    def put(self, key, lines):
+        """Cache the parsed lines of a log.
+
+        :param tuple key: from :func:`cache_key`
+        :param lines: the parsed lines of the log
+        :type lines: list of :class:`~irclogviewer.logs.irc_parser.IrcLine`
+        """
+        if estimate_parsed_size(key[2], len(lines)) > self.max_size:
+            return
+        self._remember(key, lines)
+        if self.directory:
+            self._save_pickle(key, lines)
+
+    def iter_lines(self, key, buffer):
+        """Iterate over the parsed lines of a log.
+
+        On a miss, the lines in ``buffer`` are parsed as they are consumed,
+        and all of them are cached once the last one has been parsed. They
+        are only kept until then if they fit in the memory budget.
+
+        :param tuple key: from :func:`cache_key`
+        :param buffer: the contents of the version of the log that ``key``
+            refers to
+        :type buffer: str or bytes-like object
+        :rtype: iterator of :class:`~irclogviewer.logs.irc_parser.IrcLine`
+        """
+        lines = self.get(key)
+        if lines is not None:
+            return iter(lines)
+        with self._lock:
+            self.misses += 1
+        return self._parse_and_put(key, buffer)
+
+    def _parse_and_put(self, key, buffer):
+        # the most lines that the log can have and still fit in the budget
+        max_line_count = (self.max_size - key[2]) // PARSED_LINE_OVERHEAD
+        lines = [] if max_line_count >= 0 else None
+        for irc_line in parse_irc_log(buffer):
+            if lines is not None:
+                lines.append(irc_line)
+                if len(lines) > max_line_count:
+                    # It can't be cached, so don't hold on to its lines
+                    lines = None
+            yield irc_line
+        if lines is not None:
+            self.put(key, lines)
+
+    def stats(self):
+        """Get this process's cache counters.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_size': self.max_size,
+            }
+
+    def __repr__(self):
+        return '<ParsedLogCache entries={0} size={1}>'.format(
+            len(self._entries), self.size)
@@ -0,0 +1,293 @@
+"""
+Searches the raw log files with a regular expression, for the searches that
+the full-text index of :mod:`~irclogviewer.logs.search_index` can't answer.
+
+Each search starts its own worker processes, which scan one whole log file at
+a time. The regular expression is run over the bytes of a log after its
+control codes are stripped, so it sees the same text as the browser, and only
+the lines that match are decoded and parsed.
+
+A search stops once it has found enough lines, or once it has used up its
+budgets of wall-clock time and CPU time, so that one slow regular expression
+can't tie up a web worker or the machine. The worker processes are killed
+then, even if they are in the middle of a file.
+
+The workers are driven through one-way pipes instead of a
+:class:`multiprocessing.Pool`, whose background threads block gevent's event
+loop when gunicorn's gevent worker class is used. Two-way pipes are sockets,
+which gevent makes non-blocking.
+"""
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import re
+import signal
+import time
+
+import psutil
+
+from irclogviewer.logs.irc_parser import parse_irc_line
+from irclogviewer.logs.line_index import map_log_file
+from irclogviewer.logs.search_index import SearchHit
+
+
+# Matches the color codes that irc_parser.CTRL_REGEX does, plus color codes
+# without a color, which the parser swallows along with the text after them.
+# Since it starts with a literal, it is found as quickly as bytes.find.
+COLOR_BYTES_REGEX = re.compile(rb'\x03(?:\d{1,2},?(?:\d{1,2})?)?')
+# The rest of the control codes, which bytes.translate deletes
+CTRL_BYTES = b'\x02\x0f\x1f'
+
+
+def compile_pattern(pattern):
+    """Compile a regular expression typed into the search box so that it can
+    be run over the bytes of a log.
+
+    Since it runs over bytes, classes like ``\\w`` and ``(?i)`` only know
+    about ASCII characters.
+
+    :param str pattern: a regular expression
+    :raises re.error: if ``pattern`` isn't a valid regular expression
+    :rtype: compiled regular expression of bytes
+    """
+    return re.compile(pattern.encode('utf-8'), re.MULTILINE)
+
+
+def scan_log_file(task):
+    """Find the lines of a log that match a regular expression. This is what
+    a search's worker processes run, so it must not touch the database.
+
+    :param tuple task: the user, channel, date, and path of the log; the
+        regular expression; the nick that lines must be by, or None; and the
+        most lines to find
+    :return: the lines that were found
+    :rtype: list of :class:`SearchHit`
+    """
+    user, channel, date, path, pattern, nick, limit = task
+    regex = compile_pattern(pattern)
+
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            with map_log_file(f, size) as data:
+                # Line numbers don't change, since no newlines are stripped.
+                # This is several times faster than one regular expression
+                # that matches every control code.
+                text = COLOR_BYTES_REGEX.sub(b'', data).translate(
+                    None, CTRL_BYTES)
+    except OSError:
+        return []
+
+    hits = []
+    line_number = 1
+    # The offset that line_number is the number of the line at
+    counted = 0
+    position = 0
+    while len(hits) < limit and position <= len(text):
+        match = regex.search(text, position)
+        if not match:
+            break
+        if match.start() == len(text) and text.endswith(b'\n'):
+            # There is no line after the log's last newline
+            break
+        line_start = text.rfind(b'\n', 0, match.start()) + 1
+        line_end = text.find(b'\n', match.start())
+        if line_end < 0:
+            line_end = len(text)
+        # Only the first match of each line is needed
+        position = line_end + 1
+        line_number += text.count(b'\n', counted, line_start)
+        counted = line_start
+
+        line = text[line_start:line_end].decode('utf-8', 'ignore')
+        try:
+            irc_line = parse_irc_line(line)
+        except ValueError:
+            # Not a line that ZNC wrote, but it still matched
+            timestamp, line_nick, message = '', None, line
+        else:
+            timestamp = irc_line.timestamp
+            line_nick = irc_line.nick
+            message = ''.join(fragment.text
+                              for fragment in irc_line.message_fragments)
+        if nick and line_nick != nick:
+            continue
+        hits.append(SearchHit(None, user, channel, date, path, line_number,
+                              timestamp, line_nick, message))
+
+    return hits
+
+
+def serve_scans(tasks, results):
+    """Scan the logs whose tasks are received over ``tasks``, and send back
+    what :func:`scan_log_file` finds over ``results``, until None is
+    received. This is the body of a search's worker processes.
+
+    :type tasks: :class:`multiprocessing.connection.Connection`
+    :type results: :class:`multiprocessing.connection.Connection`
+    """
+    # Workers are forked from web workers, whose SIGTERM handlers would keep
+    # them from being terminated
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    while True:
+        task = tasks.recv()
+        if task is None:
+            return
+        results.send(scan_log_file(task))
+
+
+# How often the CPU time of a search's worker processes is added up
+BUDGET_CHECK_SECONDS = 0.25
+
+
+class RegexSearch(object):
+    """An iterable of the lines of some logs that match a regular expression.
+
+    The logs are scanned in the order they are given, and lines are yielded
+    in that order as soon as they are found. Once iteration is over,
+    :attr:`stopped` tells why.
+    """
+
+    # Values of stopped
+    FINISHED = 'finished'
+    FOUND_ENOUGH = 'found enough'
+    OUT_OF_TIME = 'out of time'
+    OUT_OF_CPU_TIME = 'out of CPU time'
+
+    def __init__(self, pattern, log_files, nick=None, limit=100, processes=2,
+                 seconds=10.0, cpu_seconds=20.0):
+        """
+        :param str pattern: a regular expression that
+            :func:`compile_pattern` accepts
+        :param log_files: the user, channel, date, and path of each log to
+            scan, in the order their lines should be found in
+        :type log_files: list of tuple
+        :param nick: (optional) only find lines by this nick
+        :type nick: str or None
+        :param int limit: the most lines to find
+        :param int processes: how many worker processes scan logs
+        :param float seconds: how long the search may take
+        :param float cpu_seconds: how much CPU time the worker processes may
+            use between them
+        """
+        self.pattern = pattern
+        self.log_files = log_files
+        self.nick = nick
+        self.limit = limit
+        self.processes = processes
+        self.seconds = seconds
+        self.cpu_seconds = cpu_seconds
+
+        self.stopped = None
+        self.files_scanned = 0
+        self.cpu_time = 0.0
+
+    def _get_cpu_time(self, workers):
+        """Add up the CPU time that the worker processes have used so far.
+
+        :param workers: the worker processes
+        :type workers: list of :class:`multiprocessing.Process`
+        :rtype: float
+        """
+        cpu_time = 0.0
+        for worker in workers:
+            try:
+                cpu_times = psutil.Process(worker.pid).cpu_times()
+            except psutil.NoSuchProcess:
+                continue
+            cpu_time += cpu_times.user + cpu_times.system
+        return cpu_time
+
+    def __iter__(self):
+        deadline = time.monotonic() + self.seconds
+        tasks = [(user, channel, date, path, self.pattern, self.nick,
+                  self.limit)
+                 for user, channel, date, path in self.log_files]
+        if not tasks:
+            self.stopped = self.FINISHED
+            return
+
+        workers = []
+        # maps from the connection that each worker sends results over ->
+        # the connection that it is sent tasks over
+        task_connections = {}
+        try:
+            for _ in range(min(self.processes, len(tasks))):
+                task_reader, task_writer = multiprocessing.Pipe(False)
+                result_reader, result_writer = multiprocessing.Pipe(False)
+                worker = multiprocessing.Process(
+                    target=serve_scans,
+                    args=(task_reader, result_writer),
+                    daemon=True)
+                worker.start()
+                task_reader.close()
+                result_writer.close()
+                workers.append(worker)
+                task_connections[result_reader] = task_writer
+
+            # maps from the connection that a worker sends results over ->
+            # the index of the task it is on
+            busy = {}
+            # maps from task index -> the lines found in logs that were
+            # scanned ahead of the next log whose lines are yielded
+            scanned = {}
+            next_task = 0
+
+            def send_next_task(connection):
+                nonlocal next_task
+                if next_task < len(tasks):
+                    task_connections[connection].send(tasks[next_task])
+                    busy[connection] = next_task
+                    next_task += 1
+
+            for connection in task_connections:
+                send_next_task(connection)
+
+            found = 0
+            checked_at = time.monotonic()
+            while self.files_scanned < len(tasks):
+                hits = scanned.pop(self.files_scanned, None)
+                if hits is not None:
+                    self.files_scanned += 1
+                    for hit in hits[:self.limit - found]:
+                        found += 1
+                        yield hit
+                    if found >= self.limit:
+                        self.stopped = self.FOUND_ENOUGH
+                        return
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stopped = self.OUT_OF_TIME
+                    return
+                for connection in wait(list(busy),
+                                       min(remaining, BUDGET_CHECK_SECONDS)):
+                    scanned[busy.pop(connection)] = connection.recv()
+                    send_next_task(connection)
+
+                if time.monotonic() - checked_at >= BUDGET_CHECK_SECONDS:
+                    checked_at = time.monotonic()
+                    self.cpu_time = self._get_cpu_time(workers)
+                    if self.cpu_time >= self.cpu_seconds:
+                        self.stopped = self.OUT_OF_CPU_TIME
+                        return
+            self.stopped = self.FINISHED
+        finally:
+            # Whatever the workers are still scanning is no longer needed
+            self.cpu_time = self._get_cpu_time(workers)
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                # A blocking join waits on gevent's SIGCHLD watcher, which
+                # never fires in gunicorn's gevent workers, so wait for the
+                # worker to exit and then reap it without blocking
+                wait([worker.sentinel])
+                worker.join(0)
+            for result_reader, task_writer in task_connections.items():
+                result_reader.close()
+                task_writer.close()
+
+    def __repr__(self):
+        return '<RegexSearch pattern={0!r} logs={1}>'.format(
+            self.pattern, len(self.log_files))
@@ -0,0 +1,100 @@
+"""
+A cache of the rendered HTML of logs.
+
+Each cached log remembers how many bytes of the log file its HTML covers.
+ZNC only ever appends to a log, so when today's log grows, only the lines
+appended since then are parsed and rendered, and their HTML is added to the
+end of the cached HTML. Logs that are no longer written to are served
+entirely from the cache.
+
+A log that was replaced or rewritten instead of appended to is rendered from
+the start again. Each cached log also remembers the log file's inode and
+modification time, and the last bytes that its HTML covers, to notice that.
+"""
+from collections import namedtuple, OrderedDict
+import threading
+
+
+# How many of the last bytes that a RenderedLog covers it remembers
+TAIL_SIZE = 256
+
+# The rendered HTML of the first ``line_count`` lines of a log, which take up
+# the first ``size`` bytes of the log file and end with the bytes ``tail``.
+# ``ino`` and ``mtime_ns`` are from the os.stat() of the log file then.
+RenderedLog = namedtuple('RenderedLog', ['size', 'line_count', 'html',
+                                         'ino', 'mtime_ns', 'tail'])
+
+EMPTY_RENDERED_LOG = RenderedLog(0, 0, '', None, None, b'')
+
+
+def covers_start_of(rendered_log, st, data):
+    """Find whether the HTML of a log still covers the start of the log file,
+    or the file was replaced or rewritten since it was rendered.
+
+    :param RenderedLog rendered_log: the rendered log
+    :param os.stat_result st: the result of ``os.stat()`` of the log file
+    :param data: the first ``st.st_size`` bytes of the log file
+    :type data: bytes-like object
+    :rtype: bool
+    """
+    if rendered_log.size == 0:
+        return True
+    if rendered_log.ino != st.st_ino or rendered_log.size > st.st_size:
+        return False
+    if rendered_log.size == st.st_size:
+        return rendered_log.mtime_ns == st.st_mtime_ns
+    start = rendered_log.size - len(rendered_log.tail)
+    return data[start:rendered_log.size] == rendered_log.tail
+
+
+class RenderedLogCache(object):
+    """The rendered HTML of logs, keyed by path, with least-recently-used
+    eviction."""
+
+    def __init__(self, max_size):
+        """
+        :param int max_size: the total length of the HTML that is kept in
+            memory, or 0 to disable the cache
+        """
+        self.max_size = max_size
+        self.size = 0
+        # maps from log path -> RenderedLog, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Get the rendered HTML of a log.
+
+        :param str path: path to a log file
+        :return: the rendered log, or an empty one if it isn't cached
+        :rtype: RenderedLog
+        """
+        with self._lock:
+            rendered_log = self._entries.get(path)
+            if rendered_log is None:
+                return EMPTY_RENDERED_LOG
+            self._entries.move_to_end(path)
+            return rendered_log
+
+    def put(self, path, rendered_log):
+        """Cache the rendered HTML of a log, replacing the HTML it had before.
+
+        :param str path: path to a log file
+        :param RenderedLog rendered_log: the rendered log
+        """
+        cost = len(rendered_log.html)
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self.size -= len(previous.html)
+            if cost > self.max_size:
+                return
+            self._entries[path] = rendered_log
+            self.size += cost
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.html)
+
+    def __repr__(self):
+        return '<RenderedLogCache entries={0} size={1}>'.format(
+            len(self._entries), self.size)
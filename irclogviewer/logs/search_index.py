@@ -0,0 +1,185 @@
+"""
+Full-text search over every log, backed by the ``search_lines`` table and its
+SQLite FTS5 index, ``search_index``.
+
+The crawler adds the lines of each log with :func:`read_search_lines` as the
+log grows, so a search only looks at the index and never reads a log.
+"""
+from collections import namedtuple
+import os
+
+from sqlalchemy import and_, func, literal_column, select
+from sqlalchemy.sql import column, table
+
+from irclogviewer.logs.authorization import readable_channels_clause
+from irclogviewer.logs.irc_parser import parse_irc_log
+from irclogviewer.logs.line_index import decode_log_bytes, map_log_file
+from irclogviewer.models import db, IrcLog, IrcSearchFile, IrcSearchLine
+
+
+# Joins, parts, and quits aren't worth searching
+SEARCHABLE_LINE_TYPES = frozenset(['message', 'action'])
+
+# The FTS5 table from irclogviewer.models.create_search_index. It isn't part
+# of the models' metadata, so that create_all doesn't make it a plain table.
+search_index = table('search_index', column('rowid'))
+
+SearchHit = namedtuple('SearchHit', ['id', 'user', 'channel', 'date', 'path',
+                                     'line_number', 'timestamp', 'nick',
+                                     'message'])
+
+
+def read_search_lines(path, start, first_line_number):
+    """Parse the whole lines of a log that come after byte ``start`` into
+    rows for :class:`~irclogviewer.models.IrcSearchLine`.
+
+    :param str path: path to a log file
+    :param int start: the byte offset of the first line to read
+    :param int first_line_number: the line number of the line at ``start``
+    :return: tuples of the line number, timestamp, nick, and text of each
+        searchable line; the byte offset after the last whole line; and how
+        many whole lines were read
+    :rtype: tuple of (list of tuple, int, int)
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        with map_log_file(f, size) as data:
+            # ZNC may be partway through writing the last line
+            end = max(data.rfind(b'\n', start) + 1, start)
+            text = decode_log_bytes(data, start, end)
+
+    search_lines = []
+    for line_number, irc_line in enumerate(parse_irc_log(text),
+                                           first_line_number):
+        if irc_line.type not in SEARCHABLE_LINE_TYPES:
+            continue
+        message = ''.join(fragment.text
+                          for fragment in irc_line.message_fragments)
+        if message:
+            search_lines.append(
+                (line_number, irc_line.timestamp, irc_line.nick, message))
+    return search_lines, end, text.count('\n')
+
+
+def quote_phrase(text):
+    """Quote text as an FTS5 phrase, so that FTS5 operators and punctuation
+    in it are searched for literally instead of causing syntax errors.
+
+    :param str text: the text to search for
+    :rtype: str
+    """
+    return '"{0}"'.format(text.replace('"', '""'))
+
+
+def make_match_expression(terms, nick=None):
+    """Turn what was typed into the search box into an FTS5 query that
+    matches lines with every one of the words in it.
+
+    :param str terms: words separated by whitespace
+    :param nick: (optional) the nick that the lines must be by. It narrows
+        down the lines inside of the full-text index, but since the index
+        ignores case and punctuation, the nick still has to be compared
+        exactly afterwards.
+    :type nick: str or None
+    :rtype: str
+    """
+    phrases = ['message : ' + quote_phrase(word) for word in terms.split()]
+    # A nick without any letters or digits has nothing in the index
+    if phrases and nick and any(char.isalnum() for char in nick):
+        phrases.append('nick : ' + quote_phrase(nick))
+    return ' '.join(phrases)
+
+
+def search_logs(email, terms=None, nick=None, user=None, channel=None,
+                start_date=None, end_date=None, before=None, limit=100):
+    """Find the lines that contain every word of ``terms``, newest first.
+
+    Lines are returned in the order they were indexed, which is the order of
+    their dates within each user's channels. Paging through the results with
+    ``before`` walks the index from that point, so later pages are as quick
+    as the first.
+
+    :param email: e-mail address of the web user, who only finds lines in
+        the channels that ``ZNC_ACL`` lets them read
+    :type email: str or None
+    :param terms: (optional) words that every line must contain
+    :type terms: str or None
+    :param nick: (optional) only find lines by this nick
+    :type nick: str or None
+    :param user: (optional) only find lines in this ZNC user's logs
+    :type user: str or None
+    :param channel: (optional) only find lines in this channel
+    :type channel: str or None
+    :param start_date: (optional) the earliest date to find lines from
+    :type start_date: :class:`datetime.date` or None
+    :param end_date: (optional) the latest date to find lines from
+    :type end_date: :class:`datetime.date` or None
+    :param before: (optional) only find lines indexed before the hit with
+        this ID, i.e. the last hit of the previous page
+    :type before: int or None
+    :param int limit: the most hits to return
+    :rtype: list of :class:`SearchHit`
+    """
+    match_expression = make_match_expression(terms or '', nick)
+    if not (match_expression or nick):
+        return []
+
+    lines = IrcSearchLine.__table__
+    files = IrcSearchFile.__table__
+    logs = IrcLog.__table__
+    if match_expression:
+        # The full-text index drives the query and yields rowids in
+        # descending order, so it stops as soon as there are enough hits
+        line_id = search_index.c.rowid
+        from_clause = search_index.join(lines, lines.c.id == line_id)
+    else:
+        line_id = lines.c.id
+        from_clause = lines
+    # The path of each hit's log comes from irclogs
+    from_clause = from_clause.join(logs, and_(
+        logs.c.user == lines.c.user,
+        logs.c.channel == lines.c.channel,
+        logs.c.date == lines.c.date))
+
+    query = select([line_id,
+                    lines.c.user,
+                    lines.c.channel,
+                    lines.c.date,
+                    logs.c.path,
+                    lines.c.line_number,
+                    lines.c.timestamp,
+                    lines.c.nick,
+                    lines.c.message])\
+        .select_from(from_clause)\
+        .where(readable_channels_clause(email, lines.c.user, lines.c.channel))\
+        .order_by(line_id.desc())\
+        .limit(limit)
+
+    if match_expression:
+        query = query.where(
+            literal_column('search_index').match(match_expression))
+    if nick:
+        query = query.where(lines.c.nick == nick)
+    if user:
+        query = query.where(lines.c.user == user)
+    if channel:
+        query = query.where(lines.c.channel == channel)
+    # Dates are also turned into bounds on the lines' IDs, which the
+    # full-text index can jump to instead of checking the date of every
+    # line that matches outside of the range
+    if start_date:
+        first_id = select([func.min(files.c.first_id)])\
+            .where(files.c.date >= start_date)\
+            .as_scalar()
+        query = query.where(lines.c.date >= start_date)\
+                     .where(line_id >= first_id)
+    if end_date:
+        last_id = select([func.max(files.c.last_id)])\
+            .where(files.c.date <= end_date)\
+            .as_scalar()
+        query = query.where(lines.c.date <= end_date)\
+                     .where(line_id <= last_id)
+    if before is not None:
+        query = query.where(line_id < before)
+
+    return [SearchHit(*row) for row in db.session.execute(query)]
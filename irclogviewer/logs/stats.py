@@ -0,0 +1,242 @@
+"""
+How active each channel is: messages per nick, per hour of the day, and per
+day, and joins, parts, and quits over time.
+
+The crawler counts the lines of each log with :func:`read_log_stats` as the
+log grows, and adds the counts up per month, so a stats page only looks at
+those counts and never reads a log.
+"""
+from collections import Counter, namedtuple
+from operator import itemgetter
+import os
+
+from sqlalchemy import func
+
+from irclogviewer.dates import month_bounds
+from irclogviewer.logs.irc_parser import parse_irc_log
+from irclogviewer.logs.line_index import decode_log_bytes, map_log_file
+from irclogviewer.models import (
+    db,
+    IrcStatsFile,
+    IrcStatsMonth,
+    IrcStatsMonthHour,
+    IrcStatsMonthNick,
+)
+
+
+# maps from line type -> the column of IrcStatsFile and IrcStatsMonth that
+# counts lines of that type
+LINE_TYPE_COLUMNS = {
+    'message': 'messages',
+    'action': 'actions',
+    'join': 'joins',
+    'part': 'parts',
+    'quit': 'quits',
+}
+
+# How many messages and actions a nick or an hour of the day has
+ActivityCount = namedtuple('ActivityCount', ['key', 'messages', 'actions'])
+
+
+def timestamp_hour(timestamp):
+    """Get the hour of the day from the timestamp of a line.
+
+    :param str timestamp: a timestamp like ``13:37:00``, or its start
+    :return: the hour, or None if the timestamp doesn't start with one
+    :rtype: int or None
+    """
+    if timestamp[:2].isdigit():
+        hour = int(timestamp[:2])
+        if hour < 24:
+            return hour
+    return None
+
+
+class LogStats(object):
+    """Counts of the lines of a log, or of the lines that were read so far.
+
+    Only messages with a nick are counted as messages, since ZNC also logs
+    notices like nick changes and topics as messages without one.
+    """
+
+    def __init__(self):
+        # maps from line type -> how many lines there are of that type
+        self.type_counts = Counter()
+        # maps from nick -> how many messages or actions the nick has
+        self.nick_messages = Counter()
+        self.nick_actions = Counter()
+        # maps from hour of the day -> how many messages or actions there are
+        self.hour_messages = Counter()
+        self.hour_actions = Counter()
+
+    def add_lines(self, irc_lines):
+        """Count some lines.
+
+        :type irc_lines: iterable of
+            :class:`~irclogviewer.logs.irc_parser.IrcLine`
+        """
+        # This runs over every line of every log, so the lines are counted by
+        # Counter in C instead of one at a time in Python: by type, and by
+        # their nick and the first two characters of their timestamp
+        irc_lines = list(irc_lines)
+        line_types = Counter(map(itemgetter(2), irc_lines))
+        # Only messages have a nick
+        message_keys = Counter([(nick, timestamp[:2])
+                                for timestamp, nick, _, _ in irc_lines
+                                if nick is not None])
+        action_keys = Counter()
+        if line_types['action']:
+            # Actions look like "* nick does something"
+            action_keys.update(
+                [(message_fragments[0].text.split(' ', 2)[1], timestamp[:2])
+                 for timestamp, _, line_type, message_fragments in irc_lines
+                 if line_type == 'action'])
+        line_types['message'] = sum(message_keys.values())
+        self.type_counts.update(line_types)
+
+        for keys, nick_counts, hour_counts in (
+                (message_keys, self.nick_messages, self.hour_messages),
+                (action_keys, self.nick_actions, self.hour_actions)):
+            for (nick, timestamp_start), count in keys.items():
+                nick_counts[nick] += count
+                hour = timestamp_hour(timestamp_start)
+                if hour is not None:
+                    hour_counts[hour] += count
+
+    def nick_counts(self):
+        """Get how many messages and actions each nick has.
+
+        :rtype: list of :class:`ActivityCount`
+        """
+        return [ActivityCount(nick,
+                              self.nick_messages[nick],
+                              self.nick_actions[nick])
+                for nick in set(self.nick_messages) | set(self.nick_actions)]
+
+    def hour_counts(self):
+        """Get how many messages and actions there are in each hour of the
+        day that has any.
+
+        :rtype: list of :class:`ActivityCount`
+        """
+        return [ActivityCount(hour,
+                              self.hour_messages[hour],
+                              self.hour_actions[hour])
+                for hour in set(self.hour_messages) | set(self.hour_actions)]
+
+    def __repr__(self):
+        return '<LogStats messages={0} nicks={1}>'.format(
+            self.type_counts['message'], len(self.nick_messages))
+
+
+def read_log_stats(path, start, stats=None):
+    """Count the whole lines of a log that come after byte ``start``.
+
+    :param str path: path to a log file
+    :param int start: the byte offset of the first line to count
+    :param stats: (optional) the counts of the lines before ``start``, which
+        the new lines are added to
+    :type stats: :class:`LogStats` or None
+    :return: the counts; the byte offset after the last whole line; and how
+        many whole lines were read
+    :rtype: tuple of (:class:`LogStats`, int, int)
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        with map_log_file(f, size) as data:
+            # ZNC may be partway through writing the last line
+            end = max(data.rfind(b'\n', start) + 1, start)
+            text = decode_log_bytes(data, start, end)
+
+    if stats is None:
+        stats = LogStats()
+    stats.add_lines(parse_irc_log(text))
+    return stats, end, text.count('\n')
+
+
+def get_month_stats(user, channel):
+    """Get the counts of a channel's lines in each month, oldest first.
+
+    :param str user: the ZNC user
+    :param str channel: the channel
+    :rtype: list of :class:`~irclogviewer.models.IrcStatsMonth`
+    """
+    return db.session.query(IrcStatsMonth)\
+                     .filter(IrcStatsMonth.user == user,
+                             IrcStatsMonth.channel == channel)\
+                     .order_by(IrcStatsMonth.year.asc(),
+                               IrcStatsMonth.month.asc())\
+                     .all()
+
+
+def get_day_stats(user, channel, year_month):
+    """Get the counts of a channel's lines in each log of a month, oldest
+    first.
+
+    :param str user: the ZNC user
+    :param str channel: the channel
+    :param year_month: the month
+    :type year_month: :class:`~irclogviewer.dates.YearMonth`
+    :rtype: list of :class:`~irclogviewer.models.IrcStatsFile`
+    """
+    first_day, next_first_day = month_bounds(*year_month)
+    return db.session.query(IrcStatsFile)\
+                     .filter(IrcStatsFile.user == user,
+                             IrcStatsFile.channel == channel,
+                             IrcStatsFile.date >= first_day,
+                             IrcStatsFile.date < next_first_day)\
+                     .order_by(IrcStatsFile.date.asc())\
+                     .all()
+
+
+def get_nick_stats(user, channel, year_month=None, limit=None):
+    """Get how many messages and actions the nicks of a channel have, most
+    active first.
+
+    :param str user: the ZNC user
+    :param str channel: the channel
+    :param year_month: (optional) only count the lines of this month
+    :type year_month: :class:`~irclogviewer.dates.YearMonth` or None
+    :param limit: (optional) the most nicks to return
+    :type limit: int or None
+    :rtype: list of :class:`ActivityCount`
+    """
+    messages = func.sum(IrcStatsMonthNick.messages)
+    actions = func.sum(IrcStatsMonthNick.actions)
+    query = db.session.query(IrcStatsMonthNick.nick, messages, actions)\
+                      .filter(IrcStatsMonthNick.user == user,
+                              IrcStatsMonthNick.channel == channel)\
+                      .group_by(IrcStatsMonthNick.nick)\
+                      .order_by((messages + actions).desc(),
+                                IrcStatsMonthNick.nick.asc())
+    if year_month is not None:
+        query = query.filter(IrcStatsMonthNick.year == year_month.year,
+                             IrcStatsMonthNick.month == year_month.month)
+    return [ActivityCount(*row) for row in query.limit(limit)]
+
+
+def get_hour_stats(user, channel, year_month=None):
+    """Get how many messages and actions a channel has in each hour of the
+    day, from midnight on.
+
+    :param str user: the ZNC user
+    :param str channel: the channel
+    :param year_month: (optional) only count the lines of this month
+    :type year_month: :class:`~irclogviewer.dates.YearMonth` or None
+    :return: the counts of all 24 hours
+    :rtype: list of :class:`ActivityCount`
+    """
+    query = db.session.query(IrcStatsMonthHour.hour,
+                             func.sum(IrcStatsMonthHour.messages),
+                             func.sum(IrcStatsMonthHour.actions))\
+                      .filter(IrcStatsMonthHour.user == user,
+                              IrcStatsMonthHour.channel == channel)\
+                      .group_by(IrcStatsMonthHour.hour)
+    if year_month is not None:
+        query = query.filter(IrcStatsMonthHour.year == year_month.year,
+                             IrcStatsMonthHour.month == year_month.month)
+
+    counts = dict((hour, ActivityCount(hour, messages, actions))
+                  for hour, messages, actions in query)
+    return [counts.get(hour, ActivityCount(hour, 0, 0))
+            for hour in range(24)]
@@ -1,3 +1,4 @@
+from sqlalchemy import DDL, inspect, text
 from sqlalchemy.orm import composite
 
 from irclogviewer import db
@@ -26,6 +27,13 @@ class IrcUserChannel(object):
 
 class IrcLog(db.Model):
     __tablename__ = 'irclogs'
+    __table_args__ = (
+        # The primary key's index already serves lookups by (user, channel)
+        # and (user, channel, date range), which is what get_log needs.
+        # This one serves the date-first queries: channels with a log on a
+        # given date, and the distinct dates for the calendar.
+        db.Index('ix_irclogs_date_user_channel', 'date', 'user', 'channel'),
+    )
 
     user = db.Column(db.String(128), primary_key=True, nullable=False)
     channel = db.Column(db.String(128), primary_key=True, nullable=False)
@@ -46,3 +54,404 @@ class IrcLog(db.Model):
             date=self.date,
             last_modified=self.last_modified,
         )
+
+
+class IrcChannelSummary(db.Model):
+    """A per-channel rollup of :class:`IrcLog` rows that the crawler keeps up
+    to date, so listing channels doesn't have to group the whole ``irclogs``
+    table on every request.
+    """
+    __tablename__ = 'channel_summary'
+    __table_args__ = (
+        db.Index('ix_channel_summary_user_latest',
+                 'user', 'latest_date', 'last_modified'),
+    )
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+
+    first_date = db.Column(db.Date(), nullable=False)
+    latest_date = db.Column(db.Date(), nullable=False)
+    last_modified = db.Column(db.DateTime(), nullable=False)
+    log_count = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self):
+        return (
+            '<IrcChannelSummary user="{user}" channel="{channel}" '
+            'latest_date={latest_date} log_count={log_count}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            latest_date=self.latest_date,
+            log_count=self.log_count,
+        )
+
+
+class IrcLogMonth(db.Model):
+    """The days of one month that a user's channel has logs for, kept up to
+    date by the crawler so the calendar doesn't have to scan ``irclogs``.
+
+    ``days`` is a bitmap where bit ``n`` is set if there is a log on day
+    ``n`` of the month.
+    """
+    __tablename__ = 'log_months'
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    year = db.Column(db.Integer(), primary_key=True, nullable=False)
+    month = db.Column(db.Integer(), primary_key=True, nullable=False)
+
+    days = db.Column(db.BigInteger(), nullable=False)
+
+    def __repr__(self):
+        return (
+            '<IrcLogMonth user="{user}" channel="{channel}" year={year} '
+            'month={month} days={days:#b}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            year=self.year,
+            month=self.month,
+            days=self.days,
+        )
+
+
+class IrcSearchFile(db.Model):
+    """How much of a log file the crawler has added to the search index, so
+    that only the lines appended since then have to be indexed.
+    """
+    __tablename__ = 'search_files'
+    __table_args__ = (
+        # Serves turning the dates a search is limited to into bounds on the
+        # IDs of its lines
+        db.Index('ix_search_files_date', 'date', 'first_id', 'last_id'),
+    )
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    date = db.Column(db.Date(), primary_key=True, nullable=False)
+
+    path = db.Column(db.String(256), nullable=False)
+    # The file's modification time when it was last indexed, in nanoseconds
+    mtime_ns = db.Column(db.BigInteger(), nullable=False)
+    # How many bytes and lines of the file have been indexed
+    size = db.Column(db.BigInteger(), nullable=False)
+    line_count = db.Column(db.Integer(), nullable=False)
+    # Bounds on the IDs of the file's lines in search_lines, which let
+    # searches within a range of dates skip the lines outside of it. These
+    # are None until the file has a searchable line.
+    first_id = db.Column(db.Integer())
+    last_id = db.Column(db.Integer())
+
+    def __repr__(self):
+        return (
+            '<IrcSearchFile user="{user}" channel="{channel}" date={date} '
+            'size={size} line_count={line_count}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            date=self.date,
+            size=self.size,
+            line_count=self.line_count,
+        )
+
+
+class IrcSearchLine(db.Model):
+    """A searchable line from a log. ``message`` and ``nick`` are indexed by
+    the ``search_index`` full-text table that :func:`create_search_index`
+    makes, which the crawler adds new lines to with
+    :data:`INDEX_NEW_SEARCH_LINES`.
+
+    ``line_number`` counts from 1, the same as the line anchors of a log.
+    """
+    __tablename__ = 'search_lines'
+    __table_args__ = (
+        db.Index('ix_search_lines_user_channel_date',
+                 'user', 'channel', 'date'),
+        # Serves searches for a nick's lines without any words to match
+        db.Index('ix_search_lines_nick', 'nick'),
+        # IDs are never reused, so lines that are added later always have
+        # higher IDs
+        {'sqlite_autoincrement': True},
+    )
+
+    # This is SQLite's rowid, which the full-text index refers to
+    id = db.Column(db.Integer(), primary_key=True)
+
+    user = db.Column(db.String(128), nullable=False)
+    channel = db.Column(db.String(128), nullable=False)
+    date = db.Column(db.Date(), nullable=False)
+    line_number = db.Column(db.Integer(), nullable=False)
+
+    timestamp = db.Column(db.String(16), nullable=False)
+    nick = db.Column(db.String(128))
+    message = db.Column(db.Text(), nullable=False)
+
+    def __repr__(self):
+        return (
+            '<IrcSearchLine user="{user}" channel="{channel}" date={date} '
+            'line_number={line_number}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            date=self.date,
+            line_number=self.line_number,
+        )
+
+
+class IrcStatsFile(db.Model):
+    """How many lines of each type a log has, and how much of the log file
+    the crawler has counted, so that only the lines appended since then have
+    to be read.
+
+    ``messages`` only counts messages with a nick, not the notices that ZNC
+    logs as messages.
+    """
+    __tablename__ = 'stats_files'
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    date = db.Column(db.Date(), primary_key=True, nullable=False)
+
+    path = db.Column(db.String(256), nullable=False)
+    # The file's modification time when it was last counted, in nanoseconds
+    mtime_ns = db.Column(db.BigInteger(), nullable=False)
+    # How many bytes and lines of the file have been counted
+    size = db.Column(db.BigInteger(), nullable=False)
+    line_count = db.Column(db.Integer(), nullable=False)
+
+    messages = db.Column(db.Integer(), nullable=False)
+    actions = db.Column(db.Integer(), nullable=False)
+    joins = db.Column(db.Integer(), nullable=False)
+    parts = db.Column(db.Integer(), nullable=False)
+    quits = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self):
+        return (
+            '<IrcStatsFile user="{user}" channel="{channel}" date={date} '
+            'messages={messages}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            date=self.date,
+            messages=self.messages,
+        )
+
+
+class IrcStatsNick(db.Model):
+    """How many messages and actions a nick has in a log."""
+    __tablename__ = 'stats_nicks'
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    date = db.Column(db.Date(), primary_key=True, nullable=False)
+    nick = db.Column(db.String(128), primary_key=True, nullable=False)
+
+    messages = db.Column(db.Integer(), nullable=False)
+    actions = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self):
+        return (
+            '<IrcStatsNick user="{user}" channel="{channel}" date={date} '
+            'nick="{nick}" messages={messages}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            date=self.date,
+            nick=self.nick,
+            messages=self.messages,
+        )
+
+
+class IrcStatsHour(db.Model):
+    """How many messages and actions a log has in an hour of the day."""
+    __tablename__ = 'stats_hours'
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    date = db.Column(db.Date(), primary_key=True, nullable=False)
+    hour = db.Column(db.Integer(), primary_key=True, nullable=False)
+
+    messages = db.Column(db.Integer(), nullable=False)
+    actions = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self):
+        return (
+            '<IrcStatsHour user="{user}" channel="{channel}" date={date} '
+            'hour={hour} messages={messages}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            date=self.date,
+            hour=self.hour,
+            messages=self.messages,
+        )
+
+
+class IrcStatsMonth(db.Model):
+    """The :class:`IrcStatsFile` counts of a channel's logs in one month,
+    added up by the crawler so stats pages don't have to group every log.
+    """
+    __tablename__ = 'stats_months'
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    year = db.Column(db.Integer(), primary_key=True, nullable=False)
+    month = db.Column(db.Integer(), primary_key=True, nullable=False)
+
+    log_count = db.Column(db.Integer(), nullable=False)
+    messages = db.Column(db.Integer(), nullable=False)
+    actions = db.Column(db.Integer(), nullable=False)
+    joins = db.Column(db.Integer(), nullable=False)
+    parts = db.Column(db.Integer(), nullable=False)
+    quits = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self):
+        return (
+            '<IrcStatsMonth user="{user}" channel="{channel}" year={year} '
+            'month={month} messages={messages}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            year=self.year,
+            month=self.month,
+            messages=self.messages,
+        )
+
+
+class IrcStatsMonthNick(db.Model):
+    """The :class:`IrcStatsNick` counts of a channel's logs in one month."""
+    __tablename__ = 'stats_month_nicks'
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    year = db.Column(db.Integer(), primary_key=True, nullable=False)
+    month = db.Column(db.Integer(), primary_key=True, nullable=False)
+    nick = db.Column(db.String(128), primary_key=True, nullable=False)
+
+    messages = db.Column(db.Integer(), nullable=False)
+    actions = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self):
+        return (
+            '<IrcStatsMonthNick user="{user}" channel="{channel}" '
+            'year={year} month={month} nick="{nick}" messages={messages}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            year=self.year,
+            month=self.month,
+            nick=self.nick,
+            messages=self.messages,
+        )
+
+
+class IrcStatsMonthHour(db.Model):
+    """The :class:`IrcStatsHour` counts of a channel's logs in one month."""
+    __tablename__ = 'stats_month_hours'
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    year = db.Column(db.Integer(), primary_key=True, nullable=False)
+    month = db.Column(db.Integer(), primary_key=True, nullable=False)
+    hour = db.Column(db.Integer(), primary_key=True, nullable=False)
+
+    messages = db.Column(db.Integer(), nullable=False)
+    actions = db.Column(db.Integer(), nullable=False)
+
+    def __repr__(self):
+        return (
+            '<IrcStatsMonthHour user="{user}" channel="{channel}" '
+            'year={year} month={month} hour={hour} messages={messages}>'
+        ).format(
+            user=self.user,
+            channel=self.channel,
+            year=self.year,
+            month=self.month,
+            hour=self.hour,
+            messages=self.messages,
+        )
+
+
+class IrcStatsChangedLog(db.Model):
+    """A log whose counts the crawler is replacing, so that the counts of a
+    whole batch of logs are deleted with one statement per table. Rows only
+    exist during the crawler's transactions.
+    """
+    __tablename__ = 'stats_changed_logs'
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    date = db.Column(db.Date(), primary_key=True, nullable=False)
+
+
+class IrcStatsChangedMonth(db.Model):
+    """A month of a channel whose counts the crawler is adding up again, so
+    that every changed month is added up with one statement per table. Rows
+    only exist during the crawler's transactions.
+    """
+    __tablename__ = 'stats_changed_months'
+
+    user = db.Column(db.String(128), primary_key=True, nullable=False)
+    channel = db.Column(db.String(128), primary_key=True, nullable=False)
+    year = db.Column(db.Integer(), primary_key=True, nullable=False)
+    month = db.Column(db.Integer(), primary_key=True, nullable=False)
+
+    # The month's logs are the ones from first_day up to next_first_day
+    first_day = db.Column(db.Date(), nullable=False)
+    next_first_day = db.Column(db.Date(), nullable=False)
+
+
+# An FTS5 index over search_lines that stores no copy of the text,
+# as described in https://www.sqlite.org/fts5.html#external_content_tables
+# The trigger takes deleted lines out of the index.
+SEARCH_INDEX_DDL = [
+    DDL("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "message, nick, content='search_lines', content_rowid='id')"),
+    DDL("CREATE TRIGGER IF NOT EXISTS search_lines_after_delete "
+        "AFTER DELETE ON search_lines BEGIN "
+        "INSERT INTO search_index(search_index, rowid, message, nick) "
+        "VALUES ('delete', old.id, old.message, old.nick); "
+        "END"),
+]
+
+# Adds the lines with IDs above :last_id to the full-text index. Doing this
+# once for a batch of lines is several times faster than an insert trigger,
+# which updates the index one line at a time.
+INDEX_NEW_SEARCH_LINES = text(
+    "INSERT INTO search_index(rowid, message, nick) "
+    "SELECT id, message, nick FROM search_lines WHERE id > :last_id")
+
+
+def create_search_index(engine):
+    """Create the full-text index of :class:`IrcSearchLine` if it doesn't
+    exist yet. Full-text search needs SQLite with FTS5, so this does nothing
+    on other databases.
+
+    :param engine: the engine for the database to migrate
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    for ddl in SEARCH_INDEX_DDL:
+        engine.execute(ddl)
+
+
+def create_missing_indexes(engine):
+    """Create the indexes declared on the models that the database doesn't
+    have yet.
+
+    ``create_all`` only creates indexes together with their tables, so this
+    brings databases made before an index was declared up to date.
+
+    :param engine: the engine for the database to migrate
+    """
+    inspector = inspect(engine)
+    table_names = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in table_names:
+            continue
+        existing = set(index['name']
+                       for index in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
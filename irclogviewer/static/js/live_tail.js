@@ -0,0 +1,147 @@
+/*
+ * Appends the lines that are added to today's log to the page, so it doesn't
+ * have to be refreshed to follow a channel. The lines are either pushed from
+ * the server as server-sent events, or polled for.
+ *
+ * The markup mirrors logs/templates/log_lines.html, and the nick colors and
+ * fragment classes mirror the filters in logs/filters.py.
+ */
+(function () {
+    'use strict';
+
+    var NICK_COLORS = [2, 3, 4, 5, 6, 7, 9, 10, 11, 12, 13];
+    var URL_REGEX = /\b((?:https?:\/\/|www\d{0,3}[.])[^\s<>]+)/gi;
+
+    var log = document.querySelector(
+        '.log[data-live-url], .log[data-since-url]');
+    if (!log) {
+        return;
+    }
+    var bottom = log.querySelector('a[name=bottom]');
+
+    function nickToColorId(nick) {
+        var asciiSum = 0;
+        for (var i = 0; i < nick.length; i++) {
+            asciiSum += nick.charCodeAt(i);
+        }
+        return NICK_COLORS[asciiSum % NICK_COLORS.length];
+    }
+
+    function stateToCssClasses(state) {
+        var classes = [];
+        if (state.is_bold) {
+            classes.push('irc-bold');
+        }
+        if (state.has_underline) {
+            classes.push('irc-underline');
+        }
+        if (state.fg_color) {
+            classes.push('irc-fg-' + state.fg_color);
+        }
+        if (state.bg_color) {
+            classes.push('irc-bg-' + state.bg_color);
+        }
+        return classes;
+    }
+
+    function span(className) {
+        var element = document.createElement('span');
+        element.className = className;
+        return element;
+    }
+
+    function appendTextWithLinks(element, text) {
+        var lastIndex = 0;
+        text.replace(URL_REGEX, function (url, _, index) {
+            element.appendChild(
+                document.createTextNode(text.slice(lastIndex, index)));
+            var link = document.createElement('a');
+            link.href = url;
+            link.target = '_blank';
+            link.textContent = url;
+            element.appendChild(link);
+            lastIndex = index + url.length;
+        });
+        element.appendChild(document.createTextNode(text.slice(lastIndex)));
+    }
+
+    function renderLine(ircLine, lineNumber) {
+        var line = span('irc-line');
+        if (ircLine.type !== 'message') {
+            line.className += ' irc-line-' + ircLine.type;
+        }
+
+        var timestamp = span('irc-timestamp');
+        var anchor = document.createElement('a');
+        anchor.href = '#line-' + lineNumber;
+        anchor.id = 'line-' + lineNumber;
+        anchor.textContent = ircLine.timestamp;
+        timestamp.appendChild(document.createTextNode('['));
+        timestamp.appendChild(anchor);
+        timestamp.appendChild(document.createTextNode(']'));
+        line.appendChild(timestamp);
+
+        if (ircLine.nick) {
+            var nick = span('irc-nick irc-fg-' + nickToColorId(ircLine.nick));
+            nick.textContent = '<' + ircLine.nick + '>';
+            line.appendChild(nick);
+        }
+
+        var message = span('irc-message');
+        ircLine.message_fragments.forEach(function (fragment) {
+            var classes = ['irc-fragment'].concat(
+                stateToCssClasses(fragment.state));
+            var element = span(classes.join(' '));
+            appendTextWithLinks(element, fragment.text);
+            message.appendChild(element);
+        });
+        line.appendChild(message);
+        return line;
+    }
+
+    function appendLines(ircLines) {
+        var lineNumber = log.querySelectorAll('.irc-line').length;
+        ircLines.forEach(function (ircLine) {
+            lineNumber += 1;
+            log.insertBefore(renderLine(ircLine, lineNumber), bottom);
+        });
+    }
+
+    var liveUrl = log.getAttribute('data-live-url');
+    if (liveUrl) {
+        if (window.EventSource) {
+            var source = new EventSource(liveUrl);
+            source.onmessage = function (event) {
+                appendLines(JSON.parse(event.data).lines);
+            };
+        }
+        return;
+    }
+
+    // Without server-sent events, ask for the lines since the last offset
+    var sinceUrl = log.getAttribute('data-since-url');
+    var pollMilliseconds = 1000 * log.getAttribute('data-poll-seconds');
+
+    function poll() {
+        var request = new XMLHttpRequest();
+        request.open('GET', sinceUrl);
+        request.onload = function () {
+            if (request.status === 200) {
+                var response = JSON.parse(request.responseText);
+                if (response.truncated) {
+                    // The log was replaced, so start over
+                    window.location.reload();
+                    return;
+                }
+                appendLines(response.lines);
+                sinceUrl = sinceUrl.replace(/\/\d+$/, '/' + response.offset);
+            }
+            window.setTimeout(poll, pollMilliseconds);
+        };
+        request.onerror = function () {
+            window.setTimeout(poll, pollMilliseconds);
+        };
+        request.send();
+    }
+    window.setTimeout(poll, pollMilliseconds);
+})();
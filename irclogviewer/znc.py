@@ -1,4 +1,5 @@
-from collections import Mapping
+from bisect import bisect_left, bisect_right
+from collections import Mapping, namedtuple
 import datetime
 from functools import total_ordering
 import logging
@@ -14,6 +15,32 @@ LOG_FILENAME_PATTERN = re.compile(
 log = logging.getLogger(__name__)
 
 
+class ZncLogEntry(namedtuple('ZncLogEntry',
+                  ['date', 'channel', 'log_path', 'modified_time'])):
+    """A lightweight record of a log file found by
+    :meth:`ZncLogManager.all`. Like :class:`ZncLogFile`, these sort by date,
+    then by channel.
+    """
+    __slots__ = ()
+
+
+def parse_log_filename(filename):
+    """Get the channel and date that a ZNC log filename refers to.
+
+    :param str filename: the base name of a possible log file
+    :raises ValueError: if ``filename`` is not recognized
+    :return: the channel and the date of the log
+    :rtype: tuple of (str, :class:`datetime.date`)
+    """
+    match = LOG_FILENAME_PATTERN.match(filename)
+    if not match:
+        raise ValueError(
+            'Log filename "{0}" has an unsupported format'.format(filename)
+        )
+    groups = match.groupdict()
+    return groups['channel'], parse_undashed_date(groups['date'])
+
+
 class ZncDirectory(object):
     """Representation of a ``.znc`` directory that contains a ``users``
     directory.
@@ -89,6 +116,8 @@ class ZncUserMapping(Mapping):
             raise ValueError('No user directory found in path {0}'.format(
                 self.users_path)
             )
+        # Reuse ZncUserDirectory objects so their log indexes stay warm
+        self._user_directories = {}
 
     def __len__(self):
         return len(os.listdir(self.users_path))
@@ -96,11 +125,14 @@ class ZncUserMapping(Mapping):
     def __getitem__(self, user):
         user_directory = os.path.join(self.users_path, user)
         if not os.path.isdir(user_directory):
+            self._user_directories.pop(user, None)
             raise KeyError(
                 'No user directory found for user "{0}" in path {1}'.format(
                     user, self.users_path)
             )
-        return ZncUserDirectory(user_directory)
+        if user not in self._user_directories:
+            self._user_directories[user] = ZncUserDirectory(user_directory)
+        return self._user_directories[user]
 
     def __iter__(self):
         for user in os.listdir(self.users_path):
@@ -123,17 +155,7 @@ class ZncLogFile(object):
         :raises ValueError: if the filename in ``log_path`` is not recognized
         :rtype: ZncLogFile
         """
-        filename = os.path.basename(log_path)
-        match = LOG_FILENAME_PATTERN.match(filename)
-        if not match:
-            raise ValueError(
-                'Log filename "{0}" has an unsupported format'.format(filename)
-            )
-        groups = match.groupdict()
-
-        channel = groups['channel']
-        date = parse_undashed_date(groups['date'])
-
+        channel, date = parse_log_filename(os.path.basename(log_path))
         return cls(log_path, channel, date)
 
     def __init__(self, log_path, channel, date):
@@ -141,10 +163,10 @@ class ZncLogFile(object):
         self.date = date
         self.channel = channel
 
-        if not os.path.exists(self.log_path):
+        try:
+            stat = os.stat(self.log_path)
+        except FileNotFoundError:
             raise ValueError('Log {0} does not exist'.format(self.log_path))
-
-        stat = os.stat(self.log_path)
         self.modified_time = datetime.datetime.fromtimestamp(stat.st_mtime)
 
     def __repr__(self):
@@ -187,8 +209,48 @@ class ZncLogFile(object):
         return False
 
 
+class ZncLogIndex(object):
+    """Lookup tables over a snapshot of a user's :class:`ZncLogEntry`
+    objects, keyed by channel and by date.
+    """
+
+    def __init__(self, entries):
+        """
+        :param entries: the log entries to index
+        :type entries: iterable of :class:`ZncLogEntry`
+        """
+        # maps from (channel, date) -> ZncLogEntry
+        self.entries = {}
+        # maps from channel -> sorted list of dates
+        self.dates_by_channel = {}
+        # maps from date -> sorted list of channels
+        self.channels_by_date = {}
+
+        for entry in sorted(entries):
+            key = (entry.channel, entry.date)
+            if key in self.entries:
+                # Two filenames for the same channel and date; the last wins
+                self.entries[key] = entry
+                continue
+            self.entries[key] = entry
+            self.dates_by_channel.setdefault(entry.channel, []).append(
+                entry.date)
+            self.channels_by_date.setdefault(entry.date, []).append(
+                entry.channel)
+
+    def __repr__(self):
+        return '<ZncLogIndex entries={0}>'.format(len(self.entries))
+
+
 class ZncLogManager(object):
-    """Provide a nice interface to a ZNC user's logs."""
+    """Provide a nice interface to a ZNC user's logs.
+
+    Lookups are answered from a :class:`ZncLogIndex` that is rebuilt whenever
+    the modification time of the log directory changes, i.e. when a log file
+    is created, renamed, or deleted. Appending to an existing log does not
+    touch the directory, so the ``modified_time`` of an indexed entry can be
+    older than the file's.
+    """
 
     def __init__(self, user_path):
         """
@@ -196,26 +258,59 @@ class ZncLogManager(object):
             be if the ``log`` directory existed
         """
         self.logs_path = os.path.join(user_path, 'moddata', 'log')
+        self._index = None
+        self._index_mtime = None
+
+    @property
+    def index(self):
+        """The :class:`ZncLogIndex` for the current contents of the log
+        directory.
+        """
+        try:
+            mtime = os.stat(self.logs_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if self._index is None or mtime != self._index_mtime:
+            self._index = ZncLogIndex(self.all())
+            self._index_mtime = mtime
+        return self._index
 
     def all(self):
-        """Generator that yields all the valid :class:`ZncLog` objects it can
-        successfully parse and create.
+        """Generator that yields a :class:`ZncLogEntry` for every log file
+        whose filename it can parse.
+
+        The directory is read with :func:`os.scandir`, so each file costs a
+        single ``stat`` call.
         """
-        if not os.path.isdir(self.logs_path):
-            raise StopIteration()
+        try:
+            entries = os.scandir(self.logs_path)
+        except (FileNotFoundError, NotADirectoryError):
+            return
 
-        for filename in os.listdir(self.logs_path):
+        for entry in entries:
             try:
-                znc_log = ZncLogFile.from_path(
-                    os.path.join(self.logs_path, filename))
+                channel, date = parse_log_filename(entry.name)
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
             except ValueError as e:
                 log.exception("Invalid filename in log directory: " + str(e))
-            else:
-                yield znc_log
+                continue
+            except FileNotFoundError:
+                # deleted since the directory was read
+                continue
+
+            yield ZncLogEntry(
+                date,
+                channel,
+                entry.path,
+                datetime.datetime.fromtimestamp(stat.st_mtime),
+            )
 
     def filter(self, date=None, channel=None):
-        """Return only the :class:`ZncLog` objects that match the date filter,
-        channel filter, or combined date and channel filter.
+        """Return only the :class:`ZncLogEntry` objects that match the date
+        filter, channel filter, or combined date and channel filter.
 
         At least one of ``date`` or ``channel`` must be given as an argument.
 
@@ -223,36 +318,66 @@ class ZncLogManager(object):
         :param str channel: (optional) channel you are interested in
         :raises ValueError: if neither ``date`` nor ``channel`` arguments were
             defined
-        :rtype: list of :class:`ZncLogFile`
-        :returns: a sorted list of :class:`ZncLog` objects meeting the criteria
+        :rtype: list of :class:`ZncLogEntry`
+        :returns: a sorted list of :class:`ZncLogEntry` objects meeting the
+            criteria
         """
+        index = self.index
         if date and channel:
-            predicate = lambda l: l.date == date and l.channel == channel
+            entry = index.entries.get((channel, date))
+            return [entry] if entry else []
         elif date:
-            predicate = lambda l: l.date == date
+            return [index.entries[(c, date)]
+                    for c in index.channels_by_date.get(date, [])]
         elif channel:
-            predicate = lambda l: l.channel == channel
+            return [index.entries[(channel, d)]
+                    for d in index.dates_by_channel.get(channel, [])]
         else:
             raise ValueError("Neither date nor channel were specified")
 
-        return sorted(znc_log for znc_log in self.all() if predicate(znc_log))
-
     def get(self, date=None, channel=None):
-        """Get only the :class:`ZncLog` object that was from the given ``date``
-        for the given ``channel``.
+        """Get only the :class:`ZncLogEntry` that was from the given
+        ``date`` for the given ``channel``.
 
         :param datetime.date date: date you are interested in
         :param str channel: channel you are interested in
-        :return: the desired log object, if it exists, or None
-        :rtype: :class:`ZncLogFile` or None
+        :return: the desired log entry, if it exists, or None
+        :rtype: :class:`ZncLogEntry` or None
         """
         if not date or not channel:
             raise ValueError("Neither date nor channel were specified")
 
-        znc_logs = self.filter(date=date, channel=channel)
-        if znc_logs:
-            return znc_logs[0]
-        return None
+        return self.index.entries.get((channel, date))
+
+    def get_earlier(self, date, channel):
+        """Get the latest :class:`ZncLogEntry` for ``channel`` from before
+        ``date``.
+
+        :param datetime.date date: the date to look before
+        :param str channel: channel you are interested in
+        :rtype: :class:`ZncLogEntry` or None
+        """
+        index = self.index
+        dates = index.dates_by_channel.get(channel, [])
+        position = bisect_left(dates, date)
+        if position == 0:
+            return None
+        return index.entries[(channel, dates[position - 1])]
+
+    def get_later(self, date, channel):
+        """Get the earliest :class:`ZncLogEntry` for ``channel`` from after
+        ``date``.
+
+        :param datetime.date date: the date to look after
+        :param str channel: channel you are interested in
+        :rtype: :class:`ZncLogEntry` or None
+        """
+        index = self.index
+        dates = index.dates_by_channel.get(channel, [])
+        position = bisect_right(dates, date)
+        if position == len(dates):
+            return None
+        return index.entries[(channel, dates[position])]
 
     def __repr__(self):
         return '<ZncLogManager logs_path={logs_path}>'.format(**self.__dict__)
@@ -186,6 +186,21 @@ def command_crawl(args):
         print(err_data.decode("utf-8"), file=sys.stderr)
 
 
+def command_watch(args):
+    """Run the crawler in the background, indexing logs as ZNC writes them"""
+    cmd = [
+        path_to_bin("crawl-irc-logs"),
+        '--config', args.config,
+        '--watch',
+    ]
+
+    print("Running the following command")
+    print(" ".join(pipes.quote(c) for c in cmd))
+    subprocess.Popen(cmd, env={
+        "FLASK_SETTINGS": args.config,
+    })
+
+
 def add_config_argument(parser, required=False):
     """Add the ``--config`` argument to the given ``parser``."""
     parser.add_argument(
@@ -225,5 +240,10 @@ if __name__ == "__main__":
     add_config_argument(crawl_parser, required=True)
     crawl_parser.set_defaults(func=command_crawl)
 
+    watch_parser = subparsers.add_parser(
+        "watch", help="Keep the IRC logs crawled as they are written")
+    add_config_argument(watch_parser, required=True)
+    watch_parser.set_defaults(func=command_watch)
+
     parsed_args = parser.parse_args()
     parsed_args.func(parsed_args)
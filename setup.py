@@ -12,7 +12,7 @@ setup(
 
     license='3-clause BSD',
 
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'tests.*']),
 
     entry_points={
         'console_scripts': [
@@ -0,0 +1,258 @@
+"""
+Tests for :mod:`irclogviewer.logs.authorization`.
+
+:class:`~irclogviewer.logs.authorization.ChannelAcl` is checked against a
+scan of the rules in order, which is how ``ZNC_ACL`` was read before it was
+compiled, on many random ACLs. The SQL conditions it builds are checked
+against it on a table in an in-memory SQLite database.
+"""
+import random
+import unittest
+
+from flask import Flask
+from sqlalchemy import Column, create_engine, MetaData, select, String, Table
+
+from irclogviewer.logs.authorization import (
+    ChannelAcl,
+    email_can_read_channel_logs,
+    readable_channels_clause,
+    WILDCARD,
+)
+
+
+EMAILS = ['alice@example.com', 'bob@example.com', WILDCARD]
+USERS = ['alice', 'bob', WILDCARD]
+CHANNELS = ['#python', '#znc', 'nickserv', WILDCARD]
+ACTIONS = ['allow', 'deny', ' Allow ', 'DENY', 'ALLOW\n', 'ignore']
+
+
+def scan_acl(acl_rules, email, znc_username, channel):
+    """Find whether the first rule that applies allows reading, by scanning
+    every rule in order.
+
+    :param acl_rules: the rules of ``ZNC_ACL``
+    :type acl_rules: list of tuple
+    :param str email: e-mail address of the web user, or the wildcard
+    :param str znc_username: ZNC username
+    :param str channel: name of an IRC channel
+    :return: whether the rule allows reading, or None if no rule applies
+    :rtype: bool or None
+    """
+    for action, rule_email, rule_username, rule_channel in acl_rules:
+        if rule_email != WILDCARD and rule_email != email:
+            continue
+        if rule_username != WILDCARD and rule_username != znc_username:
+            continue
+        if rule_channel != WILDCARD and rule_channel != channel:
+            continue
+        return action.strip().lower() == 'allow'
+    return None
+
+
+def random_acl(rng, max_rules=12):
+    """Make up an ACL of rules that often overlap.
+
+    :param random.Random rng: source of randomness
+    :param int max_rules: (optional) the most rules it can have
+    :rtype: list of tuple
+    """
+    return [(rng.choice(ACTIONS), rng.choice(EMAILS), rng.choice(USERS),
+             rng.choice(CHANNELS))
+            for _ in range(rng.randint(0, max_rules))]
+
+
+def random_checks(rng, count):
+    """Make up checks of e-mail addresses, ZNC usernames, and channels,
+    including ones that no rule names.
+
+    :param random.Random rng: source of randomness
+    :param int count: how many checks to make
+    :rtype: list of tuple of (str, str, str)
+    """
+    return [(rng.choice(EMAILS + ['carol@example.com']),
+             rng.choice(USERS + ['carol']),
+             rng.choice(CHANNELS + ['#other']))
+            for _ in range(count)]
+
+
+def make_app(acl_rules):
+    """Make a bare app with a compiled ACL.
+
+    :param acl_rules: the rules of ``ZNC_ACL``
+    :type acl_rules: list of tuple
+    :rtype: :class:`flask.Flask`
+    """
+    app = Flask(__name__)
+    app.config['ZNC_ACL'] = acl_rules
+    app.extensions['channel_acl'] = ChannelAcl(acl_rules)
+    return app
+
+
+class ChannelAclTest(unittest.TestCase):
+
+    def test_same_as_scan(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            acl_rules = random_acl(rng)
+            acl = ChannelAcl(acl_rules)
+            for email, znc_username, channel in random_checks(rng, 20):
+                with self.subTest(acl_rules=acl_rules, email=email,
+                                  znc_username=znc_username,
+                                  channel=channel):
+                    self.assertIs(
+                        acl.can_read(email, znc_username, channel),
+                        scan_acl(acl_rules, email, znc_username, channel))
+
+    def test_first_rule_wins(self):
+        acl = ChannelAcl([
+            ('deny', WILDCARD, 'alice', 'nickserv'),
+            ('allow', 'bob@example.com', WILDCARD, WILDCARD),
+            ('allow', WILDCARD, 'alice', WILDCARD),
+            ('deny', WILDCARD, WILDCARD, WILDCARD),
+        ])
+        self.assertFalse(acl.can_read('bob@example.com', 'alice', 'nickserv'))
+        self.assertTrue(acl.can_read('bob@example.com', 'bob', '#znc'))
+        self.assertTrue(acl.can_read('carol@example.com', 'alice', '#znc'))
+        self.assertFalse(acl.can_read('carol@example.com', 'bob', '#znc'))
+
+    def test_no_rule_applies(self):
+        acl = ChannelAcl([('allow', 'alice@example.com', 'alice', '#python')])
+        self.assertIsNone(acl.can_read('bob@example.com', 'alice', '#python'))
+        self.assertIsNone(acl.can_read('alice@example.com', 'bob', '#python'))
+
+
+class EmailCanReadChannelLogsTest(unittest.TestCase):
+
+    def test_same_as_scan(self):
+        rng = random.Random(1)
+        for _ in range(300):
+            acl_rules = random_acl(rng)
+            app = make_app(acl_rules)
+            with app.test_request_context():
+                for email, znc_username, channel in random_checks(rng, 20):
+                    expected = scan_acl(acl_rules, email, znc_username,
+                                        channel)
+                    with self.subTest(acl_rules=acl_rules, email=email,
+                                      znc_username=znc_username,
+                                      channel=channel):
+                        # When no rule applies, reading is denied
+                        self.assertIs(
+                            email_can_read_channel_logs(email, znc_username,
+                                                        channel),
+                            bool(expected))
+
+    def test_no_rule_applies(self):
+        # Reading used to be allowed by mistake when no rule applied
+        app = make_app([('allow', 'alice@example.com', 'alice', '#python')])
+        with app.test_request_context():
+            self.assertIs(email_can_read_channel_logs(
+                'bob@example.com', 'alice', '#python'), False)
+            self.assertIs(email_can_read_channel_logs(
+                'alice@example.com', 'alice', '#znc'), False)
+
+    def test_anonymous_user(self):
+        app = make_app([('allow', WILDCARD, 'alice', '#python'),
+                        ('deny', WILDCARD, WILDCARD, WILDCARD)])
+        with app.test_request_context():
+            self.assertIs(email_can_read_channel_logs(
+                None, 'alice', '#python'), True)
+            self.assertIs(email_can_read_channel_logs(
+                '', 'alice', '#znc'), False)
+
+    def test_answers_last_until_end_of_request(self):
+        app = make_app([('allow', WILDCARD, WILDCARD, WILDCARD)])
+        with app.test_request_context():
+            self.assertTrue(email_can_read_channel_logs(
+                'bob@example.com', 'alice', '#python'))
+            app.extensions['channel_acl'] = ChannelAcl(
+                [('deny', WILDCARD, WILDCARD, WILDCARD)])
+            self.assertTrue(email_can_read_channel_logs(
+                'bob@example.com', 'alice', '#python'))
+        with app.test_request_context():
+            self.assertFalse(email_can_read_channel_logs(
+                'bob@example.com', 'alice', '#python'))
+
+    def test_acl_not_set(self):
+        app = Flask(__name__)
+        with app.test_request_context():
+            with self.assertRaises(ValueError):
+                email_can_read_channel_logs('bob@example.com', 'alice',
+                                            '#python')
+
+
+class ReadClauseTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine('sqlite://')
+        metadata = MetaData()
+        cls.channels = Table('channels', metadata,
+                             Column('user', String),
+                             Column('channel', String))
+        metadata.create_all(cls.engine)
+        cls.rows = {(user, channel)
+                    for user in USERS[:-1] + ['carol']
+                    for channel in CHANNELS[:-1] + ['#other']}
+        cls.engine.execute(cls.channels.insert(),
+                           [{'user': user, 'channel': channel}
+                            for user, channel in cls.rows])
+
+    def select_readable(self, clause):
+        query = select([self.channels.c.user, self.channels.c.channel])\
+            .where(clause)
+        return {tuple(row)
+                for row in self.engine.execute(query).fetchall()}
+
+    def test_same_as_can_read(self):
+        rng = random.Random(2)
+        for _ in range(1000):
+            acl_rules = random_acl(rng)
+            acl = ChannelAcl(acl_rules)
+            for email in EMAILS + ['carol@example.com']:
+                clause = acl.read_clause(email, self.channels.c.user,
+                                         self.channels.c.channel)
+                with self.subTest(acl_rules=acl_rules, email=email,
+                                  clause=str(clause)):
+                    self.assertEqual(
+                        self.select_readable(clause),
+                        {(user, channel) for user, channel in self.rows
+                         if acl.can_read(email, user, channel)})
+
+    def test_bind_parameters(self):
+        # The condition grows with the rules that apply, not with the
+        # channels that can be read
+        acl = ChannelAcl(
+            [('allow', WILDCARD, 'alice', '#{0}'.format(i))
+             for i in range(100)] +
+            [('allow', 'alice@example.com', 'bob', '#{0}'.format(i))
+             for i in range(100)] +
+            [('deny', WILDCARD, WILDCARD, WILDCARD)])
+        clause = acl.read_clause('bob@example.com', self.channels.c.user,
+                                 self.channels.c.channel)
+        self.assertEqual(len(clause.compile().params), 200)
+
+        acl = ChannelAcl([('allow', WILDCARD, WILDCARD, WILDCARD)])
+        clause = acl.read_clause('bob@example.com', self.channels.c.user,
+                                 self.channels.c.channel)
+        self.assertEqual(clause.compile().params, {})
+        self.assertEqual(self.select_readable(clause), self.rows)
+
+    def test_readable_channels_clause(self):
+        app = make_app([('allow', 'alice@example.com', 'alice', WILDCARD),
+                        ('allow', WILDCARD, 'bob', '#python'),
+                        ('deny', WILDCARD, WILDCARD, WILDCARD)])
+        with app.test_request_context():
+            self.assertEqual(
+                self.select_readable(readable_channels_clause(
+                    'alice@example.com', self.channels.c.user,
+                    self.channels.c.channel)),
+                {(user, channel) for user, channel in self.rows
+                 if user == 'alice'} | {('bob', '#python')})
+            self.assertEqual(
+                self.select_readable(readable_channels_clause(
+                    None, self.channels.c.user, self.channels.c.channel)),
+                {('bob', '#python')})
+
+
+if __name__ == '__main__':
+    unittest.main()
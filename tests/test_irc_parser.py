@@ -0,0 +1,139 @@
+"""
+Golden tests for :mod:`irclogviewer.logs.irc_parser`.
+
+``data/irc_lines.log`` holds one example of every kind of line the parser
+tells apart, and ``data/irc_lines.jsonl`` holds what the parser made of
+each line before it was rewritten to make a single pass over control
+codes. Each JSON object is an :class:`~irclogviewer.logs.irc_parser.IrcLine`
+whose fragments' states are written out as
+``[fg_color, bg_color, is_bold, has_underline]``.
+
+:func:`~irclogviewer.logs.irc_parser.parse_irc_log` has to parse the whole
+file into the same lines.
+"""
+import json
+import mmap
+import os
+import unittest
+
+from irclogviewer.logs.irc_parser import parse_irc_line, parse_irc_log
+
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def read_golden_lines():
+    """Read the example log lines and what they should be parsed into.
+
+    :return: each raw line, without its newline, and its parsed line
+    :rtype: list of tuple of (str, dict)
+    """
+    with open(os.path.join(DATA_DIRECTORY, 'irc_lines.log'),
+              encoding='utf-8', newline='\n') as f:
+        raw_lines = f.read().split('\n')[:-1]
+    with open(os.path.join(DATA_DIRECTORY, 'irc_lines.jsonl'),
+              encoding='utf-8') as f:
+        parsed_lines = [json.loads(line) for line in f]
+    return list(zip(raw_lines, parsed_lines))
+
+
+def read_golden_log():
+    """Read the example log and what it should be parsed into.
+
+    :return: the log and its parsed lines
+    :rtype: tuple of (str, list of dict)
+    """
+    golden_lines = read_golden_lines()
+    text = ''.join(raw_line + '\n' for raw_line, _ in golden_lines)
+    return text, [parsed_line for _, parsed_line in golden_lines]
+
+
+def irc_line_to_json(irc_line):
+    """Convert a parsed line into the form that the golden file uses.
+
+    :param irc_line: a parsed line
+    :type irc_line: :class:`~irclogviewer.logs.irc_parser.IrcLine`
+    :rtype: dict
+    """
+    return {
+        'timestamp': irc_line.timestamp,
+        'nick': irc_line.nick,
+        'type': irc_line.type,
+        'message_fragments': [[list(fragment.state), fragment.text]
+                              for fragment in irc_line.message_fragments],
+    }
+
+
+class ParseIrcLineTest(unittest.TestCase):
+
+    def test_golden_lines(self):
+        golden_lines = read_golden_lines()
+        self.assertEqual(len(golden_lines), 40)
+        for raw_line, expected in golden_lines:
+            with self.subTest(raw_line=raw_line):
+                self.assertEqual(irc_line_to_json(parse_irc_line(raw_line)),
+                                 expected)
+
+    def test_line_ending(self):
+        for raw_line, expected in read_golden_lines():
+            with self.subTest(raw_line=raw_line):
+                self.assertEqual(
+                    irc_line_to_json(parse_irc_line(raw_line + '\r\n')),
+                    expected)
+
+    def test_states_are_shared(self):
+        first = parse_irc_line('[00:00:00] <a> \x02bold\x02 plain')
+        second = parse_irc_line('[00:00:01] <b> \x02more\x02 text')
+        for first_fragment, second_fragment in zip(
+                first.message_fragments, second.message_fragments):
+            self.assertIs(first_fragment.state, second_fragment.state)
+
+
+class ParseIrcLogTest(unittest.TestCase):
+
+    def assertParsedInto(self, buffer, expected):
+        self.assertEqual([irc_line_to_json(irc_line)
+                          for irc_line in parse_irc_log(buffer)],
+                         expected)
+
+    def test_golden_log(self):
+        text, expected = read_golden_log()
+        self.assertParsedInto(text, expected)
+
+    def test_bytes(self):
+        text, expected = read_golden_log()
+        self.assertParsedInto(text.encode('utf-8'), expected)
+
+    def test_mmap(self):
+        _, expected = read_golden_log()
+        with open(os.path.join(DATA_DIRECTORY, 'irc_lines.log'), 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self.assertParsedInto(data, expected)
+
+    def test_no_newline_at_end(self):
+        text, expected = read_golden_log()
+        self.assertParsedInto(text[:-1], expected)
+
+    def test_line_endings(self):
+        text, expected = read_golden_log()
+        self.assertParsedInto(text.replace('\n', '\r\n'), expected)
+
+    def test_empty_log(self):
+        self.assertParsedInto('', [])
+        self.assertParsedInto(b'', [])
+
+    def test_undecodable_bytes(self):
+        self.assertParsedInto(
+            b'[00:00:00] <alice> caf\xc3\xa9 \xff\xfeok\n',
+            [irc_line_to_json(
+                parse_irc_line('[00:00:00] <alice> caf\xe9 ok'))])
+
+    def test_same_as_each_line(self):
+        text, _ = read_golden_log()
+        self.assertEqual(list(parse_irc_log(text)),
+                         [parse_irc_line(raw_line)
+                          for raw_line in text.split('\n')[:-1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+Tests for the sidecar indexes of :mod:`irclogviewer.logs.line_index`.
+"""
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from irclogviewer.logs.line_index import (
+    get_line_index,
+    read_text,
+    sidecar_path,
+)
+
+
+class GetLineIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.index_directory = os.path.join(self.directory, 'line_indexes')
+        self.log_path = os.path.join(self.directory, '#python_20141104.log')
+
+    def write_log(self, text, mode='w'):
+        with open(self.log_path, mode) as f:
+            f.write(text)
+
+    def replace_log(self, text):
+        """Replace the log with a new file, the way an editor or ``mv``
+        would."""
+        temp_path = self.log_path + '.new'
+        with open(temp_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, self.log_path)
+
+    def read_lines(self):
+        index = get_line_index(self.log_path, self.index_directory)
+        return [read_text(self.log_path, index, line, line + 1)
+                for line in range(index.line_count)]
+
+    def test_appended(self):
+        self.write_log('one\ntwo\n')
+        self.assertEqual(self.read_lines(), ['one\n', 'two\n'])
+        self.write_log('three\nfour', 'a')
+        self.assertEqual(self.read_lines(),
+                         ['one\n', 'two\n', 'three\n', 'four'])
+
+    def test_rewritten_at_same_size(self):
+        self.write_log('one\ntwo\n')
+        self.assertEqual(self.read_lines(), ['one\n', 'two\n'])
+        self.write_log('ab\ncd\ne\n')
+        # The modification time may not have changed on file systems with
+        # coarse timestamps
+        os.utime(self.log_path, ns=(0, 0))
+        self.assertEqual(self.read_lines(), ['ab\n', 'cd\n', 'e\n'])
+
+    def test_rewritten_larger(self):
+        self.write_log('one\ntwo\n')
+        self.assertEqual(self.read_lines(), ['one\n', 'two\n'])
+        self.write_log('a\nbcdefg\nthree\n')
+        self.assertEqual(self.read_lines(), ['a\n', 'bcdefg\n', 'three\n'])
+
+    def test_replaced_larger(self):
+        self.write_log('one\ntwo\n')
+        self.assertEqual(self.read_lines(), ['one\n', 'two\n'])
+        self.replace_log('a\nbcdefg\nthree\n')
+        self.assertEqual(self.read_lines(), ['a\n', 'bcdefg\n', 'three\n'])
+
+    def test_old_sidecar_format(self):
+        self.write_log('one\ntwo\n')
+        sidecar = sidecar_path(self.index_directory, self.log_path)
+        os.makedirs(self.index_directory)
+        # A header of just the size, which covered offsets 0 and 2
+        with open(sidecar, 'wb') as f:
+            f.write(struct.pack('<QQQ', 2, 0, 2))
+        self.assertEqual(self.read_lines(), ['one\n', 'two\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+Tests for following today's log from its page in
+:mod:`irclogviewer.logs`.
+"""
+import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from irclogviewer import create_app, db
+from irclogviewer.crawler import crawl
+from irclogviewer.models import create_missing_indexes, create_search_index
+from irclogviewer.znc import ZncDirectory
+
+
+CONFIG = """
+SECRET_KEY = 'test'
+GOOGLE_CONSUMER_KEY = 'test'
+GOOGLE_CONSUMER_SECRET = 'test'
+SQLALCHEMY_DATABASE_URI = {database_uri!r}
+ZNC_DIRECTORY = {znc_directory!r}
+ZNC_ACL = [('allow', '*', '*', '*')]
+"""
+
+SINCE_URL_REGEX = re.compile(r'data-since-url="([^"]*)"')
+
+
+class LiveTailTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.znc_directory = os.path.join(self.directory, 'znc')
+        log_directory = os.path.join(self.znc_directory, 'users', 'alice',
+                                     'moddata', 'log')
+        os.makedirs(log_directory)
+        self.today = datetime.date.today()
+        self.log_path = os.path.join(
+            log_directory, '#python_{0:%Y%m%d}.log'.format(self.today))
+        self.log_url = '/logs/users/alice/channels/%23python/{0}'.format(
+            self.today.isoformat())
+
+        config_path = os.path.join(self.directory, 'config.py')
+        with open(config_path, 'w') as f:
+            f.write(CONFIG.format(
+                database_uri='sqlite:///' + os.path.join(self.directory,
+                                                         'irc_logs.db'),
+                znc_directory=self.znc_directory,
+            ))
+        old_settings = os.environ.get('FLASK_SETTINGS')
+        os.environ['FLASK_SETTINGS'] = config_path
+        try:
+            self.app = create_app()
+        finally:
+            if old_settings is None:
+                del os.environ['FLASK_SETTINGS']
+            else:
+                os.environ['FLASK_SETTINGS'] = old_settings
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+
+    def write_log(self, text, mode='w'):
+        with open(self.log_path, mode) as f:
+            f.write(text)
+
+    def crawl(self):
+        with self.app.app_context():
+            db.create_all()
+            create_missing_indexes(db.engine)
+            create_search_index(db.engine)
+            crawl(ZncDirectory(self.znc_directory))
+
+    def get_since_url(self):
+        response = self.client.get(self.log_url)
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text=True)
+        match = SINCE_URL_REGEX.search(page)
+        self.assertIsNotNone(match)
+        return page, match.group(1)
+
+    def get_lines_since(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.get_data(as_text=True))
+
+    def test_unfinished_last_line(self):
+        whole_lines = '[00:00:01] <carol> hello\n'
+        self.write_log(whole_lines + '[00:00:02] <carol> partial li')
+        self.crawl()
+
+        page, since_url = self.get_since_url()
+        self.assertNotIn('partial li', page)
+        self.assertTrue(since_url.endswith(
+            '/since/{0}'.format(len(whole_lines))))
+
+        self.write_log('ne\n[00:00:03] <carol> next\n', 'a')
+        result = self.get_lines_since(since_url)
+        self.assertEqual(
+            [''.join(fragment['text']
+                     for fragment in line['message_fragments'])
+             for line in result['lines']],
+            ['partial line', 'next'])
+        self.assertEqual(result['offset'], os.path.getsize(self.log_path))
+        self.assertFalse(result['truncated'])
+
+    def test_offset_in_middle_of_line(self):
+        first_line = '[00:00:01] <carol> hello\n'
+        self.write_log(first_line + '[00:00:02] <carol> world\n')
+        self.crawl()
+
+        _, since_url = self.get_since_url()
+        since_url = since_url.rsplit('/', 1)[0] + '/5'
+        result = self.get_lines_since(since_url)
+        self.assertEqual([line['timestamp'] for line in result['lines']],
+                         ['00:00:02'])
+        self.assertEqual(result['offset'], os.path.getsize(self.log_path))
+        self.assertFalse(result['truncated'])
+
+    def test_truncated_log(self):
+        self.write_log('[00:00:01] <carol> hello\n'
+                       '[00:00:02] <carol> world\n')
+        self.crawl()
+
+        _, since_url = self.get_since_url()
+        self.write_log('[00:00:03] <dave> hi\n')
+        result = self.get_lines_since(since_url)
+        self.assertEqual([line['timestamp'] for line in result['lines']],
+                         ['00:00:03'])
+        self.assertEqual(result['offset'], os.path.getsize(self.log_path))
+        self.assertTrue(result['truncated'])
+
+
+if __name__ == '__main__':
+    unittest.main()
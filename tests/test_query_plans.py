@@ -0,0 +1,211 @@
+"""
+Query plan regression tests for the pages of :mod:`irclogviewer.logs`.
+
+A few logs are crawled into a temporary SQLite database, every page is
+requested, and each query that it makes is run again with ``EXPLAIN QUERY
+PLAN``. None of them may read a whole table instead of using an index.
+"""
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import event
+
+from irclogviewer import create_app, db
+from irclogviewer.crawler import crawl
+from irclogviewer.models import create_missing_indexes, create_search_index
+from irclogviewer.znc import ZncDirectory
+
+
+CONFIG = """
+SECRET_KEY = 'test'
+GOOGLE_CONSUMER_KEY = 'test'
+GOOGLE_CONSUMER_SECRET = 'test'
+SQLALCHEMY_DATABASE_URI = {database_uri!r}
+ZNC_DIRECTORY = {znc_directory!r}
+LINE_INDEX_DIRECTORY = {line_index_directory!r}
+ZNC_ACL = [
+    ('deny', '*', 'alice', 'nickserv'),
+    ('allow', 'alice@example.com', '*', '*'),
+    ('allow', '*', 'alice', '*'),
+    ('deny', '*', '*', '*'),
+]
+"""
+
+LOG = """\
+[00:00:01] <carol> hello world
+[00:00:02] * carol waves
+[00:00:03] *** Joins: dave (~dave@example.com)
+"""
+
+# Matches a step of a query plan that reads every row of a table or of one
+# of its indexes. SQLite describes an aggregate over a whole table as a
+# "SEARCH" without an index.
+FULL_SCAN_REGEX = re.compile(r"""
+    ^(?:
+        SCAN[ ](?:TABLE[ ])?(?P<scanned_table>\w+)
+            (?:[ ]USING[ ](?:COVERING[ ])?INDEX[ ]\w+)?
+        |SEARCH[ ](?:TABLE[ ])?(?P<searched_table>\w+)
+    )$
+""", re.VERBOSE)
+
+# The tables that pages read all of on purpose. These have one row per
+# channel, or per channel and month, so that the pages don't have to read
+# irclogs.
+ALLOWED_FULL_SCANS = {
+    '/logs/calendar': {'log_months'},
+    # It finds the users with channels in the index on (user, latest_date)
+    '/logs/channels': {'channel_summary'},
+}
+
+
+class QueryPlanTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        znc_directory = os.path.join(cls.directory, 'znc')
+        for user in ['alice', 'bob']:
+            log_directory = os.path.join(znc_directory, 'users', user,
+                                         'moddata', 'log')
+            os.makedirs(log_directory)
+            for channel in ['#python', '#znc', 'nickserv']:
+                for day in [3, 4, 5]:
+                    log_path = os.path.join(
+                        log_directory,
+                        '{0}_201411{1:02d}.log'.format(channel, day))
+                    with open(log_path, 'w') as f:
+                        f.write(LOG)
+
+        config_path = os.path.join(cls.directory, 'config.py')
+        with open(config_path, 'w') as f:
+            f.write(CONFIG.format(
+                database_uri='sqlite:///' + os.path.join(cls.directory,
+                                                         'irc_logs.db'),
+                znc_directory=znc_directory,
+                line_index_directory=os.path.join(cls.directory,
+                                                  'line_indexes'),
+            ))
+        old_settings = os.environ.get('FLASK_SETTINGS')
+        os.environ['FLASK_SETTINGS'] = config_path
+        try:
+            cls.app = create_app()
+        finally:
+            if old_settings is None:
+                del os.environ['FLASK_SETTINGS']
+            else:
+                os.environ['FLASK_SETTINGS'] = old_settings
+
+        with cls.app.app_context():
+            db.create_all()
+            create_missing_indexes(db.engine)
+            create_search_index(db.engine)
+            crawl(ZncDirectory(znc_directory))
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(cls.directory)
+
+    def get_queries(self, url, email):
+        """Request a page and record the queries that it makes.
+
+        :param str url: the page's URL
+        :param email: the e-mail address of the web user, or None for an
+            anonymous user
+        :type email: str or None
+        :return: the SQL and parameters of each query
+        :rtype: list of tuple
+        """
+        queries = []
+
+        def record_query(connection, cursor, statement, parameters, context,
+                         executemany):
+            queries.append((statement, parameters))
+
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            if email:
+                session['user'] = {'email': email}
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record_query)
+            try:
+                response = client.get(url)
+                response.get_data()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute',
+                             record_query)
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def get_full_scans(self, queries):
+        """Find the tables that queries read every row of.
+
+        :param queries: the SQL and parameters of each query
+        :type queries: list of tuple
+        :return: the names of the tables
+        :rtype: set of str
+        """
+        full_scans = set()
+        with self.app.app_context():
+            connection = db.engine.raw_connection()
+            try:
+                for statement, parameters in queries:
+                    cursor = connection.cursor()
+                    cursor.execute('EXPLAIN QUERY PLAN ' + statement,
+                                   parameters)
+                    for row in cursor.fetchall():
+                        match = FULL_SCAN_REGEX.match(row[-1])
+                        if match:
+                            full_scans.add(match.group('scanned_table') or
+                                           match.group('searched_table'))
+            finally:
+                connection.close()
+        # Leave out subqueries, which are scanned once they're materialized
+        return full_scans & set(db.metadata.tables)
+
+    def assertUsesIndexes(self, url):
+        for email in [None, 'alice@example.com']:
+            with self.subTest(url=url, email=email):
+                queries = self.get_queries(url, email)
+                self.assertTrue(queries)
+                self.assertEqual(
+                    self.get_full_scans(queries),
+                    ALLOWED_FULL_SCANS.get(url, set()))
+
+    def test_calendar(self):
+        self.assertUsesIndexes('/logs/calendar')
+
+    def test_channels(self):
+        self.assertUsesIndexes('/logs/channels')
+        self.assertUsesIndexes('/logs/channels?date=2014-11-04')
+
+    def test_log(self):
+        self.assertUsesIndexes(
+            '/logs/users/alice/channels/%23python/2014-11-04')
+        self.assertUsesIndexes(
+            '/logs/users/alice/channels/%23python/2014-11-04/since/0')
+
+    def test_channel_stats(self):
+        self.assertUsesIndexes('/logs/users/alice/channels/%23python/stats')
+
+    def test_search(self):
+        self.assertUsesIndexes('/logs/search?q=hello')
+        self.assertUsesIndexes('/logs/search?nick=carol')
+        self.assertUsesIndexes('/logs/search?q=hello&user=alice'
+                               '&channel=%23python')
+        self.assertUsesIndexes('/logs/search?q=hello&from=2014-11-04'
+                               '&to=2014-11-05')
+        self.assertUsesIndexes('/logs/search?nick=carol&from=2014-11-04')
+
+    def test_regex_search(self):
+        self.assertUsesIndexes('/logs/search?regex=hel&from=2014-11-04')
+        self.assertUsesIndexes('/logs/search?regex=hel&user=alice'
+                               '&channel=%23python')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Tests for the inotify-driven watch mode of :mod:`irclogviewer.crawler`.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from irclogviewer import create_app, db, inotify
+from irclogviewer.crawler import watch
+from irclogviewer.models import create_search_index, IrcLog
+from irclogviewer.znc import ZncDirectory
+
+
+CONFIG = """
+SECRET_KEY = 'test'
+SQLALCHEMY_DATABASE_URI = {database_uri!r}
+"""
+
+LOG = '[00:00:01] <carol> hello world\n'
+
+# How long to wait for the watcher to index a log
+TIMEOUT_SECONDS = 10
+
+
+class WatchTest(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            inotify.Inotify().close()
+        except OSError as e:
+            self.skipTest(str(e))
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.znc_directory = os.path.join(self.directory, 'znc')
+        self.users_path = os.path.join(self.znc_directory, 'users')
+        self.write_log('alice', '#python_20141104.log')
+        # Bob's log directory doesn't exist yet
+        os.makedirs(os.path.join(self.users_path, 'bob'))
+
+        config_path = os.path.join(self.directory, 'config.py')
+        with open(config_path, 'w') as f:
+            f.write(CONFIG.format(
+                database_uri='sqlite:///' + os.path.join(self.directory,
+                                                         'irc_logs.db'),
+            ))
+        old_settings = os.environ.get('FLASK_SETTINGS')
+        os.environ['FLASK_SETTINGS'] = config_path
+        try:
+            self.app = create_app()
+        finally:
+            if old_settings is None:
+                del os.environ['FLASK_SETTINGS']
+            else:
+                os.environ['FLASK_SETTINGS'] = old_settings
+        with self.app.app_context():
+            db.create_all()
+            create_search_index(db.engine)
+
+        # watch() never returns, so it is left running in the background
+        thread = threading.Thread(target=self.watch, daemon=True)
+        thread.start()
+        self.wait_for_log('alice', '#python')
+
+    def watch(self):
+        with self.app.app_context():
+            watch(ZncDirectory(self.znc_directory), 0.05)
+
+    def write_log(self, user, filename):
+        log_directory = os.path.join(self.users_path, user, 'moddata', 'log')
+        os.makedirs(log_directory, exist_ok=True)
+        with open(os.path.join(log_directory, filename), 'w') as f:
+            f.write(LOG)
+
+    def wait_for_log(self, user, channel):
+        deadline = time.monotonic() + TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            with self.app.app_context():
+                log = db.session.query(IrcLog)\
+                                .filter(IrcLog.user == user,
+                                        IrcLog.channel == channel)\
+                                .first()
+            if log is not None:
+                return
+            time.sleep(0.05)
+        self.fail('{0} of {1} was never crawled'.format(channel, user))
+
+    def test_log_directory_created_later(self):
+        os.makedirs(os.path.join(self.users_path, 'bob', 'moddata'))
+        time.sleep(0.2)
+        self.write_log('bob', '#znc_20141104.log')
+        self.wait_for_log('bob', '#znc')
+
+    def test_user_added_later(self):
+        os.makedirs(os.path.join(self.users_path, 'carol'))
+        time.sleep(0.2)
+        self.write_log('carol', '#znc_20141104.log')
+        self.wait_for_log('carol', '#znc')
+
+
+if __name__ == '__main__':
+    unittest.main()